@@ -0,0 +1,87 @@
+# benchmarks/bench_artifact.py
+"""
+Cold start of a scoring process: model artifact directory (src/models/artifact.py) against the pickle bundle
+serving.save_bundle writes, for a logistic regression and an xgboost booster.
+
+    python -m benchmarks.bench_artifact --rows 200000
+
+Each load runs in a fresh interpreter and reports wall time from interpreter start to first prediction,
+artifact size and which of mlflow / matplotlib / seaborn / torch / sklearn / xgboost ended up imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import xgboost as xgb
+from sklearn.linear_model import LogisticRegression
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models.artifact import save_artifact, load_artifact
+from src.pipeline.serving import save_bundle, load_bundle, predict_scores
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ['mlflow', 'matplotlib', 'seaborn', 'torch', 'sklearn', 'xgboost']
+
+COLD_LOAD = '''
+import time, sys, json
+start = time.perf_counter()
+from {module} import {loader} as load
+bundle = load({path!r})
+import_and_load_s = time.perf_counter() - start
+from src.pipeline.serving import make_scorer
+make_scorer(bundle)([{{'crash_time' : '8:15', 'borough' : 'QUEENS', 'vehicle_type_code1' : 'Sedan', 'contributing_factor_vehicle_1' : 'Unspecified'}}])
+print(json.dumps({{'load_s' : import_and_load_s, 'first_prediction_s' : time.perf_counter() - start,
+                  'heavy' : [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+def cold_load(module, loader, path, repeats=3):
+    runs = []
+    script = COLD_LOAD.format(module=module, loader=loader, path=path, heavy=HEAVY_MODULES)
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', script],
+                             capture_output=True, text=True, cwd=ROOT_DIR, env=dict(os.environ, PYTHONPATH=ROOT_DIR), check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['first_prediction_s'])
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    data = make_crashes(args.rows)
+    builder = CrashFeatureBuilder().fit(data)
+    X = builder.transform(data)
+    y = consolidate_response(data)['Y'].to_numpy()
+    columns = X.columns
+    models = {
+        'logistic' : LogisticRegression(max_iter=500).fit(X.to_numpy(), y),
+        'xgboost' : xgb.train({'max_depth' : 5, 'eta' : 0.3, 'objective' : 'binary:logistic', 'verbosity' : 0}, xgb.DMatrix(X.to_numpy(), label=y), 100)
+    }
+
+    print(f"{'model':>10}{'format':>10}{'bytes':>10}{'load s':>9}{'1st pred s':>12}  same scores  heavy imports")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, model in models.items():
+            artifact_dir = save_artifact(os.path.join(tmp, f'{name}-artifact'), builder, columns, model)
+            pickle_path = save_bundle(os.path.join(tmp, f'{name}.pkl'), builder, columns, model)
+            expected = predict_scores(model, X.to_numpy()[:10000])
+            for label, module, loader, path in (('artifact', 'src.models.artifact', 'load_artifact', artifact_dir),
+                                                ('pickle', 'src.pipeline.serving', 'load_bundle', pickle_path)):
+                bundle = load_artifact(path) if label == 'artifact' else load_bundle(path)
+                same = np.allclose(predict_scores(bundle['model'], X.to_numpy()[:10000]), expected, rtol=0, atol=1e-6)
+                result = cold_load(module, loader, path)
+                print(f"{name:>10}{label:>10}{size_of(path):>10}{result['load_s']:>9.2f}{result['first_prediction_s']:>12.2f}  {str(same):>11}  {', '.join(result['heavy'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_cv.py
+"""
+XGBoost grid cross validation: a fresh split and fresh DMatrix objects per grid point (the old cross_validate)
+against one CVEngine whose folds and QuantileDMatrix objects are built once and reused by the whole grid.
+
+    python -m benchmarks.bench_cv --rows 200000 1000000
+"""
+import argparse
+import time
+from itertools import product
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models import xgboost_model
+
+def legacy_cross_validate(params, X, y, k=5):
+    """Per grid point split and DMatrix construction, as cross_validate did before CVEngine."""
+    skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=42)
+    aucs = []
+    for train_idx, val_idx in skf.split(X, y):
+        model = xgb.train(params, xgb.DMatrix(X[train_idx], label=y[train_idx]), num_boost_round=100)
+        aucs.append(roc_auc_score(y[val_idx], model.predict(xgb.DMatrix(X[val_idx]))))
+    return np.mean(aucs)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[200000, 1000000])
+    args = parser.parse_args()
+
+    keys, values = zip(*xgboost_model.PARAM_GRID.items())
+    param_list = [dict(zip(keys, v)) for v in product(*values)]
+
+    print(f"{'rows':>10}{'grid':>6}{'legacy':>10}{'engine':>10}{'speedup':>9}  same auc")
+    for n in args.rows:
+        data = make_crashes(n)
+        X = CrashFeatureBuilder().fit_transform(data).to_numpy()
+        y = consolidate_response(data)['Y'].to_numpy()
+        del data
+
+        start = time.perf_counter()
+        legacy = [legacy_cross_validate(params, X, y) for params in param_list]
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine = xgboost_model.make_engine(X, y, k=5)
+        shared = [xgboost_model.cross_validate(params, X, y, engine=engine)[0]['roc_auc'] for params in param_list]
+        engine_s = time.perf_counter() - start
+
+        same = np.allclose(legacy, shared, rtol=0, atol=1e-12)
+        print(f"{n:>10}{len(param_list):>6}{legacy_s:>10.2f}{engine_s:>10.2f}{legacy_s / engine_s:>8.2f}x  {same}")
+        del X, y, engine
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_feature_store.py
+"""
+Switching feature presets: rebuilding every feature and copying the selection (build_features +
+select_features on the in-memory DataFrame, what every preset experiment used to pay) against projecting
+the preset's columns out of the memory mapped feature store written once.
+
+    python -m benchmarks.bench_feature_store --rows 1000000
+
+Reports the one off store write, then per preset the time to a DataFrame and to a model ready array.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.features.feature_selector import add_presets, feature_config, select_features
+from src.features.feature_store import FeatureTable, write_feature_table
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    data = consolidate_response(make_crashes(args.rows))
+    builder = CrashFeatureBuilder(top_k=args.top_k)
+    names = builder.fit(data).feature_names_
+    if 'bench-boroughs' not in feature_config['nyc-crashes']:
+        add_presets('nyc-crashes', {
+            'bench-boroughs' : [name for name in names if name.startswith('borough_')],
+            'bench-half' : names[::2],
+        })
+    presets = ['preset-1', 'bench-boroughs', 'bench-half', 'all']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'features.arrow')
+        start = time.perf_counter()
+        write_feature_table(path, builder.transform(data), builder_state=builder.get_state())
+        write_s = time.perf_counter() - start
+        print(f"{args.rows} rows x {len(names)} features, store written once in {write_s:.2f}s ({os.path.getsize(path) / 2**20:.0f} MB)")
+        print(f"{'preset':<16}{'columns':>8}{'rebuild s':>11}{'store frame ms':>16}{'store array ms':>16}")
+        for preset in presets:
+            start = time.perf_counter()
+            X = select_features(builder.build_features(data), 'nyc-crashes', preset)
+            rebuild_s = time.perf_counter() - start
+            del X
+
+            start = time.perf_counter()
+            X = select_features(FeatureTable.open(path), 'nyc-crashes', preset).to_frame()
+            frame_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            X = select_features(FeatureTable.open(path), 'nyc-crashes', preset).to_numpy()
+            array_ms = (time.perf_counter() - start) * 1000
+            print(f"{preset:<16}{X.shape[1]:>8}{rebuild_s:>11.2f}{frame_ms:>16.1f}{array_ms:>16.1f}")
+            del X
+
+if __name__ == '__main__':
+    main()
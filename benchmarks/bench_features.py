@@ -0,0 +1,70 @@
+# benchmarks/bench_features.py
+"""
+CrashFeatureBuilder: the old per-row .apply build_features against the fit/transform split.
+
+    python -m benchmarks.bench_features --rows 1000000 10000000
+
+Columns are handed over as object strings (what the old untyped csv load produced) and, for the new path,
+also as the categoricals load_crash_data now returns. --skip-legacy avoids the slow path at large sizes.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import OneHotEncoder
+
+from benchmarks.synthetic import make_crashes
+from src.features.build_features import CrashFeatureBuilder
+
+def legacy_build_features(data):
+    """The pre fit/transform implementation, kept verbatim for comparison."""
+    encoder = OneHotEncoder(drop='first', sparse_output=False)
+    copy = data.copy()
+    copy = copy[['crash_time', 'borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1']].copy()
+    crash_time_parsed = pd.to_datetime(copy['crash_time'], format='%H:%M', errors='coerce')
+    hour_of_day = crash_time_parsed.dt.hour.fillna(0).astype(int)
+    copy['borough'] = copy['borough'].fillna('Unspecified')
+    top_vehicles = copy['vehicle_type_code1'].value_counts().nlargest(10).index
+    top_factors = copy['contributing_factor_vehicle_1'].value_counts().nlargest(10).index
+    copy['vehicle_type_code1'] = copy['vehicle_type_code1'].apply(lambda x: x if x in top_vehicles else 'Other')
+    copy['contributing_factor_vehicle_1'] = copy['contributing_factor_vehicle_1'].apply(lambda x: x if x in top_factors else 'Other')
+    peak_hour = hour_of_day.value_counts().idxmax()
+    copy['time_from_peak_hour'] = hour_of_day - peak_hour
+    cat_cols = ['borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1']
+    encoded = encoder.fit_transform(copy[cat_cols])
+    encoded_df = pd.DataFrame(encoded, columns=encoder.get_feature_names_out(cat_cols), index=copy.index)
+    return pd.concat([copy[['time_from_peak_hour']], encoded_df], axis=1)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'input':>13}{'legacy':>10}{'fit':>8}{'transform':>11}{'speedup':>9}  match")
+    for n in args.rows:
+        typed = make_crashes(n)[CrashFeatureBuilder.REQUIRED_COLUMNS]
+        strings = typed.astype(object)
+        legacy_s = float('nan')
+        for label, data in (('object', strings), ('categorical', typed)):
+            builder, fit_s = timed(CrashFeatureBuilder().fit, data)
+            X, transform_s = timed(builder.transform, data)
+
+            match = ''
+            if label == 'object' and not args.skip_legacy:
+                X_legacy, legacy_s = timed(legacy_build_features, data)
+                match = list(X_legacy.columns) == list(X.columns) and np.array_equal(X_legacy.to_numpy(), X.to_numpy())
+                del X_legacy
+            speedup = legacy_s / (fit_s + transform_s) # both inputs compared against legacy on object strings
+            print(f"{n:>10}{label:>13}{legacy_s:>10.2f}{fit_s:>8.2f}{transform_s:>11.2f}{speedup:>8.1f}x  {match}")
+            del X
+        del typed, strings
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_imports.py
+"""
+Import cost of the src entry points, from `python -X importtime` in a fresh interpreter per target.
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --targets src.data.loaders --top 15
+
+Reports total import time, peak RSS, module count and the slowest imports. Exits with status 1 when a
+target under src.data ends up importing one of ML_LIBS, data fetching scripts must stay light.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ML_LIBS = ['mlflow', 'xgboost', 'sklearn', 'matplotlib', 'seaborn', 'torch', 'scipy']
+DATA_ONLY = ['src.data'] # targets under these must not import ML_LIBS
+DEFAULT_TARGETS = ['src', 'src.data', 'src.data.loaders', 'src.data.sync', 'src.features.preprocessing', 'src.models.artifact', 'src.models.xgboost_model']
+
+PROBE = '''
+import resource, sys, json
+import {target}
+print(json.dumps({{'rss_mb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+'''
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) for every line -X importtime wrote, depth 0 being a top level import."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def measure(target):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(target=target)], capture_output=True, text=True,
+                         cwd=ROOT_DIR, env=dict(os.environ, PYTHONPATH=ROOT_DIR, MLFLOW_DISABLE_AGENT_HINT='1'), check=True)
+    rows = parse_importtime(out.stderr)
+    modules = {name for name, _, _, _ in rows}
+    return {
+        'target' : target,
+        'total_ms' : sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000,
+        'rss_mb' : json.loads(out.stdout.strip().splitlines()[-1])['rss_mb'],
+        'modules' : len(modules),
+        'ml_libs' : sorted(lib for lib in ML_LIBS if lib in modules),
+        'slowest' : sorted(((cumulative, name) for name, _, cumulative, depth in rows if depth == 1), reverse=True) # what the target pulled in
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--targets', nargs='+', default=DEFAULT_TARGETS)
+    parser.add_argument('--top', type=int, default=3, help="slowest direct imports listed per target")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'target':<28}{'ms':>8}{'rss mb':>8}{'modules':>9}  ml libs")
+    for target in args.targets:
+        result = measure(target)
+        print(f"{target:<28}{result['total_ms']:>8.0f}{result['rss_mb']:>8.0f}{result['modules']:>9}  {', '.join(result['ml_libs']) or '-'}")
+        for cumulative, name in result['slowest'][:args.top]:
+            print(f"{'':<4}{name:<40}{cumulative / 1000:>8.0f} ms")
+        if result['ml_libs'] and any(target == prefix or target.startswith(prefix + '.') for prefix in DATA_ONLY):
+            failures.append(f"{target} imports {', '.join(result['ml_libs'])}")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_join.py
+"""
+Attaching per collision people and vehicle aggregates to nyc-crashes: merging the three tables with pandas
+and grouping the people x vehicles product, loading the whole people and vehicle tables for a pandas groupby,
+and the streaming CollisionAggregates (src/data/joins.py).
+
+    python -m benchmarks.bench_join --rows 1000000 --chunksize 500000
+
+Every method runs in a fresh subprocess. Memory is the anonymous RSS (sampled every 5 ms for the peak), pages
+of the memory mapped inputs don't count. groupby and stream compute every aggregate and must agree, merge only
+counts people and vehicles.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+METHODS = ['merge', 'groupby', 'stream']
+
+def anon_rss_mb():
+    with open('/proc/self/status') as f: # Linux only
+        return next(int(line.split()[1]) for line in f if line.startswith('RssAnon:')) / 2**10
+
+class PeakSampler(threading.Thread):
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = anon_rss_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, anon_rss_mb())
+
+def checksums(df, columns):
+    return {col : round(float(df[col].sum()), 3) for col in columns}
+
+def groupby_aggregates(crashes, people, vehicles):
+    from src.data.joins import JOIN_FEATURES, MAX_AGE, PEOPLE_FLAGS, VEHICLE_GROUPS, label_mask
+    people = people.assign(**{name : label_mask(people[col], labels) for name, (col, labels) in PEOPLE_FLAGS.items()})
+    people['person_age'] = people['person_age'].where(people['person_age'].between(0, MAX_AGE))
+    people_agg = people.groupby('collision_id').agg(
+        people_count=('unique_id', 'size'),
+        **{name : (name, 'sum') for name in PEOPLE_FLAGS},
+        people_age_mean=('person_age', 'mean'), people_age_min=('person_age', 'min'), people_age_max=('person_age', 'max'))
+    vehicles = vehicles.assign(**{name : label_mask(vehicles['vehicle_type'], labels) for name, labels in VEHICLE_GROUPS.items()})
+    vehicle_agg = vehicles.groupby('collision_id').agg(vehicles_count=('unique_id', 'size'), **{name : (name, 'sum') for name in VEHICLE_GROUPS})
+    joined = crashes.merge(people_agg, on='collision_id', how='left').merge(vehicle_agg, on='collision_id', how='left')
+    return joined, JOIN_FEATURES
+
+def measure(method, directory, chunksize):
+    import pandas as pd
+    from src.data.joins import JOIN_FEATURES, PEOPLE_DTYPES, VEHICLE_DTYPES, CollisionAggregates
+
+    paths = {name : os.path.join(directory, f'{name}.feather') for name in ('nyc-crashes', 'nyc-people', 'nyc-vehicles')}
+    crashes = pd.read_feather(paths['nyc-crashes'], columns=['collision_id', 'crash_time', 'borough'])
+    before = anon_rss_mb()
+    sampler = PeakSampler()
+    sampler.start()
+    start = time.perf_counter()
+    if method == 'merge':
+        people = pd.read_feather(paths['nyc-people'], columns=list(PEOPLE_DTYPES) + ['unique_id'])
+        vehicles = pd.read_feather(paths['nyc-vehicles'], columns=list(VEHICLE_DTYPES) + ['unique_id'])
+        product = crashes.merge(people, on='collision_id', how='left').merge(vehicles, on='collision_id', how='left', suffixes=('_person', '_vehicle'))
+        counts = product.groupby('collision_id').agg(people_count=('unique_id_person', 'nunique'), vehicles_count=('unique_id_vehicle', 'nunique'))
+        joined, columns = crashes.merge(counts, on='collision_id', how='left'), ['people_count', 'vehicles_count']
+    elif method == 'groupby':
+        people = pd.read_feather(paths['nyc-people'], columns=list(PEOPLE_DTYPES) + ['unique_id'])
+        vehicles = pd.read_feather(paths['nyc-vehicles'], columns=list(VEHICLE_DTYPES) + ['unique_id'])
+        joined, columns = groupby_aggregates(crashes, people, vehicles)
+    else:
+        aggregates = CollisionAggregates.build(crashes['collision_id'], chunksize=chunksize, people_path=paths['nyc-people'], vehicles_path=paths['nyc-vehicles'])
+        joined, columns = aggregates.attach(crashes), JOIN_FEATURES
+    elapsed = time.perf_counter() - start
+    sampler.done.set()
+    sampler.join()
+    return {
+        'method' : method,
+        'seconds' : round(elapsed, 3),
+        'peak_mb' : round(max(sampler.peak, anon_rss_mb()) - before, 1),
+        'result_mb' : round(anon_rss_mb() - before, 1),
+        'checksums' : checksums(joined, columns)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='synthetic crashes, people and vehicles are generated for them')
+    parser.add_argument('--chunksize', type=int, default=500000)
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+    parser.add_argument('--worker', nargs=3, metavar=('METHOD', 'DIR', 'CHUNKSIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        method, directory, chunksize = args.worker
+        print(json.dumps(measure(method, directory, int(chunksize))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from benchmarks.synthetic import make_crashes, make_people, make_vehicles, write_crashes
+        crashes = make_crashes(args.rows)
+        sizes = {}
+        for name, df in [('nyc-crashes', crashes), ('nyc-people', make_people(crashes)), ('nyc-vehicles', make_vehicles(crashes))]:
+            write_crashes(df, os.path.join(tmp, f'{name}.feather'))
+            sizes[name] = len(df)
+        del crashes
+        print(f"{sizes['nyc-crashes']} crashes, {sizes['nyc-people']} people, {sizes['nyc-vehicles']} vehicles")
+
+        results = []
+        for method in args.methods:
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_join', '--worker', method, tmp, str(args.chunksize)], capture_output=True, text=True)
+            if out.returncode:
+                print(f"{method} failed (exit {out.returncode}), likely out of memory")
+                continue
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'method':<10}{'seconds':>10}{'peak MB':>10}{'after MB':>10}")
+    for r in results:
+        print(f"{r['method']:<10}{r['seconds']:>10.3f}{r['peak_mb']:>10.1f}{r['result_mb']:>10.1f}")
+    by_method = {r['method'] : r['checksums'] for r in results}
+    if 'groupby' in by_method and 'stream' in by_method:
+        match = all(abs(value - by_method['stream'][col]) <= 1e-6 * max(1.0, abs(value)) for col, value in by_method['groupby'].items()) # ages are float32
+        print(f"stream matches groupby: {match}")
+
+if __name__ == '__main__':
+    main()
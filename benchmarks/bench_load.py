@@ -0,0 +1,95 @@
+# benchmarks/bench_load.py
+"""
+Load time and peak resident memory of load_crash_data: the legacy full pd.read_csv against the typed,
+column projected csv read and the memory mapped Feather/Parquet copies.
+
+    python -m benchmarks.bench_load --rows 1000000
+    python -m benchmarks.bench_load --csv data/raw/nyc-crashes.csv
+
+Every method runs in a fresh subprocess so peak RSS isn't polluted by the previous one.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+METHODS = ['legacy_csv', 'typed_csv', 'feather', 'parquet']
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB on Linux
+
+def rss_mb():
+    if os.path.exists('/proc/self/statm'): # current resident set, Linux only
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    return peak_rss_mb()
+
+def measure(method, path):
+    from src.data.cleaners import load_crash_data
+    from src.features.preprocessing import Preprocessing
+    columns = Preprocessing('nyc-crashes', 'full_pipe').CRASH_columns()
+
+    before, peak_before = rss_mb(), peak_rss_mb()
+    start = time.perf_counter()
+    if method == 'legacy_csv':
+        df = load_crash_data(path=path, legacy=True)
+    else:
+        df = load_crash_data(columns=columns, path=path)
+    elapsed = time.perf_counter() - start
+    return {
+        'method' : method,
+        'seconds' : round(elapsed, 3),
+        'rss_delta_mb' : round(rss_mb() - before, 1),
+        'peak_rss_delta_mb' : round(peak_rss_mb() - peak_before, 1), # 0 when importing the package peaked higher than the load
+        'frame_mb' : round(df.memory_usage(deep=True).sum() / 2**20, 1),
+        'columns' : df.shape[1]
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='synthetic rows to generate when --csv isn\'t given')
+    parser.add_argument('--csv', default=None, help='benchmark against an existing nyc-crashes csv')
+    parser.add_argument('--worker', nargs=2, metavar=('METHOD', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(*args.worker)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from src.data.cleaners import load_crash_data
+        from benchmarks.synthetic import make_crashes, write_crashes
+        if args.csv:
+            csv_path = args.csv
+            df = load_crash_data(path=csv_path)
+        else:
+            print(f"Generating {args.rows} synthetic rows...")
+            df = make_crashes(args.rows)
+            csv_path = write_crashes(df, os.path.join(tmp, 'nyc-crashes.csv'))
+        paths = {
+            'legacy_csv' : csv_path,
+            'typed_csv' : csv_path,
+            'feather' : write_crashes(df, os.path.join(tmp, 'nyc-crashes.feather')),
+            'parquet' : write_crashes(df, os.path.join(tmp, 'nyc-crashes.parquet'))
+        }
+        del df
+
+        results = []
+        for method in METHODS:
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_load', '--worker', method, paths[method]],
+                                 capture_output=True, text=True, check=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    legacy = results[0]
+    print(f"\n{'method':<12}{'seconds':>10}{'speedup':>10}{'RSS MB':>9}{'peak RSS MB':>14}{'frame MB':>11}{'cols':>6}")
+    for r in results:
+        print(f"{r['method']:<12}{r['seconds']:>10.3f}{legacy['seconds'] / r['seconds']:>9.1f}x{r['rss_delta_mb']:>9.1f}"
+              f"{r['peak_rss_delta_mb']:>14.1f}{r['frame_mb']:>11.1f}{r['columns']:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_memo.py
+"""
+Grid extension with memoized CV results (src/models/results.py): the model's PARAM_GRID from a cold store,
+the same grid again, then the grid with one more max_depth (xgboost) or C (logistic) value. Each run
+reports the (params, fold) cells it trained, its wall time and its best params, which must match an
+unmemoized run of the extended grid.
+
+    python -m benchmarks.bench_memo --rows 200000 --models xgboost logistic
+"""
+import argparse
+import tempfile
+import time
+from itertools import product
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models import linear_model, xgboost_model
+from src.models.results import CVResultStore
+
+MODELS = {
+    'logistic' : (linear_model, 'C', 100),
+    'xgboost' : (xgboost_model, 'max_depth', 7)
+}
+
+def grid(param_grid):
+    keys, values = zip(*param_grid.items())
+    return [dict(zip(keys, v)) for v in product(*values)]
+
+def search(module, X, y, param_grid, store=None):
+    """Best params and AUC of the grid, the last fold model is refit when it was memoized like train_* does."""
+    engine = module.make_engine(X, y, k=5).use_results(store)
+    misses = store.misses if store is not None else 0
+    start = time.perf_counter()
+    results = [(params, engine.cross_validate(module.fit_fold, module.evaluate_fold, params, return_final_model=True)) for params in grid(param_grid)]
+    best_params, (metrics, _, model) = max(results, key=lambda pair: pair[1][0]['roc_auc'])
+    refit = model is None
+    if refit:
+        model = engine.fit_final(module.fit_fold, best_params)
+    fits = (store.misses - misses if store is not None else len(results) * 5) + refit
+    return best_params, metrics['roc_auc'], fits, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    args = parser.parse_args()
+
+    data = make_crashes(args.rows)
+    X = CrashFeatureBuilder().fit_transform(data).to_numpy()
+    y = consolidate_response(data)['Y'].to_numpy()
+    del data
+
+    print(f"{'model':>10}{'run':>24}{'fold fits':>11}{'seconds':>10}{'best auc':>10}  best params")
+    for name in args.models:
+        module, key, extra = MODELS[name]
+        extended = dict(module.PARAM_GRID, **{key : module.PARAM_GRID[key] + [extra]})
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CVResultStore({'dataset' : 'bench', 'rows' : args.rows, 'model' : name}, results_dir=tmp)
+            runs = [
+                ('cold', module.PARAM_GRID, store),
+                ('rerun', module.PARAM_GRID, store),
+                (f'+1 {key}', extended, store),
+                (f'+1 {key}, no memo', extended, None),
+            ]
+            best = []
+            for label, param_grid, run_store in runs:
+                params, auc, fits, seconds = search(module, X, y, param_grid, run_store)
+                best.append((params, auc))
+                print(f"{name:>10}{label:>24}{fits:>11}{seconds:>10.2f}{auc:>10.4f}  {params}")
+            print(f"{'':>10}memoized extension picks the same best params: {best[2] == best[3]}")
+
+if __name__ == '__main__':
+    main()
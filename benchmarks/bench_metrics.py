@@ -0,0 +1,72 @@
+# benchmarks/bench_metrics.py
+"""
+Per fold evaluation cost: the six sklearn calls evaluate_fold used to make against evaluation.fold_metrics,
+and a 101 threshold sweep as a sklearn loop against binary_metrics.
+
+    python -m benchmarks.bench_metrics --rows 20000 200000 2000000
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics import (
+    roc_auc_score, accuracy_score, f1_score,
+    precision_score, recall_score, confusion_matrix
+)
+
+from src.evaluation.evaluate import DEFAULT_THRESHOLDS, binary_metrics, fold_metrics
+
+def legacy_fold_metrics(y_val, y_proba):
+    """evaluate_fold's metrics before the kernel."""
+    y_pred = (y_proba >= 0.5).astype(int)
+    return {
+        "roc_auc": roc_auc_score(y_val, y_proba),
+        "accuracy": accuracy_score(y_val, y_pred),
+        "f1": f1_score(y_val, y_pred),
+        "precision": precision_score(y_val, y_pred),
+        "recall": recall_score(y_val, y_pred),
+        "conf_matrix": confusion_matrix(y_val, y_pred)
+    }
+
+def legacy_sweep(y_val, y_proba, thresholds):
+    out = []
+    for threshold in thresholds:
+        y_pred = (y_proba >= threshold).astype(int)
+        out.append((precision_score(y_val, y_pred, zero_division=0), recall_score(y_val, y_pred, zero_division=0),
+                    f1_score(y_val, y_pred, zero_division=0)))
+    return out
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[20000, 200000, 2000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10}{'sklearn ms':>12}{'kernel ms':>11}{'speedup':>9}{'sweep sk ms':>13}{'sweep ms':>10}{'speedup':>9}  match")
+    for n in args.rows:
+        y_val = (rng.random(n) < 0.25).astype(np.int64)
+        y_proba = np.clip(0.25 + 0.2 * (y_val - 0.25) + rng.normal(0, 0.2, n), 0, 1).astype(np.float32)
+
+        legacy_s, legacy = best_of(lambda: legacy_fold_metrics(y_val, y_proba), args.repeat)
+        kernel_s, kernel = best_of(lambda: fold_metrics(y_val, y_proba), args.repeat)
+        match = all(np.allclose(legacy[key], kernel[key]) for key in legacy)
+
+        sweep_repeat = 1 if n > 200000 else args.repeat # the sklearn loop is 303 calls
+        legacy_sweep_s, swept = best_of(lambda: legacy_sweep(y_val, y_proba, DEFAULT_THRESHOLDS), sweep_repeat)
+        sweep_s, sweep = best_of(lambda: binary_metrics(y_val, y_proba), args.repeat)
+        match = match and np.allclose(np.array(swept), np.column_stack([sweep['precision'], sweep['recall'], sweep['f1']]))
+
+        print(f"{n:>10}{legacy_s * 1000:>12.1f}{kernel_s * 1000:>11.1f}{legacy_s / kernel_s:>8.1f}x"
+              f"{legacy_sweep_s * 1000:>13.0f}{sweep_s * 1000:>10.1f}{legacy_sweep_s / sweep_s:>8.0f}x  {match}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_mlp.py
+"""
+MLP training and inference throughput on a memory mapped design matrix: one epoch through the naive
+TensorDataset + DataLoader(batch_size) path (the whole X loaded, rows collated one by one) against
+MLP_model's whole-batch reads into reused buffers and with DataLoader workers, then batched inference.
+
+    python -m benchmarks.bench_mlp --rows 1000000 --workers 0 2 --threads 1 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models import MLP_model
+
+PARAMS = {"hidden": (64,), "lr": 1e-3, "dropout": 0.1, "batch_size": 2048}
+
+def train_epoch(net, batches, mean, std):
+    optimizer = torch.optim.Adam(net.parameters(), lr=PARAMS["lr"])
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+    rows = 0
+    start = time.perf_counter()
+    for xb, yb in batches:
+        xb = (xb.float() - mean) / std
+        optimizer.zero_grad(set_to_none=True)
+        loss_fn(net(xb).squeeze(1), yb.float()).backward()
+        optimizer.step()
+        rows += len(yb)
+    return rows / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count()])
+    parser.add_argument('--naive-rows', type=int, default=200000, help="the per-row DataLoader is slow, time it on fewer rows")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = consolidate_response(make_crashes(args.rows))
+        X_path, y_path = os.path.join(tmp, 'X.npy'), os.path.join(tmp, 'Y.npy')
+        np.save(X_path, CrashFeatureBuilder().build_features(data).to_numpy())
+        np.save(y_path, data['Y'].to_numpy())
+        del data
+        X, y = np.load(X_path, mmap_mode='r'), np.load(y_path, mmap_mode='r')
+        rows = np.arange(len(y))
+        mean_np, std_np = MLP_model.column_stats(X, rows)
+        mean, std = torch.from_numpy(mean_np), torch.from_numpy(std_np)
+
+        print(f"{'path':<28}{'threads':>8}{'workers':>8}{'train rows/s':>14}{'predict rows/s':>16}")
+        for threads in sorted(set(args.threads)):
+            torch.set_num_threads(threads)
+            torch.manual_seed(0)
+            net = MLP_model.make_network(X.shape[1], PARAMS["hidden"], PARAMS["dropout"])
+
+            naive = torch.utils.data.TensorDataset(torch.from_numpy(np.asarray(X[:args.naive_rows], dtype=np.float32)), torch.from_numpy(np.asarray(y[:args.naive_rows])))
+            loader = torch.utils.data.DataLoader(naive, batch_size=PARAMS["batch_size"], shuffle=True)
+            print(f"{'naive TensorDataset':<28}{threads:>8}{0:>8}{train_epoch(net, loader, mean, std):>14,.0f}{'':>16}")
+
+            for workers in args.workers:
+                dataset = MLP_model.RowBatches(X, y, rows, PARAMS["batch_size"], shuffle=True)
+                buffers = MLP_model.make_buffers(PARAMS["batch_size"], X.shape[1]) if workers == 0 else None
+                rate = train_epoch(net, MLP_model.iter_batches(dataset, loader_workers=workers, buffers=buffers), mean, std)
+                label = 'memmap batches + buffers' if workers == 0 else 'memmap batches + loader'
+                print(f"{label:<28}{threads:>8}{workers:>8}{rate:>14,.0f}{'':>16}")
+
+            model = MLP_model.MLPModel(net, mean_np, std_np)
+            model.predict_proba(X)
+            print(f"{'batched inference':<28}{threads:>8}{0:>8}{'':>14}{model.predict_rows_per_s:>16,.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_query.py
+"""
+loaders.query against the local stub Socrata server (benchmarks/stub_socrata.py): bytes on the wire and time
+for the old `$select=*` query, the planned query of the full_pipe columns with its filters pushed down, a
+per borough count pushed down as $group against aggregating $select=* rows locally, then the planned query
+again from a fresh cache entry, after the TTL (304 revalidation) and after the data changed (refetch).
+
+    python -m benchmarks.bench_query --rows 200000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.stub_socrata import make_stub_socrata
+from benchmarks.synthetic import make_crashes
+from src.data.loaders import query
+from src.data.soql import ResponseCache
+from src.features.preprocessing import Preprocessing
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    server = make_stub_socrata(make_crashes(args.rows))
+    url = f'http://127.0.0.1:{server.server_port}/resource.json'
+    pipeline = Preprocessing('nyc-crashes', 'full_pipe')
+    results = []
+
+    def run(label, cache=None, **kwargs):
+        before = dict(server.stats)
+        start = time.perf_counter()
+        df = query('nyc-crashes', limit=args.rows, url=url, use_cache=cache is not None, cache=cache, **kwargs)
+        if label == 'aggregate locally':
+            df = df.groupby('borough', dropna=False).size()
+        elapsed = time.perf_counter() - start
+        results.append((label, server.stats['requests'] - before['requests'], (server.stats['bytes'] - before['bytes']) / 2**20, elapsed, len(df)))
+        return df
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            run('select *')
+            run('planned', pipeline=pipeline, where='borough IS NOT NULL')
+            run('aggregate locally')
+            run('$group pushdown', select=['borough', 'count(*) AS crashes'], group='borough')
+
+            cache = ResponseCache(cache_dir=tmp, ttl=3600)
+            run('planned, cold cache', cache, pipeline=pipeline, where='borough IS NOT NULL')
+            run('planned, cache hit', cache, pipeline=pipeline, where='borough IS NOT NULL')
+            cache.ttl = 0
+            run('planned, 304', cache, pipeline=pipeline, where='borough IS NOT NULL')
+            server.version += 1
+            run('planned, changed', cache, pipeline=pipeline, where='borough IS NOT NULL')
+            stored = sum(entry['bytes'] for entry in cache.entries()) / 2**20
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"\n{'query':<22}{'requests':>9}{'MB sent':>10}{'seconds':>10}{'rows':>9}")
+    for label, requests, mb, seconds, rows in results:
+        print(f"{label:<22}{requests:>9}{mb:>10.2f}{seconds:>10.3f}{rows:>9}")
+    print(f"cache on disk {stored:.2f} MB gzipped, {cache.stats}")
+
+if __name__ == '__main__':
+    main()
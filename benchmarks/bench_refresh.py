@@ -0,0 +1,86 @@
+# benchmarks/bench_refresh.py
+"""
+Daily refresh against retraining: for each history size an XGBoost booster and a logistic regression are
+trained once on the first 80% of synthetic history and saved as artifacts, the last 20% giving their
+reference AUC. Then a day of --new-rows later crashes is taken either by refresh_artifact
+(src/models/refresh.py) or by one refit of the best grid point on history plus the new day. A real retrain
+runs the whole grid with 5-fold CV, about 5 x len(PARAM_GRID) such fits. A last day with its labels shuffled against the features has to come back with needs_retrain set.
+
+    python -m benchmarks.bench_refresh --history 200000 1000000 --new-rows 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import INJURED_COLUMNS, KILLED_COLUMNS, consolidate_response
+from src.evaluation.evaluate import fold_metrics
+from src.features.build_features import CrashFeatureBuilder, design_matrix
+from src.models.artifact import LogisticArtifact, XGBoostArtifact, save_artifact
+from src.models.refresh import refresh_artifact
+
+XGB_PARAMS = {"max_depth": 5, "eta": 0.3, "subsample": 1.0, "objective": "binary:logistic", "eval_metric": "logloss", "verbosity": 0}
+LR_PARAMS = {"C": 1.0, "max_iter": 500}
+
+def later_day(history, n, seed, shuffle_labels=False):
+    """n crashes dated the day after history ends, optionally with outcomes unrelated to the features."""
+    day = make_crashes(n, seed=seed)
+    day['crash_date'] = history['crash_date'].max().normalize() + pd.Timedelta(days=1)
+    if shuffle_labels:
+        outcomes = day[INJURED_COLUMNS + KILLED_COLUMNS].sample(frac=1.0, random_state=seed).to_numpy()
+        day[INJURED_COLUMNS + KILLED_COLUMNS] = outcomes
+    return day
+
+def fit(kind, X, y):
+    start = time.perf_counter()
+    if kind == 'xgboost':
+        import xgboost as xgb
+        model = xgb.train(XGB_PARAMS, xgb.QuantileDMatrix(X, label=y), num_boost_round=100)
+    else:
+        from sklearn.linear_model import LogisticRegression
+        model = LogisticRegression(**LR_PARAMS).fit(X, y)
+    return model, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', type=int, nargs='+', default=[200000, 1000000])
+    parser.add_argument('--new-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    rows = []
+    for n in args.history:
+        history = make_crashes(n, seed=0)
+        data = consolidate_response(history)
+        builder = CrashFeatureBuilder().fit(data)
+        X_all = builder.transform(data)
+        columns = list(X_all.columns)
+        X, y = design_matrix(X_all), data['Y'].to_numpy()
+        del X_all
+        day = later_day(history, args.new_rows, seed=1)
+        day_data = consolidate_response(day)
+        X_day = design_matrix(builder.transform(day_data)[columns])
+        X_both, y_both = np.vstack([X, X_day]), np.concatenate([y, day_data['Y'].to_numpy()])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for kind, params in [('xgboost', XGB_PARAMS), ('logistic', LR_PARAMS)]:
+                split = int(n * 0.8) # the artifact's reference AUC, what the trainers' CV metrics would be
+                model, _ = fit(kind, X[:split], y[:split])
+                scores = XGBoostArtifact(model) if kind == 'xgboost' else LogisticArtifact(model.coef_[0], model.intercept_[0])
+                metrics = {'roc_auc' : fold_metrics(y[split:], scores.predict_proba(X[split:])[:, 1])['roc_auc']}
+                directory = save_artifact(os.path.join(tmp, kind), builder, columns, model, params=params, metrics=metrics)
+                _, refit_s = fit(kind, X_both, y_both)
+                report = refresh_artifact(directory, day)
+                drifted = refresh_artifact(directory, later_day(history, args.new_rows, seed=2, shuffle_labels=True))
+                rows.append((n, kind, refit_s, report['seconds'], report['before_auc'], report['after_auc'], report['kept'], drifted['needs_retrain']))
+        del X, X_both
+
+    print(f"\n{'history':>9} {'model':<9}{'refit s':>9}{'refresh s':>11}{'AUC before':>12}{'AUC after':>11}{'kept':>6}{'drift flagged':>15}")
+    for n, kind, refit_s, refresh_s, before, after, kept, flagged in rows:
+        print(f"{n:>9} {kind:<9}{refit_s:>9.2f}{refresh_s:>11.2f}{before:>12.4f}{after:>11.4f}{str(kept):>6}{str(flagged):>15}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_rf.py
+"""
+Random forest grid: every n_estimators fit from scratch per fold (the naive grid) against one warm started
+forest per fold grown through the sweep (cross_validate_sweep) and the out of bag sweep on all rows.
+
+    python -m benchmarks.bench_rf --rows 200000 --n-jobs 1
+
+Reports trees built, wall time and whether the warm started metrics equal the independent fits.
+"""
+import argparse
+import time
+from itertools import product
+
+import numpy as np
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models import random_forest
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--folds', type=int, default=5)
+    args = parser.parse_args()
+
+    data = consolidate_response(make_crashes(args.rows))
+    X = CrashFeatureBuilder().build_features(data).to_numpy()
+    y = data['Y'].to_numpy()
+    engine = random_forest.make_engine(X, y, k=5)
+
+    grid = random_forest.PARAM_GRID
+    sweep = grid["n_estimators"]
+    keys, values = zip(*[(key, value) for key, value in grid.items() if key != "n_estimators"])
+    families = [dict(zip(keys, v)) for v in product(*values)]
+
+    start = time.perf_counter()
+    naive = {}
+    for params in families:
+        for size in sweep:
+            naive[(str(params), size)] = random_forest.cross_validate(dict(params, n_estimators=size), X, y, engine=engine, n_folds=args.folds, n_jobs=args.n_jobs)
+    naive_s = time.perf_counter() - start
+    naive_trees = len(families) * sum(sweep) * args.folds
+
+    start = time.perf_counter()
+    match = True
+    for params in families:
+        for size, (metrics, conf_matrix) in random_forest.cross_validate_sweep(params, sweep, X, y, engine=engine, n_folds=args.folds, n_jobs=args.n_jobs):
+            naive_metrics, naive_conf = naive[(str(params), size)]
+            match = match and all(np.isclose(metrics[key], naive_metrics[key], rtol=0, atol=1e-12) for key in metrics) and (conf_matrix == naive_conf).all()
+    warm_s = time.perf_counter() - start
+    warm_trees = len(families) * max(sweep) * args.folds
+
+    start = time.perf_counter()
+    oob_auc = max(result[0]["roc_auc"] for params in families for _, result in random_forest.oob_sweep(params, sweep, X, y, n_jobs=args.n_jobs))
+    oob_s = time.perf_counter() - start
+    oob_trees = len(families) * max(sweep)
+
+    best_cv = max(metrics["roc_auc"] for metrics, _ in naive.values())
+    print(f"{args.rows} rows, {len(families)} families x n_estimators {sweep}, {args.folds} folds, n_jobs={random_forest.bounded_jobs(args.n_jobs)}")
+    print(f"{'method':<22}{'trees':>8}{'seconds':>10}{'speedup':>9}{'best auc':>10}")
+    print(f"{'naive grid':<22}{naive_trees:>8}{naive_s:>10.1f}{1:>8.1f}x{best_cv:>10.4f}")
+    print(f"{'warm start sweep':<22}{warm_trees:>8}{warm_s:>10.1f}{naive_s / warm_s:>8.1f}x{best_cv:>10.4f}  same metrics: {match}")
+    print(f"{'out of bag sweep':<22}{oob_trees:>8}{oob_s:>10.1f}{naive_s / oob_s:>8.1f}x{oob_auc:>10.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/bench_search.py
+"""
+Exhaustive 5-fold grid search against successive halving, wall time and best ROC AUC for each model.
+
+    python -m benchmarks.bench_search --rows 200000 --models logistic xgboost
+
+Features come from CrashFeatureBuilder on synthetic crashes, nothing is logged to MLflow. The halving AUC is
+the best full budget (5 fold) result, so both columns are on the same footing.
+"""
+import argparse
+import time
+from itertools import product
+
+import numpy as np
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.models import linear_model, xgboost_model
+from src.models.search import make_rung_evaluator, successive_halving
+
+MODELS = {
+    'logistic' : linear_model,
+    'xgboost' : xgboost_model
+}
+
+def grid(param_grid):
+    keys, values = zip(*param_grid.items())
+    return [dict(zip(keys, v)) for v in product(*values)]
+
+def exhaustive(module, X, y):
+    engine = module.make_engine(X, y, k=5)
+    results = [module.cross_validate(params, X, y, engine=engine) for params in grid(module.PARAM_GRID)]
+    return max(metrics['roc_auc'] for metrics, _ in results), len(results) * 5
+
+def halving(module, X, y, eta):
+    evaluate_rung = make_rung_evaluator(module.make_engine, module.fit_fold, module.evaluate_fold, X, y, k=5)
+    history = successive_halving(grid(module.PARAM_GRID), evaluate_rung, module.HALVING_BUDGETS, eta=eta, verbose=False)
+    fits = sum(budget.get('n_folds', 5) for _, _, budget, _ in history)
+    return max(result[0]['roc_auc'] for _, result, _, final in history if final), fits
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--eta', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_crashes(args.rows)
+    X = CrashFeatureBuilder().fit_transform(data).to_numpy()
+    y = consolidate_response(data)['Y'].to_numpy()
+    del data
+    print(f"{args.rows} rows, {X.shape[1]} features, {y.mean():.1%} positive")
+
+    print(f"{'model':>10}{'search':>12}{'fold fits':>11}{'seconds':>10}{'best auc':>10}")
+    for name in args.models:
+        for label, run in (('exhaustive', lambda m: exhaustive(m, X, y)), ('halving', lambda m: halving(m, X, y, args.eta))):
+            start = time.perf_counter()
+            best_auc, fits = run(MODELS[name])
+            seconds = time.perf_counter() - start
+            print(f"{name:>10}{label:>12}{fits:>11}{seconds:>10.2f}{best_auc:>10.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_sparse.py
+"""
+Dense against sparse (CSR) design matrices as the vocabulary grows: CrashFeatureBuilder.wide(top_k) one-hot
+encodes the default columns plus zip code and street names with top_k values kept per column.
+
+    python -m benchmarks.bench_sparse --rows 200000 --top-k 10 100 500
+
+Reports feature count, matrix size, transform time and RSS growth, and the fit time of LogisticRegression
+and xgboost (QuantileDMatrix build included) on each. Dense runs whose matrix would exceed --max-dense-mb are skipped.
+"""
+import argparse
+import time
+
+import numpy as np
+import xgboost as xgb
+
+from benchmarks.bench_load import rss_mb
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder, design_matrix
+from src.models import linear_model
+
+LR_PARAMS = {"C": 1.0, "penalty": "l2", "solver": "lbfgs", "max_iter": 100}
+XGB_PARAMS = {"max_depth": 5, "eta": 0.3, "objective": "binary:logistic", "tree_method": "hist", "verbosity": 0}
+
+def matrix_mb(X):
+    if hasattr(X, 'tocsr'):
+        return (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 2**20
+    return X.nbytes / 2**20
+
+def run(builder, data, y, rounds):
+    before = rss_mb()
+    start = time.perf_counter()
+    X = design_matrix(builder.transform(data))
+    transform_s = time.perf_counter() - start
+    rss_growth = rss_mb() - before
+
+    start = time.perf_counter()
+    linear_model.fit_fold(LR_PARAMS, {"X_train": X, "y_train": y})
+    lr_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    xgb.train(XGB_PARAMS, xgb.QuantileDMatrix(X, label=y), num_boost_round=rounds)
+    xgb_s = time.perf_counter() - start
+    return matrix_mb(X), transform_s, rss_growth, lr_s, xgb_s
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--top-k', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--max-dense-mb', type=float, default=1500)
+    args = parser.parse_args()
+
+    data = consolidate_response(make_crashes(args.rows))
+    y = data['Y'].to_numpy()
+    print(f"{args.rows} rows, LogisticRegression {LR_PARAMS}, xgboost {args.rounds} rounds")
+    print(f"{'top_k':>6}{'features':>10}{'layout':>8}{'matrix MB':>11}{'rss +MB':>9}{'transform s':>13}{'lr fit s':>10}{'xgb fit s':>11}")
+    for top_k in args.top_k:
+        builder = CrashFeatureBuilder.wide(top_k=top_k, sparse=True).fit(data)
+        n_features = len(builder.feature_names_)
+        for sparse in (False, True):
+            builder.sparse = sparse
+            if not sparse and args.rows * n_features * 8 / 2**20 > args.max_dense_mb:
+                print(f"{top_k:>6}{n_features:>10}{'dense':>8}{args.rows * n_features * 8 / 2**20:>11.1f}  skipped, above --max-dense-mb")
+                continue
+            mb, transform_s, rss_growth, lr_s, xgb_s = run(builder, data, y, args.rounds)
+            print(f"{top_k:>6}{n_features:>10}{'sparse' if sparse else 'dense':>8}{mb:>11.1f}{rss_growth:>9.1f}{transform_s:>13.2f}{lr_s:>10.2f}{xgb_s:>11.2f}")
+
+if __name__ == '__main__':
+    main()
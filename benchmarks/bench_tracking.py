@@ -0,0 +1,85 @@
+# benchmarks/bench_tracking.py
+"""
+MLflow logging cost per grid point: the old blocking start_run / log_params / log_metrics / pyplot heatmap
+sequence against RunLogger with each plots mode, on a throwaway file store.
+
+    python -m benchmarks.bench_tracking --runs 40
+
+'caller s' is the time the training loop spends logging, 'total s' includes waiting for the queue to drain.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault('MLFLOW_ALLOW_FILE_STORE', 'true')
+
+import mlflow
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from src.models.tracking import RunLogger, render_deferred
+
+PARAMS = {"max_depth": 5, "eta": 0.3, "subsample": 0.8, "objective": "binary:logistic", "eval_metric": "logloss", "verbosity": 0}
+
+def fake_results(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        metrics = {name : float(rng.random()) for name in ('roc_auc', 'accuracy', 'f1', 'precision', 'recall')}
+        yield dict(PARAMS, run=i), metrics, rng.integers(0, 20000, size=(2, 2))
+
+def legacy_log(params, metrics, conf_matrix):
+    """The per grid point logging the trainers did before RunLogger."""
+    with mlflow.start_run() as run:
+        mlflow.log_params(params)
+        mlflow.log_metrics(metrics)
+        plt.figure(figsize=(5, 4))
+        sns.heatmap(conf_matrix, annot=True, fmt="d", cmap="Blues", cbar=False)
+        plt.title("Avg Confusion Matrix (5-fold)")
+        plt.xlabel("Predicted")
+        plt.ylabel("Actual")
+        os.makedirs("plots", exist_ok=True)
+        path = f"plots/conf_matrix_{run.info.run_id}.png"
+        plt.savefig(path)
+        mlflow.log_artifact(path, artifact_path="confusion_matrices")
+        plt.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=40)
+    parser.add_argument('--work-ms', type=float, default=0, help="simulated training time per grid point")
+    args = parser.parse_args()
+
+    print(f"{'mode':>16}{'caller s':>10}{'total s':>9}{'runs':>6}")
+    for mode in ('blocking', 'render', 'deferred', 'skip'):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp) # plots/ lands in the temp dir
+            mlflow.set_tracking_uri(f'file:{tmp}/mlruns')
+            logger = None if mode == 'blocking' else RunLogger(plots=mode)
+            caller = 0.0
+            start = time.perf_counter()
+            for params, metrics, conf_matrix in fake_results(args.runs):
+                time.sleep(args.work_ms / 1000)
+                log_start = time.perf_counter()
+                if logger is None:
+                    legacy_log(params, metrics, conf_matrix)
+                else:
+                    logger.log_run(params, metrics, conf_matrix=conf_matrix)
+                caller += time.perf_counter() - log_start
+            if logger is not None:
+                logger.flush()
+                logger.close()
+            total = time.perf_counter() - start - args.runs * args.work_ms / 1000
+            n_runs = len(mlflow.search_runs(search_all_experiments=True))
+            print(f"{mode:>16}{caller:>10.2f}{total:>9.2f}{n_runs:>6}")
+            if mode == 'deferred':
+                start = time.perf_counter()
+                rendered = render_deferred(logger.run_ids)
+                print(f"{'render_deferred':>16}{'':>10}{time.perf_counter() - start:>9.2f}{rendered:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# benchmarks/run_suite.py
+"""
+End to end benchmark suite on synthetic nyc-crashes data: wall time, CPU time and peak RSS growth of every
+hot path at each size, written to JSON and compared against a stored baseline.
+
+    python -m benchmarks.run_suite                                   # 100k, 1M, 10M rows
+    python -m benchmarks.run_suite --rows 100000 --output suite.json
+    python -m benchmarks.run_suite --rows 100000 1000000 --save-baseline benchmarks/baseline.json
+
+Stages, in order, each size in its own subprocess so one size's peak memory doesn't leak into the next:
+    load_feather          load_crash_data on the memory mapped feather copy
+    consolidate_response, build_features, select_features
+    cv_logistic, cv_xgboost  both cross_validate functions on the first --cv-rows rows, --cv-folds of 5 folds
+    load_artifact_*, score_*   loading each saved artifact and scoring every row through it, 1M rows at a time
+    load_csv              load_crash_data on the Socrata style csv export
+    fetch                 load_data(fetchall=True) against a local stub Socrata server (first --fetch-rows rows)
+
+A size whose worker crashes fails the run (status 1) and a run missing a size is never saved as a baseline.
+With a baseline (--baseline, default benchmarks/baseline.json when it exists) the run also exits with status 1
+when a stage is more than --max-slowdown times slower or grows RSS more than --max-memory-growth times the
+baseline. Stages under --min-seconds / --min-mb in both runs are too noisy to judge and are skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_load import rss_mb
+from benchmarks.stub_socrata import make_stub_socrata
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+DEFAULT_ROWS = [100000, 1000000, 10000000]
+
+class StageTimer:
+    """Records wall time, CPU time and the peak RSS above the starting RSS (sampled every interval seconds) of each `with timer(name):` block."""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stages = {}
+
+    def __call__(self, name):
+        self.name = name
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, rss_mb())
+
+    def __enter__(self):
+        self._start_rss = self._peak = rss_mb()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        self._stop.set()
+        self._sampler.join()
+        self._peak = max(self._peak, rss_mb())
+        self.stages[self.name] = {'seconds' : round(wall, 4), 'cpu_seconds' : round(cpu, 4), 'peak_rss_mb' : round(self._peak - self._start_rss, 1)}
+        print(f"  {self.name:<22}{wall:>9.3f}s{cpu:>9.3f}s cpu{self._peak - self._start_rss:>9.1f} MB", file=sys.stderr)
+
+def run_size(n, tmp, fetch_rows, cv_rows, cv_folds, score_batch=1000000, seed=0):
+    """All stages at n rows, returns {stage : measurements}."""
+    import numpy as np
+    import pyarrow as pa
+    from benchmarks.synthetic import make_crashes, write_crashes
+    from src.data.cleaners import consolidate_response, load_crash_data
+    from src.data.loaders import load_data
+    from src.features.build_features import CrashFeatureBuilder
+    from src.features.feature_selector import select_features
+    from src.features.preprocessing import Preprocessing
+    from src.models import linear_model, xgboost_model
+    from src.models.artifact import load_artifact, save_artifact
+
+    timer = StageTimer()
+    columns = Preprocessing('nyc-crashes', 'full_pipe').CRASH_columns()
+
+    print(f"Generating {n} rows...", file=sys.stderr)
+    df = make_crashes(n, seed=seed)
+    csv_path = write_crashes(df, os.path.join(tmp, 'nyc-crashes.csv'))
+    feather_path = write_crashes(df, os.path.join(tmp, 'nyc-crashes.feather'))
+
+    served = df.iloc[:fetch_rows].copy() # a plain slice would keep all n rows alive
+    del df
+
+    with timer('load_feather'):
+        data = load_crash_data(columns=columns, path=feather_path)
+    with timer('consolidate_response'):
+        data = consolidate_response(data)
+    builder = CrashFeatureBuilder()
+    with timer('build_features'):
+        X_all = builder.build_features(data)
+    with timer('select_features'):
+        X_selected = select_features(X_all, 'nyc-crashes', 'preset-1')
+    del X_selected
+
+    X = X_all.iloc[:cv_rows].to_numpy(np.float32)
+    y = data['Y'].iloc[:cv_rows].to_numpy()
+    feature_columns = X_all.columns
+    del X_all
+    lr_params = {key : values[0] for key, values in linear_model.PARAM_GRID.items()}
+    xgb_params = {key : values[0] for key, values in xgboost_model.PARAM_GRID.items()}
+    with timer('cv_logistic'):
+        lr_metrics, _, lr_model = linear_model.cross_validate(lr_params, X, y, return_final_model=True, n_folds=cv_folds)
+    with timer('cv_xgboost'):
+        xgb_metrics, _, xgb_model = xgboost_model.cross_validate(xgb_params, X, y, return_final_model=True, n_folds=cv_folds)
+    del X, y
+
+    for name, model in (('logistic', lr_model), ('xgboost', xgb_model)):
+        directory = save_artifact(os.path.join(tmp, f'model-{name}'), builder, feature_columns, model)
+        with timer(f'load_artifact_{name}'):
+            artifact = load_artifact(directory)
+        with timer(f'score_{name}'):
+            scores = np.empty(n)
+            for start in range(0, n, score_batch):
+                batch = data.iloc[start:start + score_batch]
+                scores[start:start + score_batch] = artifact['model'].predict_proba(artifact['feature_builder'].transform(batch)[artifact['columns']])[:, 1]
+        assert np.isfinite(scores).all()
+    del data, scores
+
+    # the two raw input paths run last, csv parsing leaves the allocator holding gigabytes at 10M rows
+    with timer('load_csv'):
+        data = load_crash_data(columns=columns, path=csv_path)
+    del data
+    pa.default_memory_pool().release_unused()
+
+    server = make_stub_socrata(served)
+    try:
+        with timer('fetch'):
+            fetched = load_data('nyc-crashes', fetchall=True, rtrn=True, downloader='parquet', url=f'http://127.0.0.1:{server.server_port}/resource.json',
+                                page_size=min(50000, fetch_rows), max_workers=4, rate_limit=None, verbose=False)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(fetched) == len(served), f"stub server returned {len(fetched)} rows, expected {len(served)}"
+    return {'stages' : timer.stages, 'checks' : {'cv_logistic_auc' : lr_metrics['roc_auc'], 'cv_xgboost_auc' : xgb_metrics['roc_auc'],
+                                                  'cv_rows' : min(cv_rows, n), 'fetch_rows' : min(fetch_rows, n)}}
+
+def compare(results, baseline, max_slowdown=1.3, max_memory_growth=1.5, min_seconds=0.05, min_mb=20):
+    """Regression messages for every stage of results slower or hungrier than the same stage and size in baseline."""
+    regressions = []
+    for size, run in results['sizes'].items():
+        base_run = baseline['sizes'].get(size)
+        if base_run is None:
+            continue
+        for stage, now in run['stages'].items():
+            base = base_run['stages'].get(stage)
+            if base is None:
+                continue
+            if max(now['seconds'], base['seconds']) >= min_seconds and now['seconds'] > max_slowdown * max(base['seconds'], min_seconds):
+                regressions.append(f"{size} rows {stage}: {now['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+            if max(now['peak_rss_mb'], base['peak_rss_mb']) >= min_mb and now['peak_rss_mb'] > max_memory_growth * max(base['peak_rss_mb'], min_mb):
+                regressions.append(f"{size} rows {stage}: {now['peak_rss_mb']:.0f} MB vs baseline {base['peak_rss_mb']:.0f} MB")
+    return regressions
+
+def print_table(results, baseline=None):
+    for size, run in results['sizes'].items():
+        base_run = (baseline or {}).get('sizes', {}).get(size, {'stages' : {}})
+        print(f"\n{int(size):,} rows")
+        print(f"  {'stage':<22}{'seconds':>10}{'cpu s':>9}{'peak MB':>9}{'vs base':>9}")
+        for stage, now in run['stages'].items():
+            base = base_run['stages'].get(stage)
+            ratio = f"{now['seconds'] / base['seconds']:>8.2f}x" if base and base['seconds'] else f"{'-':>9}"
+            print(f"  {stage:<22}{now['seconds']:>10.3f}{now['cpu_seconds']:>9.3f}{now['peak_rss_mb']:>9.1f}{ratio}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--fetch-rows', type=int, default=200000, help="rows served by the stub Socrata server, JSON paging is slow by nature")
+    parser.add_argument('--cv-rows', type=int, default=1000000, help="rows cross validated at each size")
+    parser.add_argument('--cv-folds', type=int, default=2, help="folds of the 5-fold split actually fit")
+    parser.add_argument('--output', default=None, help="write results JSON here")
+    parser.add_argument('--baseline', default=None, help=f"compare against this results JSON, default {DEFAULT_BASELINE} if present")
+    parser.add_argument('--save-baseline', default=None, help="write results as the new baseline here")
+    parser.add_argument('--max-slowdown', type=float, default=1.3)
+    parser.add_argument('--max-memory-growth', type=float, default=1.5, help="RSS peaks move more between runs than times do")
+    parser.add_argument('--min-seconds', type=float, default=0.05)
+    parser.add_argument('--min-mb', type=float, default=20)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(json.dumps(run_size(args.worker, tmp, args.fetch_rows, args.cv_rows, args.cv_folds)))
+        return
+
+    results = {
+        'meta' : {'created' : time.time(), 'python' : platform.python_version(), 'platform' : platform.platform(), 'cpu_count' : os.cpu_count(),
+                  'fetch_rows' : args.fetch_rows, 'cv_rows' : args.cv_rows, 'cv_folds' : args.cv_folds},
+        'sizes' : {},
+        'failed' : {} # size : worker exit status
+    }
+    for n in args.rows:
+        print(f"Running {n:,} rows...", file=sys.stderr)
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.run_suite', '--worker', str(n), '--fetch-rows', str(args.fetch_rows),
+                              '--cv-rows', str(args.cv_rows), '--cv-folds', str(args.cv_folds)],
+                             stdout=subprocess.PIPE, text=True, cwd=ROOT_DIR, env=dict(os.environ, PYTHONPATH=ROOT_DIR))
+        if out.returncode != 0:
+            print(f"{n:,} rows failed with status {out.returncode}", file=sys.stderr)
+            results['failed'][str(n)] = out.returncode
+            continue
+        results['sizes'][str(n)] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline and results['failed']:
+        print(f"Not saving baseline {args.save_baseline}, sizes {', '.join(results['failed'])} failed", file=sys.stderr)
+    elif args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) and not args.save_baseline else None)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if results['failed']:
+        print(f"\nFAIL: {len(results['failed'])} size(s) crashed: {', '.join(f'{int(size):,} rows (status {status})' for size, status in results['failed'].items())}")
+        sys.exit(1)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.max_slowdown, args.max_memory_growth, args.min_seconds, args.min_mb)
+        if regressions:
+            print(f"\nFAIL: {len(regressions)} regression(s) against {baseline_path}")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {baseline_path}")
+
+if __name__ == '__main__':
+    main()
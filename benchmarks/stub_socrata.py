@@ -0,0 +1,199 @@
+# benchmarks/stub_socrata.py
+"""
+Local stand-in for a Socrata resource serving a DataFrame, enough SoQL for the fetchers and the query planner:
+
+    $select   *, columns and count(*) / sum / avg / min / max(column), each optionally `AS alias`
+    $where    predicates ANDed together: column =, !=, <>, <, <=, >, >= literal, column IS [NOT] NULL, 1=1
+    $group    columns, $order column [ASC|DESC] (system fields like :id keep row order), $limit / $offset
+
+Responses carry an ETag and Last-Modified for the served version, conditional requests that match get a 304.
+server.stats counts requests, 304s, injected failures and body bytes sent, bump server.version to make every
+cached response stale. Failures (429/5xx, optionally with a Retry-After) queued in server.failures answer the
+next requests in order, before any of them is served.
+Anything outside the subset gets a 400 so a test notices instead of silently receiving unfiltered rows.
+"""
+import re
+import threading
+import time
+from collections import deque
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+AGGREGATES = {'count' : 'count', 'sum' : 'sum', 'avg' : 'mean', 'min' : 'min', 'max' : 'max'}
+SELECT_ITEM = re.compile(r'^(?:(\w+)\((\*|\w+)\)|(\w+))(?:\s+AS\s+(\w+))?$', re.IGNORECASE)
+COMPARISON = re.compile(r'^(\w+)\s*(=|!=|<>|<=|>=|<|>)\s*(.+)$')
+NULL_CHECK = re.compile(r'^(\w+)\s+IS\s+(NOT\s+)?NULL$', re.IGNORECASE)
+
+class SoQLError(ValueError):
+    pass
+
+def split_top_level(expr, separator):
+    """expr split on separator (a regex) wherever it's outside parentheses and string literals."""
+    parts, depth, quoted, start, i = [], 0, False, 0, 0
+    while i < len(expr):
+        char = expr[i]
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char in '()':
+            depth += 1 if char == '(' else -1
+        elif not quoted and depth == 0:
+            match = re.match(separator, expr[i:], re.IGNORECASE)
+            if match:
+                parts.append(expr[start:i])
+                i = start = i + match.end()
+                continue
+        i += 1
+    parts.append(expr[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+def strip_parens(expr):
+    """expr without parentheses that enclose all of it."""
+    while expr.startswith('(') and expr.endswith(')'):
+        depth = 0
+        for i, char in enumerate(expr):
+            depth += {'(' : 1, ')' : -1}.get(char, 0)
+            if depth == 0 and i < len(expr) - 1: # the opening parenthesis closes early
+                return expr
+        expr = expr[1:-1].strip()
+    return expr
+
+def literal(text, column):
+    text = text.strip()
+    value = text[1:-1].replace("''", "'") if text.startswith("'") and text.endswith("'") else text
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pd.Timestamp(value)
+    if pd.api.types.is_numeric_dtype(column):
+        return float(value)
+    return value
+
+def where_mask(df, where):
+    mask = pd.Series(True, index=df.index)
+    for predicate in split_top_level(where, r'\s+AND\s+'):
+        predicate = strip_parens(predicate)
+        if re.fullmatch(r'1\s*=\s*1', predicate):
+            continue
+        null_check, comparison = NULL_CHECK.match(predicate), COMPARISON.match(predicate)
+        if null_check and null_check.group(1) in df:
+            isnull = df[null_check.group(1)].isna()
+            mask &= ~isnull if null_check.group(2) else isnull
+        elif comparison and comparison.group(1) in df:
+            col, op, value = comparison.groups()
+            column = df[col]
+            value = literal(value, column)
+            result = {'=' : column == value, '!=' : column != value, '<>' : column != value, '<' : column < value,
+                      '<=' : column <= value, '>' : column > value, '>=' : column >= value}[op]
+            mask &= result.fillna(False).astype(bool)
+        else:
+            raise SoQLError(f"unsupported predicate: {predicate}")
+    return mask
+
+def run_soql(df, params):
+    """df filtered, grouped, projected, ordered and sliced per the SoQL params."""
+    if params.get('$where'):
+        df = df[where_mask(df, params['$where'])]
+
+    items, aggregations = [], False
+    for item in split_top_level(params.get('$select', '*'), r','):
+        if item == '*':
+            items.extend((col, None, col) for col in df.columns)
+            continue
+        match = SELECT_ITEM.match(item)
+        if not match:
+            raise SoQLError(f"unsupported select item: {item}")
+        func, arg, col, alias = match.groups()
+        if func:
+            if func.lower() not in AGGREGATES or (arg != '*' and arg not in df):
+                raise SoQLError(f"unsupported select item: {item}")
+            aggregations = True
+            items.append((arg, AGGREGATES[func.lower()], alias or f'{func.lower()}_{arg.replace("*", "")}'.rstrip('_')))
+        else:
+            if col not in df:
+                raise SoQLError(f"no such column: {col}")
+            items.append((col, None, alias or col))
+
+    group = split_top_level(params.get('$group', ''), r',')
+    if aggregations or group:
+        plain = [col for col, func, _ in items if func is None]
+        if set(plain) - set(group):
+            raise SoQLError(f"columns {sorted(set(plain) - set(group))} must be grouped or aggregated")
+        if group:
+            grouped = df.groupby(group, dropna=False, observed=True, sort=False)
+            out = pd.DataFrame({alias : grouped.size() if func == 'count' else grouped[col].agg(func)
+                                for col, func, alias in items if func is not None}).reset_index()
+        else:
+            out = pd.DataFrame({alias : [len(df) if func == 'count' else df[col].agg(func)] for col, func, alias in items})
+        df = out[[alias if func else col for col, func, alias in items]]
+    else:
+        df = df[[col for col, _, _ in items]].set_axis([alias for _, _, alias in items], axis=1)
+
+    order = params.get('$order', '').strip()
+    if order and not order.startswith(':'): # system fields like :id are the row order already
+        col, _, direction = order.partition(' ')
+        df = df.sort_values(col, ascending=direction.strip().upper() != 'DESC', kind='stable')
+
+    offset = int(params.get('$offset', 0))
+    limit = int(params.get('$limit', 1000))
+    return df.iloc[offset:offset + limit]
+
+def make_stub_socrata(df, failures=()):
+    """
+    Serves df from a daemon thread, see the module docstring for the supported SoQL. failures are statuses
+    (429, 503, ...) or (status, retry_after seconds) pairs for the first requests, more can be appended later.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            params = {key : values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            etag, last_modified = f'"v{server.version}"', formatdate(server.started + server.version, usegmt=True)
+            with server.lock:
+                server.stats['requests'] += 1
+                failure = server.failures.popleft() if server.failures else None
+            if failure is not None:
+                status, retry_after = failure if isinstance(failure, tuple) else (failure, None)
+                with server.lock:
+                    server.stats['failed'] += 1
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if self.headers.get('If-None-Match') == etag:
+                with server.lock:
+                    server.stats['not_modified'] += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            try:
+                body, status = run_soql(df, params).to_json(orient='records', date_format='iso').encode(), 200
+            except (SoQLError, KeyError, ValueError) as e:
+                body, status = str(e).encode(), 400
+            with server.lock:
+                server.stats['bytes'] += len(body)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 200:
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.stats = {'requests' : 0, 'not_modified' : 0, 'failed' : 0, 'bytes' : 0}
+    server.failures = deque(failures)
+    server.started = time.time()
+    server.version = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,148 @@
+# benchmarks/synthetic.py
+"""Synthetic nyc-crashes shaped data for benchmarks: real column names, skewed categories, a rush hour peak and realistic injury rates."""
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from src.config.config import CRASH_SCHEMA
+
+BOROUGHS = ['BROOKLYN', 'QUEENS', 'MANHATTAN', 'BRONX', 'STATEN ISLAND']
+BOROUGH_P = [0.22, 0.19, 0.15, 0.10, 0.03] # remaining ~31% are missing, like the real data
+
+VEHICLE_HEAD = ['Sedan', 'Station Wagon/Sport Utility Vehicle', 'PASSENGER VEHICLE', 'SPORT UTILITY / STATION WAGON', 'Taxi',
+                'Pick-up Truck', 'Box Truck', 'Bike', 'Bus', 'TAXI', 'Tractor Truck Diesel', 'Van', 'Motorcycle', 'E-Bike']
+FACTOR_HEAD = ['Unspecified', 'Driver Inattention/Distraction', 'Failure to Yield Right-of-Way', 'Following Too Closely',
+               'Backing Unsafely', 'Other Vehicular', 'Passing or Lane Usage Improper', 'Turning Improperly',
+               'Fatigued/Drowsy', 'Unsafe Lane Changing', 'Traffic Control Disregarded', 'Driver Inexperience']
+
+HOUR_WEIGHTS = np.array([2.0, 1.4, 1.1, 1.0, 1.1, 1.4, 2.2, 3.2, 4.4, 4.3, 4.1, 4.3,
+                         4.7, 4.9, 5.5, 5.8, 6.2, 6.3, 5.6, 4.7, 4.0, 3.5, 3.1, 2.6]) # afternoon rush hour peak
+
+def zipf_vocab(head, size, prefix):
+    return head + [f'{prefix} {i}' for i in range(max(size - len(head), 0))]
+
+def zipf_probs(size, a=1.3):
+    weights = 1.0 / np.arange(1, size + 1) ** a
+    return weights / weights.sum()
+
+def categorical(rng, vocab, probs, n, missing=0.0):
+    codes = rng.choice(len(vocab), size=n, p=probs)
+    if missing:
+        codes[rng.random(n) < missing] = -1
+    return pd.Categorical.from_codes(codes, categories=vocab)
+
+def make_crashes(n, seed=0, n_vehicle_types=300, n_factors=60, n_streets=5000, n_zips=200):
+    """Builds an n row DataFrame with every column in CRASH_SCHEMA, categoricals are pandas categoricals to keep generation cheap."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(index=pd.RangeIndex(n))
+
+    start = np.datetime64('2015-01-01', 'D')
+    df['crash_date'] = start + rng.integers(0, 3650, size=n).astype('timedelta64[D]')
+    hours = rng.choice(24, size=n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minutes = rng.integers(0, 60, size=n)
+    times = [f'{h}:{m:02d}' for h in range(24) for m in range(60)]
+    df['crash_time'] = pd.Categorical.from_codes(hours * 60 + minutes, categories=times)
+
+    borough_codes = rng.choice(len(BOROUGHS) + 1, size=n, p=BOROUGH_P + [1 - sum(BOROUGH_P)])
+    borough_codes[borough_codes == len(BOROUGHS)] = -1
+    df['borough'] = pd.Categorical.from_codes(borough_codes, categories=BOROUGHS)
+    zips = [str(10001 + i) for i in range(n_zips)]
+    zip_codes = rng.choice(n_zips, size=n, p=zipf_probs(n_zips, 0.8))
+    zip_codes[borough_codes == -1] = -1
+    df['zip_code'] = pd.Categorical.from_codes(zip_codes, categories=zips)
+    df['latitude'] = np.where(rng.random(n) < 0.11, np.nan, 40.5 + rng.random(n) * 0.4)
+    df['longitude'] = np.where(np.isnan(df['latitude']), np.nan, -74.25 + rng.random(n) * 0.55)
+
+    streets = [f'STREET {i}' for i in range(n_streets)]
+    street_p = zipf_probs(n_streets, 1.0)
+    df['on_street_name'] = categorical(rng, streets, street_p, n, missing=0.22)
+    df['off_street_name'] = categorical(rng, streets, street_p, n, missing=0.38)
+    df['cross_street_name'] = categorical(rng, streets, street_p, n, missing=0.83)
+
+    # ~28% of crashes injure someone and ~0.1% kill someone, split across motorists, pedestrians and cyclists.
+    # The injury rate depends on the vehicle, factor, hour and borough so models have some signal to find.
+    factors = zipf_vocab(FACTOR_HEAD, n_factors, 'FACTOR')
+    factor_p = zipf_probs(len(factors), 1.4)
+    vehicles = zipf_vocab(VEHICLE_HEAD, n_vehicle_types, 'VEHICLE')
+    vehicle_p = zipf_probs(len(vehicles), 1.5)
+    factor1 = categorical(rng, factors, factor_p, n, missing=0.004)
+    vehicle1 = categorical(rng, vehicles, vehicle_p, n, missing=0.007)
+
+    risk = np.ones(n)
+    risk[np.isin(np.asarray(vehicle1, dtype=object), ['Bike', 'Motorcycle', 'E-Bike'])] *= 2.8
+    risk[np.isin(np.asarray(vehicle1, dtype=object), ['Box Truck', 'Tractor Truck Diesel'])] *= 0.7
+    factor_risk = {'Unspecified' : 0.8, 'Failure to Yield Right-of-Way' : 1.7, 'Traffic Control Disregarded' : 1.6, 'Backing Unsafely' : 0.5}
+    for factor, mult in factor_risk.items():
+        risk[np.asarray(factor1, dtype=object) == factor] *= mult
+    risk[hours < 5] *= 1.3
+    risk[borough_codes == -1] *= 0.85
+    injured = rng.random(n) < np.clip(0.28 * risk / risk.mean(), 0, 0.95)
+    injured_total = np.where(injured, 1 + rng.poisson(0.35, size=n), 0)
+    who = rng.choice(3, size=n, p=[0.2, 0.1, 0.7])
+    killed = rng.random(n) < 0.001 * risk / risk.mean()
+    for i, role in enumerate(['pedestrians', 'cyclist', 'motorist']):
+        df[f'number_of_{role}_injured'] = np.where(who == i, injured_total, 0).astype(np.int8)
+        df[f'number_of_{role}_killed'] = np.where((who == i) & killed, 1, 0).astype(np.int8)
+    df['number_of_persons_injured'] = injured_total.astype(np.int8)
+    df['number_of_persons_killed'] = killed.astype(np.int8)
+
+    df['contributing_factor_vehicle_1'] = factor1
+    for i, missing in zip(range(2, 6), [0.16, 0.93, 0.98, 0.995]):
+        df[f'contributing_factor_vehicle_{i}'] = categorical(rng, factors, factor_p, n, missing=missing)
+    df['vehicle_type_code1'] = vehicle1
+    for col, missing in zip(['vehicle_type_code2', 'vehicle_type_code_3', 'vehicle_type_code_4', 'vehicle_type_code_5'], [0.2, 0.93, 0.98, 0.995]):
+        df[col] = categorical(rng, vehicles, vehicle_p, n, missing=missing)
+
+    df['collision_id'] = np.arange(3000000, 3000000 + n, dtype=np.int64)
+    return df[list(CRASH_SCHEMA.keys())]
+
+PERSON_TYPES = ['Occupant', 'Pedestrian', 'Bicyclist', 'Other Motorized']
+EJECTION = ['Not Ejected', 'Ejected', 'Partially Ejected', 'Trapped']
+SAFETY_EQUIPMENT = ['Lap Belt & Harness', 'Lap Belt', 'None', 'Unknown', 'Air Bag Deployed', 'Helmet (Motorcycle Only)', 'Child Restraint Only']
+
+def make_vehicles(crashes, seed=1, n_vehicle_types=300):
+    """nyc-vehicles rows for the collisions in crashes, 1 + Poisson(0.9) vehicles each, the columns joins.py reads plus unique_id."""
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(crashes['collision_id'].to_numpy(), 1 + rng.poisson(0.9, size=len(crashes)))
+    n = len(ids)
+    vehicles = zipf_vocab(VEHICLE_HEAD, n_vehicle_types, 'VEHICLE')
+    return pd.DataFrame({
+        'unique_id' : np.arange(n, dtype=np.int64) + 10000000,
+        'collision_id' : ids,
+        'vehicle_type' : categorical(rng, vehicles, zipf_probs(len(vehicles), 1.5), n, missing=0.01)
+    })
+
+def make_people(crashes, seed=2):
+    """nyc-people rows for the collisions in crashes, 1 + Poisson(1.5) people each with missing and junk ages like the real data."""
+    rng = np.random.default_rng(seed)
+    ids = np.repeat(crashes['collision_id'].to_numpy(), 1 + rng.poisson(1.5, size=len(crashes)))
+    n = len(ids)
+    age = np.clip(rng.normal(38, 16, size=n), 0, 99).round()
+    age[rng.random(n) < 0.12] = np.nan
+    age[rng.random(n) < 0.005] = 999
+    return pd.DataFrame({
+        'unique_id' : np.arange(n, dtype=np.int64) + 20000000,
+        'collision_id' : ids,
+        'person_type' : categorical(rng, PERSON_TYPES, [0.84, 0.1, 0.05, 0.01], n),
+        'person_age' : age,
+        'ejection' : categorical(rng, EJECTION, [0.983, 0.01, 0.005, 0.002], n, missing=0.08),
+        'safety_equipment' : categorical(rng, SAFETY_EQUIPMENT, [0.45, 0.1, 0.15, 0.2, 0.05, 0.03, 0.02], n, missing=0.3)
+    })
+
+def write_crashes(df, path):
+    """Writes df as csv (formatted like the Socrata export), feather or parquet depending on the extension of path."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.feather'):
+        df.to_feather(path, compression='uncompressed')
+    elif path.endswith('.parquet'):
+        df.to_parquet(path, index=False, compression='zstd')
+    else:
+        out = df.copy()
+        if 'crash_date' in out: # people and vehicle frames have none
+            out['crash_date'] = out['crash_date'].dt.strftime('%Y-%m-%dT%H:%M:%S.000')
+        table = pa.Table.from_pandas(out, preserve_index=False)
+        table = table.cast(pa.schema([pa.field(f.name, pa.string() if pa.types.is_dictionary(f.type) else f.type) for f in table.schema]))
+        pacsv.write_csv(table, path)
+    return path
@@ -0,0 +1,34 @@
+import argparse
+
+from src.config.config import DEFAULT_BUNDLE
+from src.data.cleaners import load_crash_data
+from src.features.build_features import CrashFeatureBuilder
+from src.pipeline.serving import load_bundle, serve, sweep_batch_windows
+
+def sample_records(n=1000, seed=0):
+    """Raw crash rows as the json records clients send, missing values as None."""
+    data = load_crash_data(columns=CrashFeatureBuilder.REQUIRED_COLUMNS)
+    data = data.sample(n=min(n, len(data)), random_state=seed).astype(object)
+    return data.where(data.notna(), None).to_dict('records')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve crash injury predictions over HTTP, or load test the server")
+    parser.add_argument('mode', choices=['serve', 'loadtest'])
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 1, 5, 20], help="loadtest: max_wait_ms values to compare")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args.bundle, host=args.host, port=args.port, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    else:
+        results = sweep_batch_windows(load_bundle(args.bundle), sample_records(), windows=args.windows,
+                                      n_requests=args.requests, concurrency=args.concurrency, max_batch=args.max_batch)
+        print(f"{'max_wait_ms':>12}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'mean batch':>12}")
+        for result in results:
+            print(f"{result['max_wait_ms']:>12g}{result['throughput']:>10.0f}{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['mean_batch']:>12.1f}")
@@ -1,9 +1,14 @@
+import os
 import pandas as pd
 import numpy as np
+from src.config.config import DEFAULT_BUNDLE
 from src.features.preprocessing import Preprocessing
+from src.models.artifact import save_artifact
 from src.models.linear_model import train_logistic
 
 if __name__ == "__main__":
     processor = Preprocessing('nyc-crashes', 'full_pipe')
-    X, Y = processor(as_df=False)
+    X, Y = processor(as_df=True)
     best_lr = train_logistic(dataset='nyc-crashes')
+    os.makedirs(os.path.dirname(DEFAULT_BUNDLE), exist_ok=True)
+    save_artifact(DEFAULT_BUNDLE, processor.feature_builder, X.columns, best_lr, params=best_lr.get_params()) # what scripts/predict.py serves
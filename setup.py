@@ -12,6 +12,7 @@ setup(
         'pyarrow', 
         'scipy', 
         'scikit-learn',
+        'threadpoolctl',
         'torch'
         # add more as needed
     ],
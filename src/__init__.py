@@ -1,6 +1,4 @@
-from .config import *
-from .data import *
-from .evaluation import *
-from .features import *
-from .models import *
-from .pipeline import *
\ No newline at end of file
+from src._lazy import attach
+
+# subpackages and their star exported names resolve on first use, see src/_lazy.py
+__getattr__, __dir__ = attach(__name__, ['config', 'data', 'evaluation', 'features', 'models', 'pipeline'])
@@ -0,0 +1,87 @@
+# src/_lazy.py
+import ast
+import importlib
+import os
+import sys
+import types
+
+def _module_names(path):
+    """Public names `from module import *` would export, read from the source without importing it."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == '__all__' for target in node.targets):
+            try:
+                return list(ast.literal_eval(node.value))
+            except ValueError:
+                pass
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            names.extend(target.id for target in node.targets if isinstance(target, ast.Name))
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            names.append(node.target.id)
+        elif isinstance(node, ast.Import):
+            names.extend(alias.asname or alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names.extend(alias.asname or alias.name for alias in node.names if alias.name != '*')
+    return [name for name in names if not name.startswith('_')]
+
+def attach(package_name, submodules):
+    """
+    Lazy stand-in for a package __init__ made of `from .sub import *` lines, used as
+
+        __getattr__, __dir__ = attach(__name__, ['sub_a', 'sub_b'])
+
+    Nothing is imported up front. The first access to a name imports the submodule that would have exported
+    it, later submodules winning like the star imports did, and submodule names resolve to the submodule.
+    Exported names are read from the submodule sources (subpackages are asked for their __all__).
+    """
+    package = sys.modules[package_name]
+    package_dir = os.path.dirname(package.__file__)
+    index = {}
+
+    def build_index():
+        for sub in submodules:
+            if os.path.isdir(os.path.join(package_dir, sub)):
+                names = importlib.import_module(f'{package_name}.{sub}').__all__
+            else:
+                names = _module_names(os.path.join(package_dir, f'{sub}.py'))
+            index.update((name, sub) for name in names)
+        return index
+
+    def __getattr__(name):
+        if name == '__all__': # star imports also exported the submodules themselves
+            return list(index or build_index()) + [sub for sub in submodules if sub not in index]
+        sub = (index or build_index()).get(name)
+        if sub is not None:
+            value = getattr(importlib.import_module(f'{package_name}.{sub}'), name)
+        elif name in submodules:
+            value = importlib.import_module(f'{package_name}.{name}')
+        else:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        setattr(package, name, value) # later lookups skip __getattr__
+        return value
+
+    def __dir__():
+        return sorted(set(vars(package)) | set(index or build_index()) | set(submodules))
+
+    return __getattr__, __dir__
+
+class LazyModule(types.ModuleType):
+    """Placeholder for a heavy third-party module, imported on first attribute access."""
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_target)
+        self.__dict__.update(module.__dict__) # later lookups are plain attribute reads
+        return getattr(module, attr)
+
+def lazy_module(name):
+    """`plt = lazy_module('matplotlib.pyplot')` in place of `import matplotlib.pyplot as plt` at module level."""
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -1 +1,3 @@
-from .config import *
\ No newline at end of file
+from src._lazy import attach
+
+__getattr__, __dir__ = attach(__name__, ['config'])
@@ -2,6 +2,91 @@ from typing import Set
 import pandas as pd
 import os
 
+# column types used by typed sinks (eg. parquet), columns not listed here are dropped
+# types: 'timestamp', 'category' (dictionary encoded), 'string', 'int8', 'int16', 'int32', 'int64', 'float32', 'float64'
+CRASH_SCHEMA = {
+    'crash_date' : 'timestamp', 
+    'crash_time' : 'category', 
+    'borough' : 'category', 
+    'zip_code' : 'category', 
+    'latitude' : 'float64', 
+    'longitude' : 'float64', 
+    'on_street_name' : 'category', 
+    'off_street_name' : 'category', 
+    'cross_street_name' : 'category', 
+    'number_of_persons_injured' : 'int8', 
+    'number_of_persons_killed' : 'int8', 
+    'number_of_pedestrians_injured' : 'int8', 
+    'number_of_pedestrians_killed' : 'int8', 
+    'number_of_cyclist_injured' : 'int8', 
+    'number_of_cyclist_killed' : 'int8', 
+    'number_of_motorist_injured' : 'int8', 
+    'number_of_motorist_killed' : 'int8', 
+    'contributing_factor_vehicle_1' : 'category', 
+    'contributing_factor_vehicle_2' : 'category', 
+    'contributing_factor_vehicle_3' : 'category', 
+    'contributing_factor_vehicle_4' : 'category', 
+    'contributing_factor_vehicle_5' : 'category', 
+    'collision_id' : 'int64', 
+    'vehicle_type_code1' : 'category', 
+    'vehicle_type_code2' : 'category', 
+    'vehicle_type_code_3' : 'category', 
+    'vehicle_type_code_4' : 'category', 
+    'vehicle_type_code_5' : 'category'
+}
+
+VEHICLE_SCHEMA = {
+    'unique_id' : 'int64', 
+    'collision_id' : 'int64', 
+    'crash_date' : 'timestamp', 
+    'crash_time' : 'category', 
+    'vehicle_id' : 'string', 
+    'state_registration' : 'category', 
+    'vehicle_type' : 'category', 
+    'vehicle_make' : 'category', 
+    'vehicle_model' : 'category', 
+    'vehicle_year' : 'int16', 
+    'travel_direction' : 'category', 
+    'vehicle_occupants' : 'int32', 
+    'driver_sex' : 'category', 
+    'driver_license_status' : 'category', 
+    'driver_license_jurisdiction' : 'category', 
+    'pre_crash' : 'category', 
+    'point_of_impact' : 'category', 
+    'vehicle_damage' : 'category', 
+    'vehicle_damage_1' : 'category', 
+    'vehicle_damage_2' : 'category', 
+    'vehicle_damage_3' : 'category', 
+    'public_property_damage' : 'category', 
+    'public_property_damage_type' : 'category', 
+    'contributing_factor_1' : 'category', 
+    'contributing_factor_2' : 'category'
+}
+
+PEOPLE_SCHEMA = {
+    'unique_id' : 'int64', 
+    'collision_id' : 'int64', 
+    'crash_date' : 'timestamp', 
+    'crash_time' : 'category', 
+    'person_id' : 'string', 
+    'person_type' : 'category', 
+    'person_injury' : 'category', 
+    'vehicle_id' : 'int64', 
+    'person_age' : 'int16', 
+    'ejection' : 'category', 
+    'emotional_status' : 'category', 
+    'bodily_injury' : 'category', 
+    'position_in_vehicle' : 'category', 
+    'safety_equipment' : 'category', 
+    'ped_location' : 'category', 
+    'ped_action' : 'category', 
+    'complaint' : 'category', 
+    'ped_role' : 'category', 
+    'contributing_factor_1' : 'category', 
+    'contributing_factor_2' : 'category', 
+    'person_sex' : 'category'
+}
+
 DATA_URL = {
     'nyc-vehicles' : {
         'url' : "https://data.cityofnewyork.us/resource/bm4k-52h4.json", 
@@ -11,6 +96,8 @@ DATA_URL = {
             '$limit': 10000
             }, 
         'downloader' : "csv",  
+        'schema' : VEHICLE_SCHEMA, 
+        'sync' : {'watermark' : 'crash_date', 'key' : 'unique_id', 'lookback_days' : 7}, # incremental sync settings, see src/data/sync.py
         'paths' : {'raw' : 'data/raw', 'processed' : 'data/processed', 'interim' : 'data/interim'}
     }, 
     'nyc-crashes' : {
@@ -21,6 +108,8 @@ DATA_URL = {
             '$limit': 10000
             }, 
         'downloader' : "csv",  
+        'schema' : CRASH_SCHEMA, 
+        'sync' : {'watermark' : 'crash_date', 'key' : 'collision_id', 'lookback_days' : 7},
         'paths' : {'raw' : 'data/raw', 'processed' : 'data/processed', 'interim' : 'data/interim'}
     }, 
     'nyc-people' : {
@@ -31,10 +120,39 @@ DATA_URL = {
             '$limit': 10000
             }, 
         'downloader' : "csv",  
+        'schema' : PEOPLE_SCHEMA, 
+        'sync' : {'watermark' : 'crash_date', 'key' : 'unique_id', 'lookback_days' : 7},
         'paths' : {'raw' : 'data/raw', 'processed' : 'data/processed', 'interim' : 'data/interim'}
     }
 }
 
+FETCH_CONFIG = { # defaults for paged fetching, a dataset can override any of these with a 'fetch' entry in DATA_URL
+    'page_size' : 50000, 
+    'max_workers' : 4, # number of pages in flight at once
+    'rate_limit' : 4.0, # max requests started per second across all workers, None to disable
+    'max_retries' : 5, 
+    'backoff' : 1.0, # seconds, doubled on every retry
+    'timeout' : 120 # seconds per request
+}
+
+CACHE_CONFIG = { # on-disk cache of Preprocessing outputs, see src/features/cache.py
+    'dir' : 'data/interim/cache', 
+    'max_bytes' : 4 * 2**30, # least recently used entries are evicted past this total size
+    'max_age_days' : 30 # entries unused for longer than this are evicted
+}
+
+RESULTS_CONFIG = { # memoized per (params, fold) cross validation results, see src/models/results.py
+    'dir' : 'data/interim/cv-results'
+}
+
+DEFAULT_BUNDLE = os.path.join(DATA_URL['nyc-crashes']['paths']['processed'], 'nyc-crashes-model') # model artifact scripts/train.py writes and scripts/predict.py serves, see src/models/artifact.py
+
+QUERY_CACHE_CONFIG = { # on-disk cache of loaders.query responses, see src/data/soql.py
+    'dir' : 'data/interim/query-cache',
+    'ttl_seconds' : 0, # entries older than this are revalidated with a conditional request before reuse, 0 revalidates every hit
+    'max_bytes' : 2 * 2**30 # least recently used entries are evicted past this total size
+}
+
 def get_data_master(name, field):
     assert isinstance(name, str), f"Dataset name is not a string but type {type(name)}."
     assert isinstance(field, str), f"field is not a string but type {type(field)}."
@@ -46,6 +164,23 @@ def get_data_url(name='nyc motor'):
 
     return DATA_URL.get(name).get('url', "")
 
+def get_fetch_config(name):
+    assert isinstance(name, str), f"Dataset name is not a string but type {type(name)}."
+
+    config = dict(FETCH_CONFIG)
+    config.update(DATA_URL.get(name, {}).get('fetch', {}))
+    return config
+
+def get_schema(name):
+    assert isinstance(name, str), f"Dataset name is not a string but type {type(name)}."
+
+    return DATA_URL.get(name).get('schema', {})
+
+def get_sync_config(name):
+    assert isinstance(name, str), f"Dataset name is not a string but type {type(name)}."
+
+    return DATA_URL.get(name).get('sync', {})
+
 def get_all_dataset_names() -> Set[str]:
     return set(DATA_URL.keys())
 
@@ -1,5 +1,3 @@
-from .clean_data import *
-from .cleaners import *
-from .load_data import *
-from .loaders import *
-from .load_helpers import *
\ No newline at end of file
+from src._lazy import attach
+
+__getattr__, __dir__ = attach(__name__, ['clean_data', 'cleaners', 'fetchers', 'joins', 'load_data', 'loaders', 'load_helpers', 'soql', 'sync'])
@@ -1,14 +1,132 @@
 # src/data/cleaners.py
 import os
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
-def load_crash_data():
-    path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data/raw/nyc-crashes.csv'))
-    return pd.read_csv(path)
+RAW_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data/raw'))
+CRASH_CSV = os.path.join(RAW_DIR, 'nyc-crashes.csv')
+
+def raw_sources(name):
+    """Raw copies of dataset name, columnar copies are preferred over the csv when present."""
+    return (
+        os.path.join(RAW_DIR, f'{name}.feather'),
+        os.path.join(RAW_DIR, f'{name}.parquet'),
+        os.path.join(RAW_DIR, name), # partitioned store written by src/data/sync.py
+        os.path.join(RAW_DIR, f'{name}.csv')
+    )
+
+CRASH_SOURCES = raw_sources('nyc-crashes')
+
+INJURED_COLUMNS = ['number_of_pedestrians_injured', 'number_of_cyclist_injured', 'number_of_motorist_injured']
+KILLED_COLUMNS = ['number_of_pedestrians_killed', 'number_of_cyclist_killed', 'number_of_motorist_killed']
+RESPONSE_COLUMNS = INJURED_COLUMNS + KILLED_COLUMNS
+
+CRASH_DTYPES = { # dtypes for the columns the pipelines read, anything else is left as parsed
+    'crash_date' : 'datetime64[ms]',
+    'crash_time' : 'category',
+    'borough' : 'category',
+    'zip_code' : 'category',
+    'on_street_name' : 'category',
+    'off_street_name' : 'category',
+    'cross_street_name' : 'category',
+    'vehicle_type_code1' : 'category',
+    'contributing_factor_vehicle_1' : 'category',
+    'collision_id' : 'int64',
+    **{col : 'int8' for col in RESPONSE_COLUMNS}
+}
+
+def find_source(name):
+    for path in raw_sources(name):
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No {name} data found, looked for {raw_sources(name)}")
+
+def find_crash_source():
+    return find_source('nyc-crashes')
+
+def apply_crash_dtypes(df):
+    return apply_dtypes(df, CRASH_DTYPES)
+
+def apply_dtypes(df, dtypes):
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype == 'int8': # counts, missing counts are treated as zero
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(np.int8)
+        elif dtype == 'Int64': # ids, missing or unparseable ones stay missing
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype.startswith('float'): # measurements, unparseable values become NaN
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype.startswith('datetime'):
+            df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce').astype(dtype)
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def load_crash_data(columns=None, path=None, legacy=False):
+    """
+    Loads nyc-crashes, optionally only the listed columns.
+
+    Reads the first of CRASH_SOURCES that exists unless path is given: Feather and Parquet copies are read memory
+    mapped, the csv with the pyarrow engine. Columns in CRASH_DTYPES come back typed (categoricals, int8 counts,
+    parsed dates). legacy=True is the old untyped pd.read_csv of every column, kept for comparison.
+    """
+    if legacy:
+        return pd.read_csv(path or CRASH_CSV)
+
+    path = path or find_crash_source()
+    columns = list(columns) if columns is not None else None
+    if path.endswith('.feather') or path.endswith('.arrow'):
+        df = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    elif path.endswith('.parquet') or os.path.isdir(path):
+        df = pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    else:
+        dtypes = {col : dtype for col, dtype in CRASH_DTYPES.items() if dtype == 'category' and (columns is None or col in columns)}
+        df = pd.read_csv(path, engine='pyarrow', usecols=columns, dtype=dtypes)
+    return apply_crash_dtypes(df)
+
+def iter_crash_chunks(columns=None, chunksize=500000, path=None):
+    """
+    Streams nyc-crashes in chunks of at most chunksize rows, typed like load_crash_data, so the full dataset
+    never has to fit in memory. Columnar sources are read batch by batch, the csv with pd.read_csv(chunksize=).
+    """
+    return iter_chunks(path or find_crash_source(), CRASH_DTYPES, columns=columns, chunksize=chunksize)
+
+def iter_chunks(path, dtypes, columns=None, chunksize=500000, csv_options=None):
+    """iter_crash_chunks for any raw copy (see raw_sources), typed with dtypes. csv_options go to pd.read_csv."""
+    columns = list(columns) if columns is not None else None
+    if path.endswith('.feather') or path.endswith('.arrow'):
+        table = feather.read_table(path, columns=columns, memory_map=True) # pages are only touched as slices are converted
+        for start in range(0, table.num_rows, chunksize):
+            yield apply_dtypes(table.slice(start, chunksize).to_pandas(), dtypes)
+    elif path.endswith('.parquet') or os.path.isdir(path):
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+            if batch.num_rows:
+                yield apply_dtypes(batch.to_pandas(), dtypes)
+    else:
+        categories = {col : dtype for col, dtype in dtypes.items() if dtype == 'category' and (columns is None or col in columns)}
+        for chunk in pd.read_csv(path, usecols=columns, dtype=categories, chunksize=chunksize, **(csv_options or {})):
+            yield apply_dtypes(chunk, dtypes)
+
+def write_crash_columnar(fmt='feather', path=None):
+    """One-off conversion of the raw csv into a typed columnar copy that load_crash_data picks up from then on."""
+    assert fmt in ('feather', 'parquet'), f"fmt must be 'feather' or 'parquet' but is {fmt}"
+    df = load_crash_data(path=path or CRASH_CSV)
+    output_path = os.path.join(RAW_DIR, f'nyc-crashes.{fmt}')
+    if fmt == 'feather':
+        df.to_feather(output_path, compression='uncompressed') # uncompressed so reads can be memory mapped
+    else:
+        df.to_parquet(output_path, index=False, compression='zstd')
+    print(f"Saved {len(df)} records to {output_path}")
+    return output_path
 
 def consolidate_response(data):
     copy = data.copy()
-    num_injured = copy['number_of_pedestrians_injured'] + copy['number_of_cyclist_injured'] + copy['number_of_motorist_injured']
-    num_killed = copy['number_of_pedestrians_killed'] + copy['number_of_cyclist_killed'] + copy['number_of_motorist_killed']
+    num_injured = copy[INJURED_COLUMNS].sum(axis=1, skipna=False) # sum upcasts so int8 counts can't overflow
+    num_killed = copy[KILLED_COLUMNS].sum(axis=1, skipna=False)
     copy['Y'] = ((num_injured >= 1) | (num_killed >= 1)).astype(int)
     return copy
@@ -0,0 +1,129 @@
+# src/data/fetchers.py
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.pipeline.profiling import span
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class FetchError(RuntimeError):
+    pass
+
+class RateLimiter:
+    """Spaces out request starts so that at most `rate` requests begin per second across all threads."""
+    def __init__(self, rate=None):
+        assert rate is None or rate > 0, f"rate must be positive or None but is {rate}"
+        self.interval = 0.0 if rate is None else 1.0 / rate
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def make_session(pool_size=4):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size) # keep-alive connections shared across workers
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def _retry_delay(response, attempt, backoff):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return backoff * (2 ** attempt) * (1 + random.random() * 0.1) # jitter so workers don't retry in lockstep
+
+def get_with_retry(session, url, params, limiter=None, max_retries=5, backoff=1.0, timeout=120, headers=None):
+    """
+    GET url, retrying with exponential backoff on 429/5xx responses and connection errors. With conditional
+    headers (If-None-Match / If-Modified-Since) a 304 Not Modified is returned as well.
+    """
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        response = None
+        try:
+            response = session.get(url, params=params, timeout=timeout, headers=headers)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise FetchError(f"Request to {url} failed after {max_retries} retries: {e}") from e
+        else:
+            if response.status_code == 200 or (response.status_code == 304 and headers):
+                return response
+            if response.status_code not in RETRY_STATUS:
+                raise FetchError(f"Request to {url} failed with status {response.status_code}: {response.text[:200]}")
+            if attempt == max_retries:
+                raise FetchError(f"Request to {url} still failing with status {response.status_code} after {max_retries} retries")
+        time.sleep(_retry_delay(response, attempt, backoff))
+
+def fetch_pages(url, params=None, page_size=50000, max_workers=4, rate_limit=4.0, max_retries=5, backoff=1.0, timeout=120, session=None, verbose=True):
+    """
+    Generator over the pages of a Socrata resource, yielded in offset order as lists of row dicts.
+
+    Up to max_workers pages are requested at once over a shared keep-alive session. Since the
+    total row count isn't known up front, pages are issued in a sliding window and fetching stops
+    at the first page that comes back short.
+    """
+    assert isinstance(page_size, int) and page_size > 0, f"page_size must be a positive int but is {page_size}"
+    assert isinstance(max_workers, int) and max_workers > 0, f"max_workers must be a positive int but is {max_workers}"
+
+    base_params = dict(params or {})
+    base_params.pop('$limit', None)
+    base_params.pop('$offset', None)
+    base_params.setdefault('$order', ':id') # paging is only stable under a fixed ordering
+
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_workers)
+    limiter = RateLimiter(rate_limit)
+
+    def fetch(page):
+        page_params = dict(base_params)
+        page_params['$limit'] = page_size
+        page_params['$offset'] = page * page_size
+        if verbose:
+            print(f"Fetching rows {page * page_size} to {(page + 1) * page_size - 1}...")
+        with span('fetch.page', page=page):
+            response = get_with_retry(session, url, page_params, limiter=limiter, max_retries=max_retries, backoff=backoff, timeout=timeout)
+            return response.json()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        in_flight = {}
+        next_page = 0
+        done = False
+        while True:
+            while not done and len(in_flight) < max_workers:
+                in_flight[next_page] = executor.submit(fetch, next_page)
+                next_page += 1
+            if not in_flight:
+                break
+
+            page = min(in_flight)
+            batch = in_flight.pop(page).result()
+            if len(batch) < page_size: # last page, later pages already in flight are empty
+                done = True
+                for future in in_flight.values():
+                    future.cancel()
+                in_flight.clear()
+            if batch:
+                yield batch
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if own_session:
+            session.close()
@@ -0,0 +1,147 @@
+# src/data/joins.py
+"""
+Per collision aggregates of nyc-people and nyc-vehicles, attached to nyc-crashes as extra columns.
+
+Both tables are streamed in chunks and reduced straight into arrays indexed by the position of each
+collision_id among the sorted crash ids (np.searchsorted), so memory scales with the number of crashes,
+never with the number of people or vehicles, and no merge materializes the people x vehicles product.
+
+    aggregates = CollisionAggregates.build()  # crash ids, then one pass over each table
+    crashes = aggregates.attach(crashes)      # adds JOIN_FEATURES
+"""
+import numpy as np
+import pandas as pd
+
+from src.data.cleaners import find_source, iter_chunks, load_crash_data
+from src.pipeline.profiling import span
+
+PEOPLE_DTYPES = { # collision_id nullable, rows without one are skipped instead of failing the int64 cast
+    'collision_id' : 'Int64',
+    'person_type' : 'category',
+    'person_age' : 'float32',
+    'ejection' : 'category',
+    'safety_equipment' : 'category'
+}
+VEHICLE_DTYPES = {
+    'collision_id' : 'Int64',
+    'vehicle_type' : 'category'
+}
+
+PEOPLE_FLAGS = { # count column -> lower cased labels of the source column that count, matched case insensitively
+    'people_occupants' : ('person_type', {'occupant'}),
+    'people_pedestrians' : ('person_type', {'pedestrian'}),
+    'people_cyclists' : ('person_type', {'bicyclist'}),
+    'people_ejected' : ('ejection', {'ejected', 'partially ejected'}),
+    'people_no_safety_equipment' : ('safety_equipment', {'none'})
+}
+VEHICLE_GROUPS = { # older and newer labels of the same kind of vehicle are counted together
+    'vehicles_car' : {'sedan', 'passenger vehicle', '4 dr sedan', '2 dr sedan', 'convertible'},
+    'vehicles_suv' : {'station wagon/sport utility vehicle', 'sport utility / station wagon'},
+    'vehicles_taxi' : {'taxi'},
+    'vehicles_truck' : {'pick-up truck', 'box truck', 'tractor truck diesel', 'dump', 'flat bed', 'garbage or refuse',
+                        'large com veh(6 or more tires)', 'small com veh(4 tires)', 'van'},
+    'vehicles_bus' : {'bus'},
+    'vehicles_two_wheeler' : {'bike', 'bicycle', 'e-bike', 'e-scooter', 'motorcycle', 'moped', 'motorscooter'}
+}
+PEOPLE_CSV_OPTIONS = {'keep_default_na' : False, 'na_values' : ['']} # 'None' is a safety_equipment value, not a missing one
+MAX_AGE = 110 # person_age outside [0, MAX_AGE] is an entry error and, like a missing age, left out of the age stats
+
+PEOPLE_FEATURES = ['people_count', *PEOPLE_FLAGS, 'people_age_mean', 'people_age_min', 'people_age_max']
+VEHICLE_FEATURES = ['vehicles_count', *VEHICLE_GROUPS]
+JOIN_FEATURES = PEOPLE_FEATURES + VEHICLE_FEATURES
+
+def label_mask(values, labels):
+    """Rows whose label, lower cased, is in labels. Categoricals are matched once per category."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        hit = np.append(pd.Index(values.cat.categories.astype(str)).str.lower().isin(labels), False) # code -1 (missing) picks the trailing False
+        return hit[values.cat.codes.to_numpy()]
+    return values.astype(str).str.lower().isin(labels).to_numpy()
+
+class CollisionAggregates:
+    """
+    Aggregates keyed by the sorted, deduplicated crash collision ids. add_people/add_vehicles consume chunk
+    iterators, rows of collisions that aren't among the keys (or have no collision_id) are dropped. Counts are
+    int32, ages float32 and computed over the known ages only.
+    """
+    def __init__(self, keys):
+        keys = pd.Series(keys).dropna().to_numpy(dtype=np.int64)
+        keys = np.sort(keys) # cheaper than np.unique's hashing, crash ids usually come sorted already
+        self.keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+        self.columns = {}
+
+    def positions(self, ids):
+        """Position of every id in keys and a mask of the ids found there, missing ids are never found."""
+        ids = pd.Series(ids)
+        known = ids.notna().to_numpy()
+        ids = ids.to_numpy(dtype=np.int64, na_value=0)
+        pos = np.minimum(np.searchsorted(self.keys, ids), max(len(self.keys) - 1, 0))
+        found = (self.keys[pos] == ids) & known if len(self.keys) else np.zeros(len(ids), dtype=bool)
+        return pos, found
+
+    def add_people(self, chunks):
+        n = len(self.keys)
+        counts = {name : np.zeros(n, dtype=np.int64) for name in ['people_count', *PEOPLE_FLAGS]}
+        age_sum, age_count = np.zeros(n), np.zeros(n, dtype=np.int64)
+        age_min, age_max = np.full(n, np.inf), np.full(n, -np.inf)
+        for chunk in chunks:
+            pos, found = self.positions(chunk['collision_id'])
+            counts['people_count'] += np.bincount(pos[found], minlength=n)
+            for name, (col, labels) in PEOPLE_FLAGS.items():
+                counts[name] += np.bincount(pos[found & label_mask(chunk[col], labels)], minlength=n)
+            age = chunk['person_age'].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = found & ~np.isnan(age) & (age >= 0) & (age <= MAX_AGE) # missing ages add to neither the sums nor the counts
+            age_sum += np.bincount(pos[valid], weights=age[valid], minlength=n)
+            age_count += np.bincount(pos[valid], minlength=n)
+            np.minimum.at(age_min, pos[valid], age[valid])
+            np.maximum.at(age_max, pos[valid], age[valid])
+        self.columns.update({name : values.astype(np.int32) for name, values in counts.items()})
+        aged = age_count > 0
+        self.columns['people_age_mean'] = np.where(aged, age_sum / np.maximum(age_count, 1), np.nan).astype(np.float32)
+        self.columns['people_age_min'] = np.where(aged, age_min, np.nan).astype(np.float32)
+        self.columns['people_age_max'] = np.where(aged, age_max, np.nan).astype(np.float32)
+        return self
+
+    def add_vehicles(self, chunks):
+        n = len(self.keys)
+        counts = {name : np.zeros(n, dtype=np.int64) for name in VEHICLE_FEATURES}
+        for chunk in chunks:
+            pos, found = self.positions(chunk['collision_id'])
+            counts['vehicles_count'] += np.bincount(pos[found], minlength=n)
+            for name, labels in VEHICLE_GROUPS.items():
+                counts[name] += np.bincount(pos[found & label_mask(chunk['vehicle_type'], labels)], minlength=n)
+        self.columns.update({name : values.astype(np.int32) for name, values in counts.items()})
+        return self
+
+    @classmethod
+    def build(cls, crash_ids=None, people=True, vehicles=True, chunksize=500000, people_path=None, vehicles_path=None):
+        """
+        Streams nyc-people and/or nyc-vehicles from their raw copies (see cleaners.raw_sources) unless paths are
+        given. crash_ids defaults to every nyc-crashes collision_id.
+        """
+        if crash_ids is None:
+            crash_ids = load_crash_data(columns=['collision_id'])['collision_id'].to_numpy()
+        aggregates = cls(crash_ids)
+        if people:
+            with span('join.people'):
+                chunks = iter_chunks(people_path or find_source('nyc-people'), PEOPLE_DTYPES, columns=list(PEOPLE_DTYPES), chunksize=chunksize,
+                                     csv_options=PEOPLE_CSV_OPTIONS)
+                aggregates.add_people(chunks)
+        if vehicles:
+            with span('join.vehicles'):
+                chunks = iter_chunks(vehicles_path or find_source('nyc-vehicles'), VEHICLE_DTYPES, columns=list(VEHICLE_DTYPES), chunksize=chunksize)
+                aggregates.add_vehicles(chunks)
+        return aggregates
+
+    def attach(self, data, columns=None):
+        """
+        data with the aggregate columns of each row's collision_id added. Crashes without any people or
+        vehicle rows get zero counts and NaN ages.
+        """
+        columns = list(self.columns) if columns is None else list(columns)
+        with span('join.attach', rows=len(data)):
+            pos, found = self.positions(data['collision_id'])
+            added = {}
+            for name in columns:
+                values = self.columns[name]
+                added[name] = np.where(found, values[pos], np.nan if values.dtype.kind == 'f' else 0).astype(values.dtype)
+            return data.assign(**added)
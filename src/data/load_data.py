@@ -1,8 +1,10 @@
 import pandas as pd
 
 from src.data.loaders import load_data 
+from src.data.sync import sync_dataset
 
 if __name__ == '__main__':
+    SYNC = False # incremental refresh into data/raw/<name>/year=/month=, only fetches rows past the stored watermark
     ALL = True
     DEFAULT = True
     CUSTOM = False
@@ -14,7 +16,9 @@ if __name__ == '__main__':
     
     NAME = 'nyc-people'
     
-    if ALL:
+    if SYNC:
+        sync_dataset(name=NAME)
+    elif ALL:
         load_data(name=NAME, fetchall=True, params=None)
     elif DEFAULT:
         load_data(name=NAME, fetchall=False, params=None)
@@ -1,24 +1,101 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 
-from src.config.config import get_output_path
+from src.config.config import get_output_path, get_schema
+
+ARROW_TYPES = {
+    'timestamp' : pa.timestamp('ms'),
+    'category' : pa.dictionary(pa.int32(), pa.string()),
+    'string' : pa.string(),
+    'int8' : pa.int8(),
+    'int16' : pa.int16(),
+    'int32' : pa.int32(),
+    'int64' : pa.int64(),
+    'float32' : pa.float32(),
+    'float64' : pa.float64()
+}
+
+NULLABLE_INTS = {'int8' : 'Int8', 'int16' : 'Int16', 'int32' : 'Int32', 'int64' : 'Int64'}
+
+def get_raw_dir(name):
+    path = get_output_path(name, 'raw') # CIRCULAR DEPENENCY
+    output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', path))
+    os.makedirs(output_dir, exist_ok=True)  # ensure the output dir exists
+    return output_dir
+
+def build_arrow_schema(name):
+    schema = get_schema(name)
+    assert schema, f"No schema configured for dataset {name}"
+    return pa.schema([(col, ARROW_TYPES[dtype]) for col, dtype in schema.items()])
+
+def coerce_page(name, page):
+    """Turns a page of Socrata row dicts (every value a string) into a DataFrame typed per the dataset schema."""
+    schema = get_schema(name)
+    df = pd.DataFrame.from_records(page, columns=list(schema.keys())) # fields missing from every row come back as all null columns
+    for col, dtype in schema.items():
+        if dtype == 'timestamp':
+            df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce')
+        elif dtype in NULLABLE_INTS:
+            values = pd.to_numeric(df[col], errors='coerce').round()
+            bounds = np.iinfo(dtype)
+            out_of_range = (values < bounds.min) | (values > bounds.max)
+            if out_of_range.any():
+                print(f"Nulling {int(out_of_range.sum())} values of {col} outside the {dtype} range")
+                values = values.mask(out_of_range)
+            df[col] = values.astype(NULLABLE_INTS[dtype])
+        elif dtype in ('float32', 'float64'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        else:
+            df[col] = df[col].astype('string')
+    return df
+
+def page_to_table(name, page, schema=None):
+    schema = build_arrow_schema(name) if schema is None else schema
+    return pa.Table.from_pandas(coerce_page(name, page), schema=schema, preserve_index=False)
 
 def download_csv(name, data, rtrn=False):
     df = pd.DataFrame(data)
     if rtrn:
         return df
     else:
-        path = get_output_path(name, 'raw') # CIRCULAR DEPENENCY
-        output_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', path))
-        os.makedirs(output_dir, exist_ok=True)  # ensure the output dir exists
-
-        output_path = os.path.join(output_dir, f'{name}.csv')
+        output_path = os.path.join(get_raw_dir(name), f'{name}.csv')
         df.to_csv(output_path, index=False)
         print(f"Saved {len(data)} records to {output_path}")
 
+def download_parquet(name, pages, rtrn=False):
+    """
+    Streams an iterable of pages (lists of row dicts) into a typed parquet file, one row group per page,
+    so only a single page is ever held in memory. Written to a temp file and renamed once complete.
+    """
+    schema = build_arrow_schema(name)
+    if rtrn:
+        tables = [page_to_table(name, page, schema) for page in pages]
+        if not tables:
+            return schema.empty_table().to_pandas()
+        return pa.concat_tables(tables).to_pandas()
+
+    output_path = os.path.join(get_raw_dir(name), f'{name}.parquet')
+    tmp_path = output_path + '.tmp'
+    total = 0
+    with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+        for page in pages:
+            writer.write_table(page_to_table(name, page, schema))
+            total += len(page)
+    os.replace(tmp_path, output_path)
+    print(f"Saved {total} records to {output_path}")
+
 DOWNLOADERS = {
-    'csv' : download_csv
+    'csv' : download_csv,
+    'parquet' : download_parquet
 }
 
+STREAMING_DOWNLOADERS = {'parquet'} # take an iterable of pages instead of one list of rows
+
 def get_downloader(key):
-    return DOWNLOADERS.get(key)
\ No newline at end of file
+    return DOWNLOADERS.get(key)
+
+def is_streaming(key):
+    return key in STREAMING_DOWNLOADERS
@@ -1,53 +1,48 @@
 import requests
-import time
 from typing import LiteralString
 import pandas as pd
 
-from src.config.config import get_all_dataset_names, get_data_master
-from src.data.load_helpers import get_downloader
+from src.config.config import get_all_dataset_names, get_data_master, get_fetch_config
+from src.data.fetchers import fetch_pages, get_with_retry, make_session
+from src.data.load_helpers import get_downloader, is_streaming
+from src.data.soql import ResponseCache, pipeline_query, plan_query
+from src.pipeline.profiling import span
 
-def load_data(name, fetchall=False, params=None, rtrn=False):
-    URL = get_data_master(name, 'url')
-    downloader_key = get_data_master(name, 'downloader')
+def load_data(name, fetchall=False, params=None, rtrn=False, url=None, downloader=None, **fetch_kwargs):
+    """
+    Downloads dataset `name` with its registered downloader.
+
+    fetchall pages through the whole resource concurrently, fetch settings default to get_fetch_config(name)
+    and can be overridden through fetch_kwargs (page_size, max_workers, rate_limit, max_retries, backoff, timeout).
+    url overrides the configured resource url, eg. to point at a local stub server.
+    downloader overrides the configured downloader key, eg. 'parquet' to stream pages into a typed parquet file.
+    """
+    URL = url or get_data_master(name, 'url')
+    downloader_key = downloader or get_data_master(name, 'downloader')
     downloader = get_downloader(downloader_key)
     if downloader is None:
         raise ValueError(f"No downloader registered for key: {downloader_key}")
     
     if fetchall:
         print("Fetching all rows...")
-        URL = get_data_master(name, 'url')
-        LIMIT = 50000
-        offset = 0
-        data = []
-        while True:
-            print(f"Fetching rows {offset} to {offset + LIMIT - 1}...")
-
-            params = {
-                "$limit": LIMIT,
-                "$offset": offset
-            }
-
-            response = requests.get(URL, params=params)
-
-            if response.status_code != 200:
-                print(f"Request failed at offset {offset}: {response.status_code}")
-                break
+        fetch_config = get_fetch_config(name)
+        fetch_config.update(fetch_kwargs)
 
-            batch = response.json()
+        if is_streaming(downloader_key): # pages go straight to the sink, never collected into one list
+            with span('load_data.fetch', dataset=name, downloader=downloader_key):
+                return downloader(name, fetch_pages(URL, params=params, **fetch_config), rtrn=rtrn)
 
-            if not batch:
-                print("No more data available.")
-                break
-
-            data.extend(batch)
-            offset += LIMIT
-            time.sleep(1)  # Respectful pause to avoid rate-limiting
+        data = []
+        with span('load_data.fetch', dataset=name, downloader=downloader_key):
+            for batch in fetch_pages(URL, params=params, **fetch_config):
+                data.extend(batch)
         
         print(f"Total rows fetched: {len(data)}")
-        if rtrn:
-            return downloader(name, data, rtrn=True) # loads data into current working directory
-        else:
-            downloader(name, data, rtrn=False)
+        with span('load_data.download', rows=len(data)):
+            if rtrn:
+                return downloader(name, data, rtrn=True) # loads data into current working directory
+            else:
+                downloader(name, data, rtrn=False)
     else:
         if params is None:
             params = get_data_master(name, 'params')
@@ -60,6 +55,8 @@ def load_data(name, fetchall=False, params=None, rtrn=False):
         if response.status_code == 200:
             data = response.json()
             print(f"Total rows fetched: {len(data)}")
+            if is_streaming(downloader_key):
+                return downloader(name, [data], rtrn=rtrn)
             if rtrn:
                 return downloader(name, data, rtrn=True) # loads data into current working directory
             else:
@@ -67,23 +64,43 @@ def load_data(name, fetchall=False, params=None, rtrn=False):
         else:
             print("Request failed:", response.status_code)
 
-def query(name: LiteralString, select: str = "*", where: str = "1=1", limit: int = 1000, write: bool = True) -> pd.DataFrame:
-    """Uses SoQL"""
+def query(name: LiteralString, select="*", where="1=1", limit: int = 1000, write: bool = True, group=None, order=None, pipeline=None,
+          url=None, use_cache: bool = True, ttl=None, cache=None) -> pd.DataFrame:
+    """
+    Uses SoQL, planned by src/data/soql.py so projection, filters and aggregation run on the server.
+
+    select and where take a SoQL string or a list of columns / predicates (predicates are ANDed), group the
+    $group columns of an aggregating select. pipeline, a Preprocessing, selects just the raw columns its
+    pipelines read under the dataset's configured $where, ANDed with where.
+    Responses are kept in the local ResponseCache and, by default (QUERY_CACHE_CONFIG ttl 0), revalidated with a
+    conditional request on every call, so unchanged data costs a 304 instead of the rows. ttl > 0 serves entries
+    younger than ttl seconds without asking the server, use_cache=False always refetches.
+    """
     assert isinstance(name, str), f"dataset_name arg must be a string but is type {type(name)}"
     assert name in get_all_dataset_names(), f"dataset_name not found, existing dataset names include {get_all_dataset_names()}"
 
-    assert isinstance(select, str), f"select arg must be a string but is type {type(select)}"
-    assert isinstance(where, str), f"where arg must be a string but is type {type(where)}"
+    assert isinstance(select, (str, list, tuple)), f"select arg must be a string or list but is type {type(select)}"
+    assert isinstance(where, (str, list, tuple)), f"where arg must be a string or list but is type {type(where)}"
     assert isinstance(limit, int), f"limit arg must be a int but is type {type(limit)}"
     assert isinstance(write, bool), f"write arg must be a booleam but is type {type(write)}"
 
-    params = {
-        "$select": select,
-        "$where": where,
-        "$limit": limit
-    }
-
-    df = load_data(name=name, fetchall=False, params=params, rtrn=True)
-    return df
-
+    if pipeline is not None:
+        assert pipeline.dataset == name, f"pipeline is for {pipeline.dataset}, not {name}"
+        assert select == "*" and group is None, "pipeline picks the columns itself, don't pass select or group with it"
+        params = pipeline_query(pipeline, where=where, limit=limit)
+    else:
+        params = plan_query(name, select=select, where=where, group=group, order=order, limit=limit)
+    URL = url or get_data_master(name, 'url')
 
+    with span('query', dataset=name, cached=use_cache):
+        if use_cache:
+            cache = cache or ResponseCache(ttl=ttl)
+            data = cache.get(URL, params)
+        else:
+            session = make_session(pool_size=1)
+            try:
+                data = get_with_retry(session, URL, params).json()
+            finally:
+                session.close()
+    print(f"Total rows fetched: {len(data)}")
+    return pd.DataFrame(data)
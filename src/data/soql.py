@@ -0,0 +1,198 @@
+# src/data/soql.py
+"""
+SoQL query planning and a local cache of Socrata responses.
+
+plan_query turns the columns, filters and groupings a caller needs into SoQL parameters so projection,
+filtering and aggregation happen on the server, pipeline_query plans what a Preprocessing pipeline reads.
+ResponseCache keeps gzip compressed response bodies on disk keyed by the normalized query and revalidates
+them with If-None-Match / If-Modified-Since, a 304 only renews them. The default TTL is 0 so every read asks
+the server; a positive TTL serves younger entries without a request, for data known not to move that fast.
+
+    params = pipeline_query(Preprocessing('nyc-crashes', 'full_pipe'), where="borough IS NOT NULL")
+    rows = ResponseCache().get(get_data_url('nyc-crashes'), params)
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+
+from src.config.config import QUERY_CACHE_CONFIG, get_data_master, get_schema
+from src.data.fetchers import get_with_retry, make_session
+from src.pipeline.profiling import span
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')") # SoQL strings are single quoted, '' escapes a quote
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def normalize_expr(expr):
+    """Whitespace collapsed outside string literals, so formatting differences don't split the cache."""
+    parts = STRING_LITERAL.split(str(expr).strip())
+    for i in range(0, len(parts), 2): # even parts are outside literals
+        part = re.sub(r'\s+', ' ', parts[i])
+        part = re.sub(r'\(\s+', '(', re.sub(r'\s+\)', ')', part))
+        parts[i] = re.sub(r'\s*,\s*', ', ', part)
+    return ''.join(parts).strip()
+
+def combine_where(predicates):
+    """AND of the predicates, deduplicated and sorted so the same filters always give the same $where."""
+    if isinstance(predicates, str):
+        predicates = [predicates]
+    predicates = sorted({normalize_expr(p) for p in predicates or [] if normalize_expr(p) not in ('', '1=1', '1 = 1')})
+    if len(predicates) <= 1:
+        return predicates[0] if predicates else None
+    return ' AND '.join(f'({p})' for p in predicates)
+
+def plan_query(name, select=None, where=None, group=None, order=None, limit=None, offset=None, default_where=False):
+    """
+    SoQL parameters for dataset name. select is a raw $select string or a list of columns and expressions
+    (eg. 'count(*) AS crashes'), plain column names are checked against the dataset schema. where is a
+    predicate or a list of them, ANDed together with the configured $where when default_where is set.
+    group lists the $group columns of an aggregating select.
+    """
+    schema = get_schema(name)
+    if select is None or isinstance(select, str):
+        select_expr = normalize_expr(select or '*')
+    else:
+        unknown = [col for col in select if IDENTIFIER.match(col) and schema and col not in schema]
+        assert not unknown, f"Columns {unknown} not in the {name} schema"
+        select_expr = ', '.join(normalize_expr(col) for col in select)
+
+    predicates = [where] if isinstance(where, str) else list(where or [])
+    if default_where:
+        predicates.append((get_data_master(name, 'params') or {}).get('$where', ''))
+
+    params = {'$select' : select_expr}
+    combined = combine_where(predicates)
+    if combined:
+        params['$where'] = combined
+    if group:
+        group = [group] if isinstance(group, str) else list(group)
+        missing = [col for col in group if col not in select_expr]
+        assert not missing, f"$group columns {missing} must also be selected"
+        params['$group'] = ', '.join(normalize_expr(col) for col in group)
+    if order:
+        params['$order'] = normalize_expr(order)
+    if limit is not None:
+        params['$limit'] = int(limit)
+    if offset:
+        params['$offset'] = int(offset)
+    return params
+
+def pipeline_query(preprocessing, where=None, limit=None):
+    """Only the raw columns preprocessing's pipelines read, under the dataset's configured $where and any extra predicates."""
+    return plan_query(preprocessing.dataset, select=preprocessing.CRASH_columns(), where=where, limit=limit, default_where=True)
+
+def query_key(url, params):
+    """Cache key of a request, params are normalized by plan_query so equal queries hash equally."""
+    return hashlib.sha256(json.dumps({'url' : url, 'params' : {key : str(value) for key, value in params.items()}}, sort_keys=True).encode()).hexdigest()[:32]
+
+class ResponseCache:
+    """
+    Socrata responses as <key>.json.gz with a <key>.meta.json holding the query, fetch time and validators.
+    stats counts how each get was served: 'hit' (fresh), 'revalidated' (304), 'miss' (fetched).
+    Entries past max_bytes are evicted least recently used first.
+    """
+    def __init__(self, cache_dir=None, ttl=None, max_bytes=None, session=None):
+        self.cache_dir = cache_dir or os.path.join(ROOT_DIR, QUERY_CACHE_CONFIG['dir'])
+        self.ttl = QUERY_CACHE_CONFIG['ttl_seconds'] if ttl is None else ttl
+        self.max_bytes = QUERY_CACHE_CONFIG['max_bytes'] if max_bytes is None else max_bytes
+        self.session = session
+        self.stats = {'hit' : 0, 'revalidated' : 0, 'miss' : 0}
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json.gz'), os.path.join(self.cache_dir, f'{key}.meta.json')
+
+    def _read_meta(self, key):
+        try:
+            with open(self._paths(key)[1]) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, key, meta):
+        path = self._paths(key)[1]
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def _read_body(self, key):
+        with gzip.open(self._paths(key)[0], 'rb') as f:
+            return json.loads(f.read())
+
+    def get(self, url, params, ttl=None, timeout=120, max_retries=5, backoff=1.0):
+        """Rows of GET url?params, from the cache while fresh, revalidated once older than ttl seconds."""
+        ttl = self.ttl if ttl is None else ttl
+        key = query_key(url, params)
+        meta = self._read_meta(key)
+        now = time.time()
+        if meta is not None and os.path.exists(self._paths(key)[0]):
+            if now - meta['fetched'] < ttl:
+                self.stats['hit'] += 1
+                meta['last_used'] = now
+                self._write_meta(key, meta)
+                with span('query.cache_hit'):
+                    return self._read_body(key)
+            headers = {}
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        else:
+            meta, headers = None, {}
+
+        session = self.session or make_session(pool_size=1)
+        try:
+            with span('query.fetch', conditional=bool(headers)):
+                response = get_with_retry(session, url, params, max_retries=max_retries, backoff=backoff, timeout=timeout, headers=headers or None)
+        finally:
+            if self.session is None:
+                session.close()
+        if response.status_code == 304:
+            self.stats['revalidated'] += 1
+            meta.update(fetched=now, last_used=now)
+            self._write_meta(key, meta)
+            return self._read_body(key)
+
+        self.stats['miss'] += 1
+        os.makedirs(self.cache_dir, exist_ok=True)
+        body_path = self._paths(key)[0]
+        with gzip.open(body_path + '.tmp', 'wb', compresslevel=6) as f:
+            f.write(response.content)
+        os.replace(body_path + '.tmp', body_path)
+        rows = response.json()
+        self._write_meta(key, {
+            'key' : key, 'url' : url, 'params' : {k : str(v) for k, v in params.items()}, 'fetched' : now, 'last_used' : now,
+            'etag' : response.headers.get('ETag'), 'last_modified' : response.headers.get('Last-Modified'),
+            'rows' : len(rows), 'bytes' : os.path.getsize(body_path), 'raw_bytes' : len(response.content)
+        })
+        self.evict(keep=key)
+        return rows
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        metas = (self._read_meta(name[:-len('.meta.json')]) for name in os.listdir(self.cache_dir) if name.endswith('.meta.json'))
+        return [meta for meta in metas if meta is not None]
+
+    def remove(self, key):
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = sum(meta['bytes'] for meta in entries)
+        for meta in sorted(entries, key=lambda meta: meta['last_used']):
+            if total <= self.max_bytes:
+                break
+            if meta['key'] != keep:
+                self.remove(meta['key'])
+                total -= meta['bytes']
+
+    def clear(self):
+        for meta in self.entries():
+            self.remove(meta['key'])
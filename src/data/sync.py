@@ -0,0 +1,160 @@
+# src/data/sync.py
+import glob
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config.config import get_data_master, get_fetch_config, get_sync_config
+from src.data.fetchers import fetch_pages
+from src.data.load_helpers import build_arrow_schema, coerce_page, get_raw_dir
+
+STATE_FILE = '_sync_state.json'
+SOQL_TIMESTAMP = '%Y-%m-%dT%H:%M:%S.000'
+
+def get_store_dir(name):
+    """Partitioned store for a dataset: data/raw/<name>/year=YYYY/month=MM/part-0.parquet"""
+    return os.path.join(get_raw_dir(name), name)
+
+def read_state(name):
+    path = os.path.join(get_store_dir(name), STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_state(name, state):
+    store_dir = get_store_dir(name)
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def partition_path(name, year, month):
+    return os.path.join(get_store_dir(name), f'year={year}', f'month={month:02d}', 'part-0.parquet')
+
+def write_partition(path, rows, schema):
+    table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+def upsert_partition(path, new_rows, key, schema):
+    """Merges new_rows into the partition file at path, rows from new_rows win on duplicate keys."""
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=schema).to_pandas()
+        merged = pd.concat([existing, new_rows], ignore_index=True)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        merged = new_rows
+    merged = merged.drop_duplicates(subset=key, keep='last').sort_values(key)
+    write_partition(path, merged, schema)
+    return len(merged)
+
+def drop_moved_rows(name, written, key, schema):
+    """
+    Removes the older copies of rows whose watermark value moved them to another month. written maps the
+    keys upserted this sync to their year * 100 + month partition, every other partition holding one of those
+    keys loses that row. Only the key column is read from partitions that hold none of them.
+    """
+    moved = 0
+    for path in glob.glob(os.path.join(get_store_dir(name), 'year=*', 'month=*', 'part-0.parquet')):
+        year, month = (int(part.split('=')[1]) for part in path.split(os.sep)[-3:-1])
+        stored = pq.read_table(path, columns=[key]).column(key).to_pandas()
+        owner = written.reindex(stored.to_numpy())
+        if not (owner.notna() & (owner.to_numpy() != year * 100 + month)).any():
+            continue
+        rows = pq.read_table(path, schema=schema).to_pandas()
+        owner = written.reindex(rows[key].to_numpy()).to_numpy()
+        stale = ~pd.isna(owner) & (owner != year * 100 + month)
+        moved += int(stale.sum())
+        if stale.all():
+            os.remove(path)
+        else:
+            write_partition(path, rows[~stale], schema)
+    return moved
+
+def _flush(name, buffers, key, schema, written):
+    upserted = 0
+    for (year, month), frames in buffers.items():
+        new_rows = pd.concat(frames, ignore_index=True).drop_duplicates(subset=key, keep='last')
+        upsert_partition(partition_path(name, year, month), new_rows, key, schema)
+        written.append(pd.Series(year * 100 + month, index=new_rows[key].to_numpy()))
+        upserted += len(new_rows)
+    buffers.clear()
+    return upserted
+
+def sync_dataset(name, lookback_days=None, full=False, url=None, flush_rows=500000, verbose=True, **fetch_kwargs):
+    """
+    Incrementally syncs dataset `name` into its year/month partitioned parquet store.
+
+    The first run (or full=True) pulls everything matching the configured $where. Later runs only fetch rows
+    whose watermark column is at or past the stored high-water mark minus lookback_days, so late edits within
+    the lookback window are picked up. Fetched rows are deduplicated on the configured key and upserted into
+    the partitions they fall in, a row whose watermark value moved to another month is dropped from its old one.
+    """
+    sync_config = get_sync_config(name)
+    assert sync_config, f"No sync settings configured for dataset {name}"
+    watermark_col = sync_config['watermark']
+    key = sync_config['key']
+    lookback_days = sync_config.get('lookback_days', 0) if lookback_days is None else lookback_days
+
+    state = {} if full else read_state(name)
+    params = dict(get_data_master(name, 'params') or {})
+    params.pop('$limit', None)
+    if state.get('watermark'):
+        since = datetime.fromisoformat(state['watermark']) - timedelta(days=lookback_days)
+        params['$where'] = f"{watermark_col} >= '{since.strftime(SOQL_TIMESTAMP)}'"
+        if verbose:
+            print(f"Syncing {name} from {since.date()} (watermark {state['watermark']}, lookback {lookback_days} days)")
+    elif verbose:
+        print(f"No sync state for {name}, pulling everything matching {params.get('$where', 'no filter')}")
+
+    fetch_config = get_fetch_config(name)
+    fetch_config.update(fetch_kwargs)
+    fetch_config['verbose'] = verbose
+
+    schema = build_arrow_schema(name)
+    buffers, written = {}, []
+    buffered = fetched = upserted = 0
+    watermark = pd.Timestamp(state['watermark']) if state.get('watermark') else None
+    for page in fetch_pages(url or get_data_master(name, 'url'), params=params, **fetch_config):
+        df = coerce_page(name, page)
+        df = df[df[watermark_col].notna()]
+        fetched += len(page)
+        if df.empty:
+            continue
+
+        page_max = df[watermark_col].max()
+        watermark = page_max if watermark is None else max(watermark, page_max)
+
+        for (year, month), part in df.groupby([df[watermark_col].dt.year, df[watermark_col].dt.month]):
+            buffers.setdefault((int(year), int(month)), []).append(part)
+        buffered += len(df)
+        if buffered >= flush_rows: # keep memory bounded on large first pulls
+            upserted += _flush(name, buffers, key, schema, written)
+            buffered = 0
+    upserted += _flush(name, buffers, key, schema, written)
+    moved = 0
+    if written:
+        written = pd.concat(written)
+        moved = drop_moved_rows(name, written[~written.index.duplicated(keep='last')], key, schema) # a later page's copy wins
+
+    state = {
+        'watermark' : watermark.isoformat() if watermark is not None else None,
+        'last_sync' : datetime.now(timezone.utc).isoformat(),
+        'rows_fetched' : fetched
+    }
+    write_state(name, state)
+    if verbose:
+        print(f"Fetched {fetched} rows, upserted {upserted} ({moved} moved to another month) into {get_store_dir(name)}, watermark now {state['watermark']}")
+    return state
+
+def load_synced(name, columns=None, filters=None):
+    """Reads the partitioned store back as one DataFrame, filters use pyarrow's (col, op, value) form eg. [('year', '>=', 2023)]"""
+    store_dir = get_store_dir(name)
+    assert os.path.isdir(store_dir), f"No synced store at {store_dir}, run sync_dataset('{name}') first"
+    return pq.read_table(store_dir, columns=columns, filters=filters, partitioning='hive').to_pandas()
@@ -0,0 +1,3 @@
+from src._lazy import attach
+
+__getattr__, __dir__ = attach(__name__, ['evaluate'])
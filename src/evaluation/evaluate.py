@@ -0,0 +1,97 @@
+# src/evaluation/evaluate.py
+"""
+Binary classification metrics from a single sort of the scores.
+
+score_curve sorts once and keeps cumulative true/false positive counts, every metric after that is a
+cumulative sum lookup: ROC AUC and PR AUC over the distinct scores, confusion matrix, accuracy,
+precision, recall and F1 at any vector of thresholds (a row counts as positive when score >= threshold,
+like the trainers' `y_proba >= 0.5`). Results match sklearn's roc_auc_score, average_precision_score and
+the *_score functions with zero_division=0.
+"""
+import numpy as np
+
+DEFAULT_THRESHOLDS = np.round(np.linspace(0.0, 1.0, 101), 2)
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz # np.trapz was renamed in numpy 2.0
+
+def score_curve(y_true, y_score):
+    """
+    Sorts y_score once, descending. Returns a dict of
+        scores      the sorted scores, ascending, for threshold lookups
+        cum_pos     cum_pos[i] positives among the i lowest scores, cum_pos[0] = 0
+        distinct    tps / fps at each distinct score from the top, the ROC and PR curve points
+    """
+    y_true = np.asarray(y_true).ravel() == 1
+    y_score = np.asarray(y_score, dtype=np.float64).ravel()
+    assert y_true.shape == y_score.shape, f"y_true has {y_true.size} rows but y_score has {y_score.size}"
+
+    order = np.argsort(y_score, kind='stable')
+    scores = y_score[order]
+    cum_pos = np.concatenate([[0], np.cumsum(y_true[order], dtype=np.int64)])
+
+    # last position of each run of equal scores, walking down from the top
+    tps = cum_pos[-1] - cum_pos[:-1][::-1]
+    tops = scores[::-1]
+    ends = np.r_[np.flatnonzero(np.diff(tops)), tops.size - 1]
+    tps = tps[ends] if tops.size else tps
+    fps = ends + 1 - tps
+    return {'scores' : scores, 'cum_pos' : cum_pos, 'n_pos' : int(cum_pos[-1]), 'n' : scores.size, 'tps' : tps, 'fps' : fps}
+
+def roc_auc(curve):
+    """Trapezoidal area under the ROC curve, nan when y_true holds a single class."""
+    n_pos, n_neg = curve['n_pos'], curve['n'] - curve['n_pos']
+    if n_pos == 0 or n_neg == 0:
+        return float('nan')
+    tpr = np.r_[0, curve['tps']] / n_pos
+    fpr = np.r_[0, curve['fps']] / n_neg
+    return float(_trapezoid(tpr, fpr))
+
+def pr_auc(curve):
+    """Average precision, the step-wise area under the precision-recall curve."""
+    if curve['n_pos'] == 0:
+        return float('nan')
+    tps, fps = curve['tps'], curve['fps']
+    precision = tps / (tps + fps)
+    recall_gain = np.diff(np.r_[0, tps]) / curve['n_pos']
+    return float(np.sum(recall_gain * precision))
+
+def _safe_divide(num, den):
+    num, den = np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+def threshold_sweep(curve, thresholds=DEFAULT_THRESHOLDS):
+    """Confusion counts and accuracy / precision / recall / f1 as arrays aligned with thresholds."""
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+    below = np.searchsorted(curve['scores'], thresholds, side='left') # rows predicted negative
+    fn = curve['cum_pos'][below]
+    tn = below - fn
+    tp = curve['n_pos'] - fn
+    fp = curve['n'] - below - tp
+    precision = _safe_divide(tp, tp + fp)
+    recall = _safe_divide(tp, tp + fn)
+    return {
+        'thresholds' : thresholds,
+        'tp' : tp, 'fp' : fp, 'fn' : fn, 'tn' : tn,
+        'accuracy' : _safe_divide(tp + tn, curve['n']),
+        'precision' : precision,
+        'recall' : recall,
+        'f1' : _safe_divide(2 * tp, 2 * tp + fp + fn)
+    }
+
+def binary_metrics(y_true, y_score, thresholds=DEFAULT_THRESHOLDS):
+    """roc_auc, pr_auc and a threshold_sweep over thresholds from one sort."""
+    curve = score_curve(y_true, y_score)
+    return dict(threshold_sweep(curve, thresholds), roc_auc=roc_auc(curve), pr_auc=pr_auc(curve))
+
+def fold_metrics(y_true, y_score, threshold=0.5):
+    """The metrics dict the trainers' evaluate_fold returns, conf_matrix laid out like sklearn's [[tn, fp], [fn, tp]]."""
+    curve = score_curve(y_true, y_score)
+    sweep = threshold_sweep(curve, [threshold])
+    return {
+        "roc_auc": roc_auc(curve),
+        "pr_auc": pr_auc(curve),
+        "accuracy": float(sweep["accuracy"][0]),
+        "f1": float(sweep["f1"][0]),
+        "precision": float(sweep["precision"][0]),
+        "recall": float(sweep["recall"][0]),
+        "conf_matrix": np.array([[sweep["tn"][0], sweep["fp"][0]], [sweep["fn"][0], sweep["tp"][0]]])
+    }
@@ -1,3 +1,3 @@
-from .build_features import *
-from .feature_selector import *
-from .preprocessing import *
\ No newline at end of file
+from src._lazy import attach
+
+__getattr__, __dir__ = attach(__name__, ['build_features', 'cache', 'feature_selector', 'feature_store', 'preprocessing'])
@@ -1,40 +1,291 @@
+import warnings
+
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import OneHotEncoder
+
+from src._lazy import lazy_module
+from src.pipeline.profiling import span
+
+sp = lazy_module("scipy.sparse")
+
+class SparseFrame:
+    """
+    CSR feature matrix with column names, what transform returns for sparse builders. Selecting columns by
+    name (frame[cols]) slices the matrix by column index, nothing is densified unless to_numpy() is called.
+    """
+    def __init__(self, matrix, columns):
+        self.matrix = matrix.tocsr()
+        self.columns = pd.Index(columns)
+        assert self.matrix.shape[1] == len(self.columns), f"{self.matrix.shape[1]} matrix columns but {len(self.columns)} names"
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, columns):
+        idx = self.columns.get_indexer(list(columns))
+        assert (idx >= 0).all(), f"Columns not in the frame: {[col for col, i in zip(columns, idx) if i < 0]}"
+        if len(idx) == len(self.columns) and (idx == np.arange(len(idx))).all():
+            return self
+        return SparseFrame(self.matrix[:, idx], self.columns[idx])
+
+    def copy(self):
+        return SparseFrame(self.matrix.copy(), self.columns)
+
+    def to_numpy(self, dtype=np.float64):
+        return self.matrix.toarray().astype(dtype, copy=False)
+
+def design_matrix(X):
+    """What models consume: the CSR matrix of a SparseFrame, the dense array of a DataFrame."""
+    return X.matrix if isinstance(X, SparseFrame) else X.to_numpy()
 
 class CrashFeatureBuilder:
-    def __init__(self):
-        self.encoder = OneHotEncoder(drop='first', sparse_output=False)
+    """
+    Hour-from-peak plus one-hot borough, top vehicle types and top contributing factors.
 
-    def build_features(self, data):
-        copy = data.copy()
-        
-        # Step 1: Select columns
-        cols = ['crash_time', 'borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1']
-        copy = copy[cols].copy()
-
-        # Step 2: Parse time
-        crash_time_parsed = pd.to_datetime(copy['crash_time'], format='%H:%M', errors='coerce')
-        hour_of_day = crash_time_parsed.dt.hour.fillna(0).astype(int)
-
-        # Step 3: Normalize categories
-        copy['borough'] = copy['borough'].fillna('Unspecified')
-        top_vehicles = copy['vehicle_type_code1'].value_counts().nlargest(10).index
-        top_factors = copy['contributing_factor_vehicle_1'].value_counts().nlargest(10).index
-
-        copy['vehicle_type_code1'] = copy['vehicle_type_code1'].apply(lambda x: x if x in top_vehicles else 'Other')
-        copy['contributing_factor_vehicle_1'] = copy['contributing_factor_vehicle_1'].apply(
-            lambda x: x if x in top_factors else 'Other'
-        )
+    fit learns the vocabularies and the peak hour once, transform applies them to any data with
+    categorical codes and array lookups so new data is encoded exactly like the training data.
+    One-hot columns drop the first category in sorted order, like OneHotEncoder(drop='first').
+    Values unseen during fit are encoded as the column's catch-all, 'Other' for top_k_cols and 'Unspecified'
+    (where missing values go) for the rest. A column without one would encode them like the dropped first
+    category, handle_unknown='warn' then warns with the counts and 'error' raises.
+
+    numeric_cols are passed through as is after time_from_peak_hour, eg. the per collision people and vehicle
+    aggregates of src/data/joins.py. Missing values get the column's mean over the fit data, so a crash without
+    any known ages doesn't look like one of infants.
+
+    sparse=True makes transform return a SparseFrame instead of a dense DataFrame, with at most one stored
+    value per categorical column and row, which is what makes large vocabularies (top_k in the hundreds,
+    HIGH_CARDINALITY_COLS through cat_cols, see wide()) affordable.
+    """
+    REQUIRED_COLUMNS = ['crash_time', 'borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1'] # of the default builder, see required_columns
+    CAT_COLS = ['borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1']
+    TOP_K_COLS = ['vehicle_type_code1', 'contributing_factor_vehicle_1'] # rare values collapse into 'Other'
+    HIGH_CARDINALITY_COLS = ['zip_code', 'on_street_name', 'off_street_name', 'cross_street_name']
+    VERSION = 3 # bump whenever the encoding changes so cached features built by older code aren't reused
+
+    def __init__(self, top_k=10, sparse=False, cat_cols=None, top_k_cols=None, numeric_cols=None, handle_unknown='warn'):
+        assert handle_unknown in ('warn', 'error'), f"handle_unknown must be 'warn' or 'error' but is {handle_unknown}"
+        self.top_k = top_k
+        self.handle_unknown = handle_unknown
+        self.sparse = sparse
+        self.cat_cols = list(self.CAT_COLS if cat_cols is None else cat_cols)
+        self.top_k_cols = list(self.TOP_K_COLS if top_k_cols is None else top_k_cols)
+        self.numeric_cols = list(numeric_cols or [])
+        assert set(self.top_k_cols) <= set(self.cat_cols), f"top_k_cols {self.top_k_cols} must be among cat_cols {self.cat_cols}"
+        self.required_columns = ['crash_time'] + self.cat_cols + self.numeric_cols
+        self.vocab_ = None # col -> kept labels, for top_k_cols
+        self.categories_ = None # col -> sorted one-hot categories, first one dropped
+        self.peak_hour_ = None
+        self.numeric_fill_ = None # col -> fit mean, stands in for missing values
+        self.feature_names_ = None
+
+    @classmethod
+    def wide(cls, top_k=500, sparse=True):
+        """Builder over the default columns plus zip code and street names, every column but borough capped at top_k values."""
+        cat_cols = cls.CAT_COLS + cls.HIGH_CARDINALITY_COLS
+        return cls(top_k=top_k, sparse=sparse, cat_cols=cat_cols, top_k_cols=[col for col in cat_cols if col != 'borough'])
+
+    def get_config(self):
+        """Everything besides the data that determines what fit/transform produce."""
+        return {'builder' : type(self).__name__, 'version' : self.VERSION, 'top_k' : self.top_k, 'sparse' : self.sparse,
+                'cat_cols' : self.cat_cols, 'top_k_cols' : self.top_k_cols, 'numeric_cols' : self.numeric_cols}
+
+    @property
+    def is_fitted(self):
+        return self.feature_names_ is not None
+
+    # Step 2: Parse time
+    @staticmethod
+    def hour_of_day(crash_time):
+        """Hour of 'H:MM' strings, unparseable or missing times count as hour 0. Only distinct values get parsed."""
+        if isinstance(crash_time.dtype, pd.CategoricalDtype):
+            codes, uniques = crash_time.cat.codes.to_numpy(), crash_time.cat.categories
+        else:
+            codes, uniques = pd.factorize(crash_time)
+        parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format='%H:%M', errors='coerce')
+        hours = np.append(parsed.dt.hour.fillna(0).to_numpy(dtype=np.int64), 0) # code -1 (missing) picks the trailing 0
+        return hours[codes]
+
+    @staticmethod
+    def lookup(values, labels):
+        """Position of every value in labels, -1 when missing or not in labels."""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values) # one hashing pass, labels are then matched against the distinct values only
+        positions = np.append(pd.Index(labels, dtype=object).get_indexer(pd.Index(uniques, dtype=object)), -1)
+        return positions[codes]
+
+    def count(self, data):
+        """Sufficient statistics for fit: value counts of every categorical column and the hour histogram."""
+        counts = {}
+        for col in self.cat_cols:
+            counts[col] = data[col].value_counts()
+            counts[col].index = counts[col].index.astype(object)
+        for col in self.cat_cols:
+            n_missing = int(data[col].isna().sum()) if col not in self.top_k_cols else 0 # top_k_cols put them in 'Other'
+            if n_missing:
+                counts[col].loc['Unspecified'] = counts[col].get('Unspecified', 0) + n_missing
+        counts['hour'] = np.bincount(self.hour_of_day(data['crash_time']), minlength=24)
+        counts['numeric_sum'] = pd.Series({col : float(data[col].sum()) for col in self.numeric_cols}, dtype=np.float64) # sum and count skip NaN
+        counts['numeric_n'] = pd.Series({col : int(data[col].count()) for col in self.numeric_cols}, dtype=np.float64)
+        counts['rows'] = len(data)
+        return counts
+
+    @staticmethod
+    def merge_counts(a, b):
+        """Combines the count statistics of two disjoint chunks, either may be None."""
+        if a is None or b is None:
+            return b if a is None else a
+        merged = {key : a[key].add(b[key], fill_value=0) for key in a if isinstance(a[key], pd.Series)}
+        merged['hour'] = a['hour'] + b['hour']
+        merged['rows'] = a['rows'] + b['rows']
+        return merged
+
+    def fit_counts(self, counts):
+        """Fits from (possibly merged) count statistics so chunked passes end in the same state as fit."""
+        self.vocab_ = {}
+        self.categories_ = {}
+        for col in self.cat_cols:
+            col_counts = counts[col][counts[col] > 0]
+            if col in self.top_k_cols:
+                ranked = sorted(col_counts.items(), key=lambda kv: (-kv[1], str(kv[0]))) # ties broken by label so merges are order independent
+                kept = [label for label, _ in ranked[:self.top_k]]
+                self.vocab_[col] = kept
+                labels = set(kept)
+                if counts['rows'] > sum(count for _, count in ranked[:self.top_k]): # rare or missing values exist
+                    labels.add('Other')
+            else:
+                labels = set(col_counts.index)
+            self.categories_[col] = sorted(labels)
+
+        self.peak_hour_ = int(np.argmax(counts['hour']))
+        self.numeric_fill_ = {col : float(counts['numeric_sum'][col] / counts['numeric_n'][col]) if counts['numeric_n'][col] else 0.0
+                              for col in self.numeric_cols}
+        self.feature_names_ = ['time_from_peak_hour'] + self.numeric_cols + [f'{col}_{cat}' for col in self.cat_cols for cat in self.categories_[col][1:]]
+        return self
+
+    def fit(self, data):
+        with span('features.count'):
+            counts = self.count(data)
+        with span('features.fit_counts'):
+            return self.fit_counts(counts)
+
+    def encode(self, data):
+        """
+        Position of each row's value in categories_ per categorical column. Missing and unseen values take the
+        column's catch-all category, -1 when it has none (see handle_unknown).
+        """
+        codes = {}
+        unknown = {}
+        for col in self.cat_cols:
+            categories = self.categories_[col]
+            if col in self.top_k_cols: # Step 3: Normalize categories, anything outside the vocab becomes 'Other'
+                other = categories.index('Other') if 'Other' in categories else -1
+                table = np.array([categories.index(label) for label in self.vocab_[col]] + [other], dtype=np.int64)
+                codes[col] = table[self.lookup(data[col], self.vocab_[col])]
+            else:
+                positions = self.lookup(data[col], categories)
+                if 'Unspecified' in categories:
+                    positions[positions < 0] = categories.index('Unspecified')
+                codes[col] = positions
+            n_unknown = int((codes[col] < 0).sum())
+            if n_unknown:
+                unknown[col] = n_unknown
+        if unknown:
+            message = f"Values unseen during fit and without a catch-all category, encoded like the dropped first category: {unknown} of {len(data)} rows"
+            if self.handle_unknown == 'error':
+                raise ValueError(message)
+            warnings.warn(message, stacklevel=3)
+        return codes
+
+    def transform(self, data):
+        assert self.is_fitted, "CrashFeatureBuilder must be fit before transform"
+        n = len(data)
 
         # Step 4: Peak hour diff
-        peak_hour = hour_of_day.value_counts().idxmax()
-        copy['time_from_peak_hour'] = hour_of_day - peak_hour
+        with span('features.hour_of_day'):
+            time_from_peak = self.hour_of_day(data['crash_time']) - self.peak_hour_
 
-        # Step 5: One-hot encode
-        cat_cols = ['borough', 'vehicle_type_code1', 'contributing_factor_vehicle_1']
-        encoded = self.encoder.fit_transform(copy[cat_cols])
-        encoded_df = pd.DataFrame(encoded, columns=self.encoder.get_feature_names_out(cat_cols), index=copy.index)
+        # Step 5: One-hot encode, column offset of each category in one preallocated block
+        with span('features.encode'):
+            all_codes = self.encode(data)
+        numeric = {col : data[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in self.numeric_cols}
+        numeric = {col : np.where(np.isnan(values), self.numeric_fill_.get(col, 0.0), values) for col, values in numeric.items()}
+        if self.sparse:
+            with span('features.one_hot_sparse'):
+                return SparseFrame(self.one_hot_csr(time_from_peak, numeric, all_codes), self.feature_names_)
+        with span('features.one_hot'):
+            encoded = np.zeros((n, len(self.feature_names_) - 1 - len(numeric)), dtype=np.float64)
+            rows = np.arange(n)
+            offset = 0
+            for col, codes in all_codes.items():
+                hot = codes >= 1 # code 0 is the dropped first category
+                encoded[rows[hot], offset + codes[hot] - 1] = 1.0
+                offset += len(self.categories_[col]) - 1
 
         # Step 6: Combine
-        X = pd.concat([copy[['time_from_peak_hour']], encoded_df], axis=1)
+        with span('features.combine'):
+            X = pd.DataFrame(encoded, columns=self.feature_names_[1 + len(numeric):], index=data.index)
+            for i, (col, values) in enumerate(numeric.items()):
+                X.insert(i, col, values)
+            X.insert(0, 'time_from_peak_hour', time_from_peak)
         return X
+
+    def one_hot_csr(self, time_from_peak, numeric, all_codes):
+        """
+        CSR version of transform's dense block. time_from_peak_hour and numeric columns are stored for every row,
+        zeros included, since xgboost reads entries absent from a sparse matrix as missing rather than 0.
+        """
+        n = len(time_from_peak)
+        columns = [np.full(n, i, dtype=np.int64) for i in range(1 + len(numeric))]
+        offset = 1 + len(numeric)
+        for col, codes in all_codes.items():
+            columns.append(np.where(codes >= 1, offset + codes - 1, -1)) # code 0 is the dropped first category
+            offset += len(self.categories_[col]) - 1
+        columns = np.column_stack(columns) # increasing within each row, so row major order is CSR order
+        values = np.ones(columns.shape)
+        values[:, 0] = time_from_peak
+        for i, col_values in enumerate(numeric.values()):
+            values[:, 1 + i] = col_values
+        stored = columns >= 0
+        indptr = np.concatenate([[0], np.cumsum(stored.sum(axis=1))])
+        return sp.csr_matrix((values[stored], columns[stored].astype(np.int32), indptr), shape=(n, len(self.feature_names_)))
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def build_features(self, data):
+        return self.fit_transform(data)
+
+    def get_state(self):
+        """Fitted state as plain python types, small enough to json dump next to a model."""
+        assert self.is_fitted, "CrashFeatureBuilder must be fit before its state can be saved"
+        return {
+            'top_k' : self.top_k,
+            'sparse' : self.sparse,
+            'cat_cols' : self.cat_cols,
+            'top_k_cols' : self.top_k_cols,
+            'numeric_cols' : self.numeric_cols,
+            'handle_unknown' : self.handle_unknown,
+            'vocab' : self.vocab_,
+            'categories' : self.categories_,
+            'peak_hour' : self.peak_hour_,
+            'numeric_fill' : self.numeric_fill_,
+            'feature_names' : self.feature_names_
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        builder = cls(top_k=state['top_k'], sparse=state.get('sparse', False), cat_cols=state.get('cat_cols'), top_k_cols=state.get('top_k_cols'),
+                      numeric_cols=state.get('numeric_cols'), handle_unknown=state.get('handle_unknown', 'warn')) # older states are default builders
+        builder.vocab_ = {col : list(labels) for col, labels in state['vocab'].items()}
+        builder.categories_ = {col : list(labels) for col, labels in state['categories'].items()}
+        builder.peak_hour_ = int(state['peak_hour'])
+        builder.numeric_fill_ = {col : float(value) for col, value in state.get('numeric_fill', {}).items()}
+        builder.feature_names_ = list(state['feature_names'])
+        return builder
@@ -0,0 +1,141 @@
+# src/features/cache.py
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src._lazy import lazy_module
+from src.config.config import CACHE_CONFIG
+
+sp = lazy_module("scipy.sparse")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SAMPLE_BYTES = 2**20
+
+def _hash_file_sample(path, digest):
+    """Hashes the first and last MB so edits that keep size and mtime still change the fingerprint."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            f.seek(max(size - SAMPLE_BYTES, SAMPLE_BYTES))
+            digest.update(f.read(SAMPLE_BYTES))
+
+def fingerprint_path(path):
+    """Cheap content fingerprint of a raw data file or partitioned directory: names, sizes, mtimes and sampled bytes."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names if not name.startswith(('.', '_')))
+    else:
+        files = [path]
+    for file in files:
+        stat = os.stat(file)
+        digest.update(f'{os.path.relpath(file, path) if os.path.isdir(path) else os.path.basename(file)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+        _hash_file_sample(file, digest)
+    return digest.hexdigest()
+
+def make_key(**parts):
+    """Content address of a cache entry, parts must be json serializable."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+class PreprocessingCache:
+    """
+    Persistent (X, Y) cache keyed by make_key(...). Each entry is a directory holding X.npy, Y.npy and
+    meta.json, arrays are returned memory mapped. A sparse X is kept as an uncompressed X.npz and loaded
+    whole as CSR. Entries are evicted by age and, least recently used first, by total size.
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir or os.path.join(ROOT_DIR, CACHE_CONFIG['dir'])
+        self.max_bytes = CACHE_CONFIG['max_bytes'] if max_bytes is None else max_bytes
+        self.max_age_days = CACHE_CONFIG['max_age_days'] if max_age_days is None else max_age_days
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self.entry_dir(key), 'meta.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, directory, meta):
+        with open(os.path.join(directory, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(directory, 'meta.json.tmp'), os.path.join(directory, 'meta.json'))
+
+    def touch(self, key):
+        """Meta of entry key with its last use set to now, None on a miss. For entries holding other files than X and Y."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        meta['last_used'] = time.time()
+        self._write_meta(self.entry_dir(key), meta)
+        return meta
+
+    def get(self, key):
+        """Returns (X, Y, meta) with X and Y memory mapped read only, or None on a miss."""
+        meta = self.touch(key)
+        if meta is None:
+            return None
+        directory = self.entry_dir(key)
+        if os.path.exists(os.path.join(directory, 'X.npz')):
+            X = sp.load_npz(os.path.join(directory, 'X.npz')).tocsr()
+        else:
+            X = np.load(os.path.join(directory, 'X.npy'), mmap_mode='r')
+        Y = np.load(os.path.join(directory, 'Y.npy'), mmap_mode='r')
+        return X, Y, meta
+
+    def put(self, key, X, Y, **meta):
+        """Stores X and Y under key along with any json serializable meta, then evicts."""
+        tmp_dir = self.staging_dir(key)
+        if hasattr(X, 'tocsr'): # scipy sparse
+            sp.save_npz(os.path.join(tmp_dir, 'X.npz'), X.tocsr(), compressed=False)
+        else:
+            np.save(os.path.join(tmp_dir, 'X.npy'), np.asarray(X))
+        np.save(os.path.join(tmp_dir, 'Y.npy'), np.asarray(Y))
+        self.commit(key, tmp_dir, **meta)
+
+    def commit(self, key, directory, **meta):
+        """Registers a directory already holding its data files (eg. X.npy and Y.npy written in place by a chunked pipeline) as entry key."""
+        now = time.time()
+        nbytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if not name.startswith('meta.json'))
+        self._write_meta(directory, dict(meta, key=key, created=now, last_used=now, bytes=nbytes))
+        final_dir = self.entry_dir(key)
+        if directory != final_dir:
+            if os.path.exists(final_dir):
+                shutil.rmtree(final_dir)
+            os.replace(directory, final_dir)
+        self.evict(keep=key)
+
+    def staging_dir(self, key):
+        directory = self.entry_dir(key) + f'.tmp-{os.getpid()}'
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        metas = (self._read_meta(name) for name in os.listdir(self.cache_dir) if '.tmp-' not in name)
+        return [meta for meta in metas if meta is not None]
+
+    def remove(self, key):
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def evict(self, keep=None):
+        entries = sorted((meta for meta in self.entries() if meta['key'] != keep), key=lambda meta: meta['last_used'])
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days is not None else None
+        total = sum(meta['bytes'] for meta in self.entries())
+        for meta in entries:
+            too_old = cutoff is not None and meta['last_used'] < cutoff
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if too_old or too_big:
+                self.remove(meta['key'])
+                total -= meta['bytes']
+
+    def clear(self):
+        for meta in self.entries():
+            self.remove(meta['key'])
@@ -52,6 +52,8 @@ def delete_presets(dataset, presets: Iterable[str]):
 def select_features(X, dataset, preset='all') -> pd.DataFrame:
     """
     Filters columns from X based on configured list for the dataset.
+    X can also be a SparseFrame or a FeatureTable, for those the selection is a column projection and nothing is copied:
+    'all' returns X itself and a SparseFrame's column slice is the only new matrix.
 
     preset arg can be:
         - a string spcifying pre-initialized preset in feature_config
@@ -61,7 +63,7 @@ def select_features(X, dataset, preset='all') -> pd.DataFrame:
     assert dataset in feature_config.keys(), f"Inputted dataset {dataset} not supported in feature selector"
     preset = preset.lower()
     if preset == 'all':
-        return X.copy()
+        return X.copy() if isinstance(X, pd.DataFrame) else X
     
     if preset in feature_config.get(dataset).keys(): # preset=str => its a existing preset
         valid_features = feature_config.get(dataset).get(preset)
@@ -78,4 +80,4 @@ def select_features(X, dataset, preset='all') -> pd.DataFrame:
     
     # Some features in the config may not exist due to missing categories in current dataset
     selected = [col for col in valid_features if col in X.columns]
-    return X[selected].copy()
+    return X[selected].copy() if isinstance(X, pd.DataFrame) else X[selected]
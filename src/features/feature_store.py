@@ -0,0 +1,77 @@
+# src/features/feature_store.py
+"""
+Columnar store of the full engineered feature matrix: an uncompressed Arrow IPC file with one column per
+feature, written once per raw data and feature builder fit (see Preprocessing.CRASH_feature_store) and
+read memory mapped. Presets are column projections of the mapped file, only the selected columns are ever
+paged in and nothing is copied until a model asks for one contiguous 2D array.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from src._lazy import lazy_module
+
+pa = lazy_module("pyarrow")
+ipc = lazy_module("pyarrow.ipc")
+
+FEATURES_FILE = 'features.arrow'
+
+def write_feature_table(path, X, **metadata):
+    """
+    Writes DataFrame X as a single record batch, so every column is one contiguous buffer that maps back
+    without copying. Json serializable metadata (eg. builder_state) goes into the schema.
+    """
+    table = pa.Table.from_pandas(X, preserve_index=False)
+    table = table.replace_schema_metadata({key : json.dumps(value) for key, value in metadata.items()})
+    with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(len(table), 1))
+    return path
+
+class FeatureTable:
+    """
+    Read only view of a feature file, behaves like the DataFrame select_features expects: frame[cols] is
+    another FeatureTable over those columns, copy() is free since nothing can write to the mapped buffers.
+    to_frame() and to_numpy() materialize the selection.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.columns = pd.Index(table.column_names)
+
+    @classmethod
+    def open(cls, path):
+        return cls(ipc.open_file(pa.memory_map(path, 'r')).read_all()) # buffers keep the map open
+
+    @property
+    def shape(self):
+        return (self.table.num_rows, self.table.num_columns)
+
+    @property
+    def metadata(self):
+        return {key.decode() : json.loads(value) for key, value in (self.table.schema.metadata or {}).items()}
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, columns):
+        columns = list(columns)
+        missing = [col for col in columns if col not in self.columns]
+        assert not missing, f"Columns not in the feature table: {missing}"
+        return FeatureTable(self.table.select(columns))
+
+    def copy(self):
+        return self
+
+    def column(self, name):
+        """Read only numpy view of one column straight on the mapped file."""
+        return self.table.column(name).to_numpy()
+
+    def to_frame(self):
+        return pd.DataFrame({col : self.column(col) for col in self.columns}, copy=False) # one block per column, no consolidation copy
+
+    def to_numpy(self, dtype=np.float64):
+        """One copy of the selected columns, column major like DataFrame.to_numpy() of a single dtype frame."""
+        X = np.empty((len(self.columns), len(self)), dtype=dtype).T
+        for i, col in enumerate(self.columns):
+            X[:, i] = self.column(col)
+        return X
@@ -1,19 +1,45 @@
-from src.data.cleaners import load_crash_data, consolidate_response
-from src.features.build_features import CrashFeatureBuilder
-from src.features.feature_selector import select_features, get_preset
+from src.config.config import get_output_path
+from src.data.cleaners import load_crash_data, iter_crash_chunks, consolidate_response, find_crash_source, find_source, RESPONSE_COLUMNS
+from src.data.joins import CollisionAggregates, JOIN_FEATURES, PEOPLE_FEATURES, VEHICLE_FEATURES
+from src.features.build_features import CrashFeatureBuilder, SparseFrame, design_matrix
+from src.features.cache import PreprocessingCache, fingerprint_path, make_key
+from src.features.feature_store import FEATURES_FILE, FeatureTable, write_feature_table
+from src.features.feature_selector import select_features, get_preset, feature_config
+from src.pipeline.profiling import span
 
+import numpy as np
 import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple
 
+def _write_chunk(state, selected, chunk, X_path, Y_path, offset):
+    """Transforms one chunk and writes it into rows [offset, offset + len(chunk)) of the on-disk X and Y arrays."""
+    builder = CrashFeatureBuilder.from_state(state)
+    X = np.lib.format.open_memmap(X_path, mode='r+')
+    Y = np.lib.format.open_memmap(Y_path, mode='r+')
+    X[offset:offset + len(chunk)] = builder.transform(chunk)[selected].to_numpy()
+    Y[offset:offset + len(chunk)] = consolidate_response(chunk)['Y'].to_numpy()
+    X.flush()
+    Y.flush()
+    return len(chunk)
+
 class Preprocessing():
-    def __init__(self, dataset, pipetype):
-        self.feature_builder = CrashFeatureBuilder()
+    def __init__(self, dataset, pipetype, use_cache=True, feature_builder=None):
+        """
+        use_cache=False bypasses the on-disk (X, Y) cache entirely, nothing is read from or written to it.
+        feature_builder replaces the default CrashFeatureBuilder(), eg. CrashFeatureBuilder.wide() whose sparse
+        output stays CSR through selection, full_pipe and the cache (a SparseFrame with as_df=True).
+        """
+        self.feature_builder = feature_builder or CrashFeatureBuilder()
+        self.cache = PreprocessingCache() if use_cache else None
 
         self.config = {
             "nyc-crashes": {
                 "response_pipe": self.CRASH_response_pipe,
                 "feature_pipe": self.CRASH_feature_pipe,
                 "full_pipe": self.CRASH_full_pipe,
+                "chunked_pipe": self.CRASH_chunked_pipe,
                 "features": 'all'
             }
         }
@@ -25,13 +51,98 @@ class Preprocessing():
         self.pipetype = pipetype
         self.pipefunction = self.config[dataset][pipetype]
 
+    def CRASH_cache_key(self, pipetype, select_feat=None):
+        """Fingerprint of the raw data, pipeline type, feature builder config and the columns the preset resolves to."""
+        if select_feat is None:
+            select_feat = self.config[self.dataset]["features"]
+        if isinstance(select_feat, str) and select_feat.lower() in feature_config.get(self.dataset): # presets can be redefined, key on their columns
+            select_feat = feature_config.get(self.dataset).get(select_feat.lower())
+        return make_key(
+            dataset=self.dataset,
+            raw=self.CRASH_fingerprint(),
+            pipetype=pipetype,
+            builder=self.feature_builder.get_config(),
+            preset=select_feat
+        )
+
+    def CRASH_fingerprint(self):
+        """Fingerprint of the raw crash data, and of the people/vehicle tables when the builder uses their aggregates."""
+        crashes = fingerprint_path(find_crash_source())
+        joined = self.CRASH_joined()
+        if not joined:
+            return crashes
+        tables = {'nyc-people' : PEOPLE_FEATURES, 'nyc-vehicles' : VEHICLE_FEATURES}
+        return {'nyc-crashes' : crashes, **{name : fingerprint_path(find_source(name)) for name, features in tables.items() if set(features) & set(joined)}}
+
+    def CRASH_store_key(self):
+        """Feature store entries don't depend on the preset, only on the raw data and the feature builder config."""
+        return make_key(
+            dataset=self.dataset,
+            raw=self.CRASH_fingerprint(),
+            pipetype='feature_store',
+            builder=self.feature_builder.get_config()
+        )
+
+    def CRASH_feature_store(self):
+        """
+        Every engineered feature as a FeatureTable memory mapped from the cache, and Y. Built and written on
+        first use, after that one entry serves every preset with a column projection. Needs the cache.
+        """
+        key = self.CRASH_store_key()
+        meta = self.cache.touch(key)
+        if meta is None:
+            df_with_Y = self.CRASH_response_pipe()
+            with span('build_features', rows=len(df_with_Y)):
+                X_all = self.feature_builder.build_features(df_with_Y)
+            with span('feature_store_put'):
+                directory = self.cache.staging_dir(key)
+                state = self.feature_builder.get_state()
+                write_feature_table(os.path.join(directory, FEATURES_FILE), X_all, builder_state=state)
+                np.save(os.path.join(directory, 'Y.npy'), df_with_Y['Y'].to_numpy())
+                self.cache.commit(key, directory, dataset=self.dataset, pipetype='feature_store', columns=X_all.columns.tolist(), builder_state=state)
+            del X_all, df_with_Y
+        else:
+            self.feature_builder = CrashFeatureBuilder.from_state(meta['builder_state'])
+            print(f"Loaded {self.dataset} feature store from {self.cache.entry_dir(key)}")
+        directory = self.cache.entry_dir(key)
+        return FeatureTable.open(os.path.join(directory, FEATURES_FILE)), np.load(os.path.join(directory, 'Y.npy'), mmap_mode='r')
+
+    def CRASH_cache_get(self, key):
+        hit = self.cache.get(key)
+        if hit is None:
+            return None
+        X, Y, meta = hit
+        self.feature_builder = CrashFeatureBuilder.from_state(meta['builder_state']) # fitted state for transforming new data
+        print(f"Loaded cached {self.dataset} {meta['pipetype']} output from {self.cache.entry_dir(key)}")
+        return X, Y, meta
+
+    def CRASH_joined(self):
+        """People and vehicle aggregates (src/data/joins.py) the feature builder reads."""
+        return [col for col in self.feature_builder.required_columns if col in JOIN_FEATURES]
+
+    def CRASH_columns(self):
+        """Raw crash columns the crash pipelines read, everything else is skipped at load time."""
+        joined = self.CRASH_joined()
+        return RESPONSE_COLUMNS + [col for col in self.feature_builder.required_columns if col not in joined] + (['collision_id'] if joined else [])
+
+    def CRASH_aggregates(self, crash_ids):
+        """Streams only the tables the joined columns come from, memory bounded by the number of crashes."""
+        joined = self.CRASH_joined()
+        return CollisionAggregates.build(crash_ids, people=bool(set(joined) & set(PEOPLE_FEATURES)), vehicles=bool(set(joined) & set(VEHICLE_FEATURES)))
+
     def CRASH_load(self) -> pd.DataFrame:
-        return load_crash_data()
+        with span('load_crash_data'):
+            data = load_crash_data(columns=self.CRASH_columns())
+        joined = self.CRASH_joined()
+        if joined:
+            data = self.CRASH_aggregates(data['collision_id']).attach(data, joined)
+        return data
 
     def CRASH_response_pipe(self, data=None, as_series=False):
         if data is None:
             data = self.CRASH_load()
-        data = consolidate_response(data)
+        with span('consolidate_response', rows=len(data)):
+            data = consolidate_response(data)
         if as_series:
             return data['Y']
         return data
@@ -40,30 +151,123 @@ class Preprocessing():
         if data is None:
             data = self.CRASH_response_pipe()
 
-        X_all = self.feature_builder.build_features(data)
+        with span('build_features', rows=len(data)):
+            X_all = self.feature_builder.build_features(data)
+        return self.CRASH_select(X_all, select_feat)
 
+    def CRASH_select(self, X_all, select_feat=None):
         if select_feat is None:
             print(f'Using default feature selection for {self.dataset}, mode: {self.config[self.dataset]["features"]}')
             select_feat = self.config[self.dataset]["features"]
         try:
-            X_selected = select_features(X_all, self.dataset, select_feat)
+            with span('select_features'):
+                X_selected = select_features(X_all, self.dataset, select_feat)
             return X_selected
         except ValueError as e:
             print(f"feature selector errored on {self.dataset} with features {select_feat}")
             raise
         
     def CRASH_full_pipe(self, as_df=False, select_feat=None):
+        """
+        With the cache and a dense feature builder the preset is a column projection of the feature store,
+        as_df=True returns a DataFrame over the mapped columns. Sparse builders cache (X, Y) per preset.
+        """
+        if self.cache is not None and not self.feature_builder.sparse:
+            X_all, Y = self.CRASH_feature_store()
+            X = self.CRASH_select(X_all, select_feat)
+            return (X.to_frame(), Y) if as_df else (X.to_numpy(), Y)
+
+        key = self.CRASH_cache_key('full_pipe', select_feat) if self.cache is not None else None
+        if key is not None:
+            with span('cache_get'):
+                hit = self.CRASH_cache_get(key)
+            if hit is not None:
+                X, Y, meta = hit
+                return (SparseFrame(X, meta['columns']), Y) if as_df else (X, Y)
+
         df_with_Y = self.CRASH_response_pipe()
         X = self.CRASH_feature_pipe(data=df_with_Y, select_feat=select_feat)
         Y = df_with_Y["Y"].values
+        if key is not None:
+            with span('cache_put'):
+                self.cache.put(key, design_matrix(X), Y, dataset=self.dataset, pipetype='full_pipe', columns=X.columns.tolist(),
+                               builder_state=self.feature_builder.get_state())
         if as_df:
             return (X, Y)
         else: 
-            return (X.to_numpy(), Y)
+            return (design_matrix(X), Y)
+
+    def CRASH_chunked_pipe(self, select_feat=None, chunksize=500000, out_dir=None, n_jobs=1):
+        """
+        Out of core version of CRASH_full_pipe, peak memory scales with chunksize rather than the dataset.
+
+        Pass 1 streams the raw data collecting the count statistics the feature builder fits from.
+        Pass 2 transforms chunk by chunk into preallocated X.npy / Y.npy files under out_dir, optionally
+        across n_jobs worker processes. Returns read only memory maps of X and Y. Without an out_dir the
+        arrays are written straight into a cache entry. The memory maps are dense, sparse builders need full_pipe.
+        """
+        assert not self.feature_builder.sparse, "chunked_pipe writes dense memory maps, use full_pipe with a sparse feature builder"
+        key = self.CRASH_cache_key('chunked_pipe', select_feat) if self.cache is not None and out_dir is None else None
+        if key is not None:
+            hit = self.CRASH_cache_get(key)
+            if hit is not None:
+                return hit[:2]
+
+        columns = self.CRASH_columns()
+        counts = None
+        n_rows = 0
+        for chunk in iter_crash_chunks(columns=columns, chunksize=chunksize):
+            counts = CrashFeatureBuilder.merge_counts(counts, self.feature_builder.count(chunk))
+            n_rows += len(chunk)
+        assert n_rows, f"No rows found for {self.dataset}"
+        self.feature_builder.fit_counts(counts)
+
+        if select_feat is None:
+            print(f'Using default feature selection for {self.dataset}, mode: {self.config[self.dataset]["features"]}')
+            select_feat = self.config[self.dataset]["features"]
+        selected = select_features(pd.DataFrame(columns=self.feature_builder.feature_names_), self.dataset, select_feat).columns.tolist()
+
+        if key is not None:
+            out_dir = self.cache.staging_dir(key)
+        elif out_dir is None:
+            out_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', get_output_path(self.dataset, 'interim'), f'{self.dataset}-chunked'))
+        os.makedirs(out_dir, exist_ok=True)
+        X_path, Y_path = os.path.join(out_dir, 'X.npy'), os.path.join(out_dir, 'Y.npy')
+        np.lib.format.open_memmap(X_path, mode='w+', dtype=np.float64, shape=(n_rows, len(selected))).flush()
+        np.lib.format.open_memmap(Y_path, mode='w+', dtype=np.int64, shape=(n_rows,)).flush()
+
+        state = self.feature_builder.get_state()
+        joined = self.CRASH_joined()
+        chunks = iter_crash_chunks(columns=columns, chunksize=chunksize)
+        if joined: # aggregates of every crash built once, attached to each chunk before it's transformed
+            aggregates = self.CRASH_aggregates(load_crash_data(columns=['collision_id'])['collision_id'])
+            chunks = (aggregates.attach(chunk, joined) for chunk in chunks)
+        offset = 0
+        if n_jobs == 1:
+            for chunk in chunks:
+                offset += _write_chunk(state, selected, chunk, X_path, Y_path, offset)
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(_write_chunk, state, selected, chunk, X_path, Y_path, offset))
+                    offset += len(chunk)
+                    if len(pending) >= 2 * n_jobs: # bound the number of chunks held in memory
+                        pending.pop(0).result()
+                for future in pending:
+                    future.result()
+        assert offset == n_rows, f"Second pass wrote {offset} rows but the first pass counted {n_rows}"
+
+        print(f"Wrote {n_rows} x {len(selected)} design matrix to {out_dir}")
+        if key is not None:
+            self.cache.commit(key, out_dir, dataset=self.dataset, pipetype='chunked_pipe', columns=selected, builder_state=state)
+            X_path, Y_path = os.path.join(self.cache.entry_dir(key), 'X.npy'), os.path.join(self.cache.entry_dir(key), 'Y.npy')
+        return (np.load(X_path, mmap_mode='r'), np.load(Y_path, mmap_mode='r'))
 
     def pipefunc(self):
         return self.pipefunction
 
     def __call__(self, *args, **kwargs):
         print(f"Using function {self.pipefunction.__name__}")
-        return self.pipefunction(*args, **kwargs)
+        with span(f'preprocessing.{self.pipetype}', dataset=self.dataset):
+            return self.pipefunction(*args, **kwargs)
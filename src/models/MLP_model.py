@@ -0,0 +1,338 @@
+import os
+import time
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from itertools import product
+
+from src._lazy import lazy_module
+from src.data.cleaners import iter_crash_chunks
+from src.evaluation.evaluate import fold_metrics
+from src.features.preprocessing import Preprocessing
+from src.models.base_model import CVEngine, take_rows
+from src.models.search import make_rung_evaluator, successive_halving
+from src.models.tracking import RunLogger
+from src.pipeline import profiling
+from src.pipeline.profiling import span
+
+# heavy libraries, imported on first attribute access
+mlflow = lazy_module("mlflow")
+torch = lazy_module("torch")
+
+PARAM_GRID = {
+    "hidden": [(64,), (128, 64)],
+    "lr": [1e-3, 3e-3],
+    "weight_decay": [1e-5],
+    "dropout": [0.1],
+    "batch_size": [2048],
+}
+
+HALVING_BUDGETS = [ # no 'rows' budget, subsampling would copy the memory mapped X into memory
+    {"n_folds": 1, "max_epochs": 3},
+    {"n_folds": 2, "max_epochs": 8},
+    {"n_folds": 5, "max_epochs": 20},
+]
+
+
+STOP_SIZE = 0.1 # fraction of each training fold held out for early stopping, like xgboost_model
+PATIENCE = 3 # epochs without a better stop loss before training ends
+PREDICT_BATCH = 65536
+STATS_CHUNK = 262144 # rows per pass when computing the input scaling
+
+
+def configure_threads(n_threads=None, loader_workers=0):
+    """Intra-op threads for the training process, by default one per core not taken by a DataLoader worker."""
+    n_threads = n_threads or max(1, (os.cpu_count() or 1) - loader_workers)
+    torch.set_num_threads(n_threads)
+    try:
+        torch.set_num_interop_threads(1) # the network is one sequential stack, nothing to run side by side
+    except RuntimeError:
+        pass # only settable before the first parallel op
+    return n_threads
+
+
+def make_network(n_features, hidden=(64,), dropout=0.0):
+    layers = []
+    width = n_features
+    for size in hidden:
+        layers += [torch.nn.Linear(width, size), torch.nn.ReLU()]
+        if dropout:
+            layers.append(torch.nn.Dropout(dropout))
+        width = size
+    layers.append(torch.nn.Linear(width, 1))
+    return torch.nn.Sequential(*layers)
+
+
+def column_stats(X, rows):
+    """Mean and std of X[rows] per column, streamed STATS_CHUNK rows at a time so memmaps are never read whole."""
+    total = np.zeros(X.shape[1])
+    total_sq = np.zeros(X.shape[1])
+    for start in range(0, len(rows), STATS_CHUNK):
+        chunk = np.asarray(X[rows[start:start + STATS_CHUNK]], dtype=np.float64)
+        total += chunk.sum(axis=0)
+        total_sq += np.square(chunk).sum(axis=0)
+    mean = total / len(rows)
+    std = np.sqrt(np.maximum(total_sq / len(rows) - mean ** 2, 0))
+    std[std == 0] = 1.0 # constant columns pass through centered
+    return mean.astype(np.float32), std.astype(np.float32)
+
+
+class RowBatches:
+    """
+    Map style dataset whose items are whole minibatches, item i being rows order[i * batch_size:(i + 1) * batch_size]
+    of X / y read in sorted row order. Used with DataLoader(batch_size=None) so each worker reads entire batches
+    straight from the memmap instead of collating single rows. Workers are forked, the memmap isn't copied.
+    """
+    def __init__(self, X, y, rows, batch_size, shuffle=False, seed=42):
+        self.X, self.y = X, y
+        self.rows = np.asarray(rows)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        """Reshuffles for epoch, call before creating the epoch's DataLoader iterator."""
+        self.order = np.random.default_rng(self.seed + epoch).permutation(self.rows) if self.shuffle else self.rows
+
+    def __len__(self):
+        return -(-len(self.rows) // self.batch_size)
+
+    def batch_rows(self, i):
+        return np.sort(self.order[i * self.batch_size:(i + 1) * self.batch_size])
+
+    def __getitem__(self, i):
+        idx = self.batch_rows(i)
+        return np.asarray(self.X[idx], dtype=np.float32), np.asarray(self.y[idx], dtype=np.float32)
+
+
+def iter_batches(dataset, loader_workers=0, buffers=None):
+    """
+    (X, y) tensors for every batch of dataset. Without workers the batches are read into the preallocated
+    buffers, reused for every batch, so an epoch allocates nothing per batch. With workers a DataLoader
+    reads ahead in loader_workers processes, batches land in pinned memory when a GPU is there to copy to.
+    """
+    if loader_workers == 0:
+        X_buf, y_buf = buffers
+        for i in range(len(dataset)):
+            idx = dataset.batch_rows(i)
+            n = len(idx)
+            X_buf[:n] = dataset.X[idx]
+            y_buf[:n] = dataset.y[idx]
+            yield torch.from_numpy(X_buf[:n]), torch.from_numpy(y_buf[:n])
+        return
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, shuffle=False, num_workers=loader_workers,
+                                         pin_memory=torch.cuda.is_available(), prefetch_factor=4)
+    yield from loader
+
+
+def make_buffers(batch_size, n_features):
+    return np.empty((batch_size, n_features), dtype=np.float32), np.empty(batch_size, dtype=np.float32)
+
+
+class MLPModel:
+    """Fitted network with its input scaling. predict_proba streams X (array or memmap) through it in batches."""
+    def __init__(self, net, mean, std, best_epoch=None, history=None, train_rows_per_s=None):
+        self.net = net.eval()
+        self.mean = torch.from_numpy(mean)
+        self.std = torch.from_numpy(std)
+        self.best_epoch = best_epoch
+        self.history = history or []
+        self.train_rows_per_s = train_rows_per_s
+        self.predict_rows_per_s = None
+
+    def decision_function(self, X, rows=None, batch_size=PREDICT_BATCH):
+        """Logits for X[rows] (all rows by default), rows in the order given."""
+        n = X.shape[0] if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        X_buf = np.empty((min(batch_size, max(n, 1)), X.shape[1]), dtype=np.float32)
+        start_time = time.perf_counter()
+        with torch.inference_mode():
+            for start in range(0, n, batch_size):
+                stop = min(start + batch_size, n)
+                X_buf[:stop - start] = X[start:stop] if rows is None else X[rows[start:stop]]
+                xb = torch.from_numpy(X_buf[:stop - start])
+                xb.sub_(self.mean).div_(self.std)
+                out[start:stop] = self.net(xb).squeeze(1).numpy()
+        self.predict_rows_per_s = n / max(time.perf_counter() - start_time, 1e-9)
+        return out
+
+    def predict_proba(self, X, rows=None, batch_size=PREDICT_BATCH):
+        p = 1.0 / (1.0 + np.exp(-self.decision_function(X, rows=rows, batch_size=batch_size).astype(np.float64)))
+        return np.column_stack([1.0 - p, p])
+
+
+def build_fold(X, y, train_idx, val_idx):
+    """Fold data for CVEngine, row positions only so X stays memory mapped."""
+    return {"X": X, "y": np.asarray(y), "train_idx": train_idx, "val_idx": val_idx, "y_val": take_rows(y, val_idx)}
+
+
+def evaluate_fold(model, fold):
+    y_proba = model.predict_proba(fold["X"], rows=fold["val_idx"])[:, 1]
+    metrics = fold_metrics(fold["y_val"], y_proba, threshold=0.5)
+    metrics["train_rows_per_s"] = model.train_rows_per_s
+    metrics["predict_rows_per_s"] = model.predict_rows_per_s
+    metrics["best_epoch"] = model.best_epoch
+    return metrics
+
+
+def fit_fold(params, fold, n_threads=None, max_epochs=20, patience=PATIENCE, loader_workers=0, seed=42):
+    """
+    Minibatch Adam on the fold's training rows minus STOP_SIZE of them, stopping once the log loss on those
+    held out rows hasn't improved for patience epochs. Returns the best epoch's network.
+    """
+    assert max_epochs >= 1, f"max_epochs must be at least 1 but is {max_epochs}"
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+    X, y = fold["X"], fold["y"]
+    if "inner_idx" not in fold: # same stop split for every grid point
+        inner_pos, stop_pos = train_test_split(np.arange(len(fold["train_idx"])), test_size=STOP_SIZE, stratify=y[fold["train_idx"]], random_state=42)
+        fold["inner_idx"], fold["stop_idx"] = np.sort(fold["train_idx"][inner_pos]), np.sort(fold["train_idx"][stop_pos])
+        fold["scaling"] = column_stats(X, fold["inner_idx"])
+    mean, std = fold["scaling"]
+
+    torch.manual_seed(seed)
+    net = make_network(X.shape[1], hidden=params["hidden"], dropout=params.get("dropout", 0.0))
+    optimizer = torch.optim.Adam(net.parameters(), lr=params["lr"], weight_decay=params.get("weight_decay", 0.0))
+    loss_fn = torch.nn.BCEWithLogitsLoss()
+    mean_t, std_t = torch.from_numpy(mean), torch.from_numpy(std)
+    batch_size = params["batch_size"]
+    dataset = RowBatches(X, y, fold["inner_idx"], batch_size, shuffle=True, seed=seed)
+    buffers = make_buffers(batch_size, X.shape[1]) if loader_workers == 0 else None
+    model = MLPModel(net, mean, std)
+    stop_y = y[fold["stop_idx"]]
+
+    best_loss, best_state, best_epoch, stale = float("inf"), None, None, 0
+    rows_seen, train_seconds = 0, 0.0
+    for epoch in range(max_epochs):
+        with span('mlp.epoch', epoch=epoch):
+            dataset.set_epoch(epoch)
+            net.train()
+            start = time.perf_counter()
+            for xb, yb in iter_batches(dataset, loader_workers=loader_workers, buffers=buffers):
+                xb.sub_(mean_t).div_(std_t)
+                optimizer.zero_grad(set_to_none=True)
+                loss = loss_fn(net(xb).squeeze(1), yb)
+                loss.backward()
+                optimizer.step()
+                rows_seen += len(yb)
+            train_seconds += time.perf_counter() - start
+
+            net.eval()
+            p = np.clip(model.predict_proba(X, rows=fold["stop_idx"])[:, 1], 1e-7, 1 - 1e-7)
+            stop_loss = float(-np.mean(stop_y * np.log(p) + (1 - stop_y) * np.log(1 - p)))
+            model.history.append(stop_loss)
+        if stop_loss < best_loss - 1e-5:
+            best_loss, best_epoch, stale = stop_loss, epoch, 0
+            best_state = {key : value.detach().clone() for key, value in net.state_dict().items()}
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    if best_state is None: # the stop loss was nan from the first epoch on
+        raise FloatingPointError(f"MLP training diverged with params {params}, stop log loss per epoch: {model.history}. Check the features for nan or infinite values, or lower lr.")
+    net.load_state_dict(best_state)
+    model.net = net.eval()
+    model.best_epoch = best_epoch
+    model.train_rows_per_s = rows_seen / max(train_seconds, 1e-9)
+    return model
+
+
+def make_engine(X, y, k=5):
+    return CVEngine(X, y, k=k, build_fold=build_fold)
+
+
+def cross_validate(params, X, y, k=5, return_final_model=False, n_folds=None, engine=None, **fit_kwargs):
+    """
+    Pass the same engine (make_engine(X, y)) for every grid point to reuse the folds, their stop splits and input scaling.
+    n_folds stops after the first n_folds of the k folds.
+    """
+    engine = engine or make_engine(X, y, k=k)
+    return engine.cross_validate(fit_fold, evaluate_fold, params, return_final_model=return_final_model, n_folds=n_folds, **fit_kwargs)
+
+
+def predict_file(model, path, feature_builder=None, columns=None, out_path=None, batch_size=PREDICT_BATCH, verbose=True):
+    """
+    Scores a file too big for memory in batches of batch_size rows. A .npy design matrix is memory mapped and
+    scored as is, anything else is read as raw nyc-crashes data with iter_crash_chunks and transformed by the
+    fitted feature_builder into columns first. out_path saves the scores as .npy. Returns the scores.
+    """
+    start = time.perf_counter()
+    if path.endswith('.npy'):
+        scores = model.predict_proba(np.load(path, mmap_mode='r'), batch_size=batch_size)[:, 1]
+    else:
+        assert feature_builder is not None and columns is not None, "Raw data needs the fitted feature_builder and the model's columns"
+        parts = []
+        for chunk in iter_crash_chunks(columns=feature_builder.required_columns, chunksize=batch_size, path=path):
+            X = feature_builder.transform(chunk)[list(columns)].to_numpy(np.float32)
+            parts.append(model.predict_proba(X, batch_size=batch_size)[:, 1])
+        scores = np.concatenate(parts) if parts else np.empty(0)
+    rows_per_s = len(scores) / max(time.perf_counter() - start, 1e-9)
+    if out_path:
+        np.save(out_path, scores)
+    if verbose:
+        print(f"Scored {len(scores)} rows from {path} at {rows_per_s:,.0f} rows/s")
+    return scores
+
+
+def train_mlp(dataset, verbose=True, search="grid", reduction_factor=3, plots="render", n_threads=None, loader_workers=0, max_epochs=20, chunksize=500000):
+    """
+    Features come from the chunked pipeline as memory mapped arrays and are only read a minibatch at a time.
+    n_threads sets torch's intra-op threads (all cores not used by loader_workers by default), loader_workers > 0
+    reads batches ahead in DataLoader worker processes. search="halving" runs successive halving over HALVING_BUDGETS,
+    its rungs capped at max_epochs and its last rung trained for max_epochs like the grid.
+    """
+    assert search in ("grid", "halving"), f"search must be 'grid' or 'halving' but is {search}"
+    if verbose:
+        print("Beginning preprocessing")
+    X, y = Preprocessing(dataset, 'chunked_pipe')(chunksize=chunksize)
+    n_threads = configure_threads(n_threads, loader_workers)
+
+    param_grid = PARAM_GRID
+    if verbose:
+        print(f"Preprocessing complete! Training {X.shape[0]} x {X.shape[1]} memory mapped rows with {n_threads} threads on param grid with 5-fold CV:\n{param_grid}")
+
+    best_score = -float("inf")
+    best_model = None
+    best_params = None
+    best_metrics = None
+
+    keys, values = zip(*param_grid.items())
+    param_list = [dict(zip(keys, v)) for v in product(*values)]
+    if search == "halving":
+        budgets = [dict(budget, loader_workers=loader_workers, max_epochs=min(budget["max_epochs"], max_epochs)) for budget in HALVING_BUDGETS]
+        budgets[-1]["max_epochs"] = max_epochs
+        evaluate_rung = make_rung_evaluator(make_engine, fit_fold, evaluate_fold, X, y, k=5)
+        runs = successive_halving(param_list, evaluate_rung, budgets, eta=reduction_factor, verbose=verbose)
+    else:
+        engine = make_engine(X, y, k=5) # folds, stop splits and scaling computed once for the whole grid
+        results = (cross_validate(params, X, y, return_final_model=True, engine=engine, max_epochs=max_epochs, loader_workers=loader_workers)
+                   for params in param_list)
+        runs = ((params, result, {}, True) for params, result in zip(param_list, results))
+
+    logger = RunLogger(plots=plots) # runs are logged from the parent process, off the training thread
+    span_mark = profiling.mark()
+    for params, (metrics, avg_conf_matrix, fitted_model), budget, final in runs:
+        span_metrics = profiling.summarize(profiling.records(since=span_mark, this_thread=True)) # this thread's spans since the last run, empty unless profiling is enabled
+        span_mark = profiling.mark()
+        logger.log_run(dict(params, hidden=str(params["hidden"]), **budget), dict(metrics, **span_metrics), conf_matrix=avg_conf_matrix)
+
+        if final and metrics["roc_auc"] > best_score: # only full budget runs compete for best
+            best_score = metrics["roc_auc"]
+            best_model = fitted_model
+            best_params = params
+            best_metrics = metrics
+
+        if verbose:
+            print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+            print(f"Throughput: train {metrics['train_rows_per_s']:,.0f} rows/s, predict {metrics['predict_rows_per_s']:,.0f} rows/s")
+    logger.flush()
+    logger.close()
+
+    if verbose:
+        print("\n✅ Best Model:")
+        print(f"Params: {best_params}")
+        print(f"Metrics: {best_metrics}")
+
+    return best_model
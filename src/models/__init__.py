@@ -1,4 +1,3 @@
-from .linear_model import *
-from .MLP_model import *
-from .random_forest import *
-from .xgboost_model import *
\ No newline at end of file
+from src._lazy import attach
+
+__getattr__, __dir__ = attach(__name__, ['artifact', 'base_model', 'linear_model', 'MLP_model', 'parallel', 'random_forest', 'refresh', 'results', 'search', 'tracking', 'xgboost_model'])
@@ -0,0 +1,116 @@
+# src/models/artifact.py
+"""
+Self-contained model artifacts for scoring: a directory holding
+
+    manifest.json   format version, model type, feature columns, params/metrics, refresh state and file list
+    builder.json    fitted CrashFeatureBuilder state (vocabularies, categories, peak hour)
+    model.ubj       XGBoost booster in UBJSON, or
+    coef.npy        logistic regression coefficients, intercept kept in the manifest
+
+Loading needs numpy and pandas only (plus xgboost for boosters), never the training stack.
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from src.features.build_features import CrashFeatureBuilder
+
+FORMAT_VERSION = 1
+
+class LogisticArtifact:
+    """Logistic regression scored straight from its coefficients, predict_proba matches sklearn's."""
+    model_type = 'logistic'
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+
+    def predict_proba(self, X):
+        X = X if hasattr(X, 'tocsr') else np.asarray(X, dtype=np.float64) # scipy sparse multiplies as is
+        p = 1.0 / (1.0 + np.exp(-(X @ self.coef + self.intercept)))
+        return np.column_stack([1.0 - p, p])
+
+class XGBoostArtifact:
+    """Booster scored with inplace_predict up to best_iteration, no DMatrix per call."""
+    model_type = 'xgboost'
+
+    def __init__(self, booster, best_iteration=None):
+        self.booster = booster
+        self.best_iteration = best_iteration
+
+    def predict_proba(self, X):
+        iteration_range = (0, self.best_iteration + 1) if self.best_iteration is not None else (0, 0)
+        p = self.booster.inplace_predict(X if hasattr(X, 'tocsr') else np.asarray(X, dtype=np.float32), iteration_range=iteration_range)
+        return np.column_stack([1.0 - p, p])
+
+def _model_type(model):
+    if hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        assert model.coef_.shape[0] == 1, "Only binary logistic regression artifacts are supported"
+        return 'logistic'
+    if type(model).__module__.startswith('xgboost'):
+        return 'xgboost'
+    raise TypeError(f"No artifact format for model type {type(model).__name__}")
+
+def save_artifact(directory, feature_builder, columns, model, params=None, metrics=None, refresh=None):
+    """
+    Writes model (a fitted LogisticRegression, SGDClassifier or xgboost Booster) with its feature transform to
+    directory, replacing it whole. refresh is the incremental update state kept by src/models/refresh.py.
+    """
+    model_type = _model_type(model)
+    tmp_dir = directory.rstrip(os.sep) + f'.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    manifest = {
+        'format_version' : FORMAT_VERSION,
+        'model_type' : model_type,
+        'created' : time.time(),
+        'builder' : feature_builder.get_config(),
+        'columns' : list(columns),
+        'params' : params or {},
+        'metrics' : {key : float(value) for key, value in (metrics or {}).items()},
+        'refresh' : refresh or {}
+    }
+    with open(os.path.join(tmp_dir, 'builder.json'), 'w') as f:
+        json.dump(feature_builder.get_state(), f)
+    if model_type == 'logistic':
+        np.save(os.path.join(tmp_dir, 'coef.npy'), model.coef_[0].astype(np.float64))
+        manifest['intercept'] = float(model.intercept_[0])
+        manifest['files'] = ['builder.json', 'coef.npy']
+    else:
+        model.save_model(os.path.join(tmp_dir, 'model.ubj'))
+        best_iteration = model.attr('best_iteration')
+        manifest['best_iteration'] = int(best_iteration) if best_iteration is not None else None
+        manifest['files'] = ['builder.json', 'model.ubj']
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return directory
+
+def load_artifact(directory):
+    """
+    Returns {'manifest', 'feature_builder', 'columns', 'model'} where model has predict_proba(X) on the
+    columns of feature_builder.transform(data)[columns]. The same dict shape serving.load_bundle returns.
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Artifact {directory} has format version {manifest.get('format_version')}, this loader reads {FORMAT_VERSION}")
+    if manifest['builder']['version'] != CrashFeatureBuilder.VERSION:
+        raise ValueError(f"Artifact {directory} was built with CrashFeatureBuilder version {manifest['builder']['version']}, current is {CrashFeatureBuilder.VERSION}")
+
+    with open(os.path.join(directory, 'builder.json')) as f:
+        feature_builder = CrashFeatureBuilder.from_state(json.load(f))
+    if manifest['model_type'] == 'logistic':
+        model = LogisticArtifact(np.load(os.path.join(directory, 'coef.npy')), manifest['intercept'])
+    else:
+        import xgboost as xgb # only artifacts holding a booster pay for the import
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(directory, 'model.ubj'))
+        model = XGBoostArtifact(booster, manifest['best_iteration'])
+    return {'manifest' : manifest, 'feature_builder' : feature_builder, 'columns' : manifest['columns'], 'model' : model}
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedKFold
+
+from src.pipeline.profiling import span
+
+def take_rows(X, idx):
+    """Positional row selection that works for DataFrames/Series and arrays alike."""
+    if isinstance(X, (pd.DataFrame, pd.Series)):
+        return X.iloc[idx]
+    return X[idx]
+
+def fold_ids(y, k=5, random_state=42):
+    """Fold number of every row under the StratifiedKFold split every trainer uses."""
+    skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=random_state)
+    ids = np.empty(len(y), dtype=np.int8)
+    for fold, (_, val_idx) in enumerate(skf.split(np.zeros(len(y)), np.asarray(y))):
+        ids[val_idx] = fold
+    return ids
+
+def summarize_folds(all_metrics, all_conf_matrices):
+    """Averages per fold metrics and confusion matrices, folds in split order."""
+    avg_metrics = {
+        metric: np.mean([fold[metric] for fold in all_metrics])
+        for metric in all_metrics[0].keys()
+    }
+    avg_conf_matrix = np.mean(all_conf_matrices, axis=0).round().astype(int)
+    return avg_metrics, avg_conf_matrix
+
+def subsample_rows(y, fraction, random_state=42):
+    """Sorted positions of a stratified fraction of the rows, the same rows for the same (y, fraction, random_state)."""
+    y = np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    keep = []
+    for label in np.unique(y):
+        rows = np.flatnonzero(y == label)
+        keep.append(rng.choice(rows, size=max(1, int(round(len(rows) * fraction))), replace=False))
+    return np.sort(np.concatenate(keep))
+
+def slice_fold(X, y, train_idx, val_idx):
+    """Default fold data, plain row slices of X and y."""
+    return {
+        "X_train": take_rows(X, train_idx), "y_train": take_rows(y, train_idx),
+        "X_val": take_rows(X, val_idx), "y_val": take_rows(y, val_idx)
+    }
+
+class CVEngine:
+    """
+    Cross validation shared by every params dict of a grid. The fold assignment is computed once per (X, y) and
+    each fold's data is built once by build_fold(X, y, train_idx, val_idx), then handed to the model's
+    fit_fold(params, fold, ...) and evaluate_fold(model, fold) for every grid point. cache_folds=False rebuilds
+    fold data on every use, for builders like slice_fold where keeping k training copies costs more than slicing.
+    With a result store (use_results) the (params, fold) cells it already holds are read instead of trained.
+    """
+    def __init__(self, X, y, k=5, build_fold=slice_fold, cache_folds=True, folds=None, random_state=42):
+        self.X, self.y, self.k = X, y, k
+        self.build_fold = build_fold
+        self.cache_folds = cache_folds
+        self.folds = fold_ids(y, k=k, random_state=random_state) if folds is None else folds
+        self._fold_data = {}
+        self.results, self.result_tag = None, {}
+
+    def use_results(self, results, **tag):
+        """Memoizes fold metrics in results (a CVResultStore), tag tells apart engines over other rows of the same data."""
+        self.results, self.result_tag = results, tag
+        return self
+
+    def cached(self, params, fold, fit_kwargs):
+        if self.results is None:
+            return None
+        return self.results.get(params, fold, fit_kwargs=fit_kwargs, **self.result_tag)
+
+    def remember(self, params, fold, fit_kwargs, metrics):
+        if self.results is not None:
+            self.results.put(params, fold, metrics, fit_kwargs=fit_kwargs, **self.result_tag)
+
+    def split(self, fold):
+        """(train_idx, val_idx) of a fold, the same rows and order StratifiedKFold.split gives."""
+        return np.flatnonzero(self.folds != fold), np.flatnonzero(self.folds == fold)
+
+    def fold(self, fold):
+        if fold in self._fold_data:
+            return self._fold_data[fold]
+        data = self.build_fold(self.X, self.y, *self.split(fold))
+        if self.cache_folds:
+            self._fold_data[fold] = data
+        return data
+
+    def clear(self):
+        self._fold_data.clear()
+
+    def cross_validate(self, fit_fold, evaluate_fold, params, return_final_model=False, n_folds=None, **fit_kwargs):
+        """
+        Same return value as the trainers' cross_validate, n_folds stops after the first n_folds of the k folds.
+        The final model is None when the last fold came from the result store, see fit_final.
+        """
+        all_metrics = []
+        all_conf_matrices = []
+        model = None
+        for fold in range(n_folds or self.k):
+            fold_metrics = self.cached(params, fold, fit_kwargs)
+            if fold_metrics is not None:
+                model = None
+            else:
+                with span('cv.fold', fold=fold):
+                    with span('cv.build_fold'):
+                        data = self.fold(fold)
+                    with span('cv.fit'):
+                        model = fit_fold(params, data, **fit_kwargs)
+                    with span('cv.evaluate'):
+                        fold_metrics = evaluate_fold(model, data)
+                self.remember(params, fold, fit_kwargs, fold_metrics)
+            all_conf_matrices.append(fold_metrics.pop("conf_matrix"))
+            all_metrics.append(fold_metrics)
+
+        avg_metrics, avg_conf_matrix = summarize_folds(all_metrics, all_conf_matrices)
+        if return_final_model:
+            return avg_metrics, avg_conf_matrix, model # last fold model
+        return avg_metrics, avg_conf_matrix
+
+    def fit_final(self, fit_fold, params, n_folds=None, **fit_kwargs):
+        """The model cross_validate returns (trained on the last fold run), for params whose last fold was memoized."""
+        return fit_fold(params, self.fold((n_folds or self.k) - 1), **fit_kwargs)
@@ -1,93 +1,91 @@
-import mlflow
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import (
-    roc_auc_score, accuracy_score, f1_score,
-    precision_score, recall_score, confusion_matrix
-)
 
 from itertools import product
-import os
 
+from src._lazy import lazy_module
+from src.evaluation.evaluate import fold_metrics
 from src.features.preprocessing import Preprocessing
-
-
-def evaluate_fold(model, X_val, y_val):
+from src.models.base_model import CVEngine, slice_fold
+from src.models.parallel import run_grid_parallel
+from src.models.results import CVResultStore, invalidate
+from src.models.search import budget_fit_kwargs, budget_tag, make_rung_evaluator, successive_halving
+from src.models.tracking import RunLogger, log_png, render_confusion_matrix
+from src.pipeline import profiling
+
+# heavy libraries, imported on first attribute access
+mlflow = lazy_module("mlflow")
+
+PARAM_GRID = {
+    "C": [0.1, 1.0, 10],
+    "penalty": ["l2"],
+    "solver": ["lbfgs"],
+    "max_iter": [500],
+}
+
+HALVING_BUDGETS = [ # successive halving rungs, cheap to full
+    {"rows": 0.25, "n_folds": 2},
+    {"rows": 0.5, "n_folds": 3},
+    {"rows": 1.0, "n_folds": 5},
+]
+
+
+def evaluate_fold(model, fold):
+    X_val, y_val = fold["X_val"], fold["y_val"]
     y_proba = model.predict_proba(X_val)[:, 1]
-    y_pred = (y_proba >= 0.5).astype(int)
-
-    return {
-        "roc_auc": roc_auc_score(y_val, y_proba),
-        "accuracy": accuracy_score(y_val, y_pred),
-        "f1": f1_score(y_val, y_pred),
-        "precision": precision_score(y_val, y_pred),
-        "recall": recall_score(y_val, y_pred),
-        "conf_matrix": confusion_matrix(y_val, y_pred)
-    }
+    return fold_metrics(y_val, y_proba, threshold=0.5)
 
 
-def cross_validate(params, X, y, k=5, return_final_model=False):
-    skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=42)
-    all_metrics = []
-    all_conf_matrices = []
-
-    best_model = None
+def fit_fold(params, fold, n_threads=None):
+    model = LogisticRegression(**params) # lbfgs threads come from BLAS, capped by the parallel engine
+    model.fit(fold["X_train"], fold["y_train"])
+    return model
 
-    for train_idx, val_idx in skf.split(X, y):
-        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
-        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
 
-        model = LogisticRegression(**params)
-        model.fit(X_train, y_train)
+def make_engine(X, y, k=5):
+    return CVEngine(X, y, k=k, build_fold=slice_fold, cache_folds=False) # slicing is cheap next to a fit, k copies of X aren't
 
-        fold_metrics = evaluate_fold(model, X_val, y_val)
-        all_conf_matrices.append(fold_metrics.pop("conf_matrix"))
-        all_metrics.append(fold_metrics)
 
-        if return_final_model:
-            best_model = model  # last fold model
-
-    avg_metrics = {
-        metric: np.mean([fold[metric] for fold in all_metrics])
-        for metric in all_metrics[0].keys()
-    }
-    avg_conf_matrix = np.mean(all_conf_matrices, axis=0).round().astype(int)
-
-    if return_final_model:
-        return avg_metrics, avg_conf_matrix, best_model
-    return avg_metrics, avg_conf_matrix
+def cross_validate(params, X, y, k=5, return_final_model=False, n_folds=None, engine=None):
+    """
+    Pass the same engine (make_engine(X, y)) for every grid point to reuse the fold assignment.
+    n_folds stops after the first n_folds of the k folds.
+    """
+    engine = engine or make_engine(X, y, k=k)
+    return engine.cross_validate(fit_fold, evaluate_fold, params, return_final_model=return_final_model, n_folds=n_folds)
 
 
 def log_confusion_matrix(conf_matrix, run_id):
-    plt.figure(figsize=(5, 4))
-    sns.heatmap(conf_matrix, annot=True, fmt="d", cmap="Blues", cbar=False)
-    plt.title("Avg Confusion Matrix (5-fold)")
-    plt.xlabel("Predicted")
-    plt.ylabel("Actual")
-
-    os.makedirs("plots", exist_ok=True)
-    path = f"plots/conf_matrix_{run_id}.png"
-    plt.savefig(path)
-    mlflow.log_artifact(path, artifact_path="confusion_matrices")
-    plt.close()
-
-
-def train_logistic(dataset, verbose=True):
+    log_png(mlflow.MlflowClient(), run_id, render_confusion_matrix(conf_matrix))
+
+
+def train_logistic(dataset, verbose=True, n_jobs=1, threads_per_worker=1, search="grid", reduction_factor=3, plots="render", feature_builder=None, memoize=True):
+    """
+    n_jobs > 1 runs every (params, fold) pair as its own task on a process pool, see run_grid_parallel.
+    search="halving" runs successive halving over HALVING_BUDGETS, keeping the best 1/reduction_factor of each rung.
+    plots="deferred" logs confusion matrices as json for tracking.render_deferred, "skip" drops them, see RunLogger.
+    feature_builder replaces the default CrashFeatureBuilder, a sparse one (CrashFeatureBuilder.wide()) trains on CSR directly.
+    memoize reads and writes per (params, fold) results in a CVResultStore, so only cells not run on the same data,
+    features and budget before are trained, and runs read entirely from it aren't logged to MLflow again. Result
+    sets of raw data that has since changed are dropped, other feature builders' and presets' are kept.
+    """
+    assert search in ("grid", "halving"), f"search must be 'grid' or 'halving' but is {search}"
+    assert n_jobs == 1 or feature_builder is None or not feature_builder.sparse, "the process pool shares dense memory maps, train sparse features with n_jobs=1"
     if verbose:
         print("Beginning preprocessing")
-    X, y = Preprocessing(dataset, 'full_pipe')(as_df=False)
-
-    param_grid = {
-        "C": [0.1, 1.0, 10],
-        "penalty": ["l2"],
-        "solver": ["lbfgs"],
-        "max_iter": [500],
-    }
+    processor = Preprocessing(dataset, 'full_pipe', feature_builder=feature_builder)
+    X, y = processor(as_df=False)
+
+    store = None
+    if memoize:
+        store = CVResultStore.for_pipeline(processor, "logistic")
+        dropped = invalidate(dataset, raw=store.context["raw"]) # results of replaced raw data can't be read again
+        if verbose:
+            print(f"{len(store.cells)} memoized (params, fold) results" + (f", dropped {dropped} stale result sets" if dropped else ""))
+
+    param_grid = PARAM_GRID
     if verbose:
         print(f"Preprocessing complete! Training on param grad with 5-fold CV:\n{param_grid}")
 
@@ -97,25 +95,48 @@ def train_logistic(dataset, verbose=True):
     best_metrics = None
 
     keys, values = zip(*param_grid.items())
-    for v in product(*values):
-        params = dict(zip(keys, v))
-
-        with mlflow.start_run() as run:
-            mlflow.log_params(params)
-
-            metrics, avg_conf_matrix, fitted_model = cross_validate(params, X, y, k=5, return_final_model=True)
-
-            mlflow.log_metrics(metrics)
-            log_confusion_matrix(avg_conf_matrix, run.info.run_id)
-
-            if metrics["roc_auc"] > best_score:
-                best_score = metrics["roc_auc"]
-                best_model = fitted_model
-                best_params = params
-                best_metrics = metrics
-
-            if verbose:
-                print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+    param_list = [dict(zip(keys, v)) for v in product(*values)]
+    if search == "halving":
+        evaluate_rung = make_rung_evaluator(make_engine, fit_fold, evaluate_fold, X, y, k=5, n_jobs=n_jobs, threads_per_worker=threads_per_worker,
+                                            results=store)
+        runs = successive_halving(param_list, evaluate_rung, HALVING_BUDGETS, eta=reduction_factor, verbose=verbose)
+    else:
+        engine = make_engine(X, y, k=5).use_results(store, rows=1.0) # fold assignment computed once for the whole grid, cells shared with the full halving rung
+        if n_jobs == 1:
+            results = (cross_validate(params, X, y, return_final_model=True, engine=engine) for params in param_list)
+        else:
+            results = run_grid_parallel(fit_fold, evaluate_fold, param_list, engine, n_jobs=n_jobs,
+                                        threads_per_worker=threads_per_worker, return_final_model=True)
+        runs = ((params, result, {}, True) for params, result in zip(param_list, results))
+
+    logger = RunLogger(plots=plots) # runs are logged from the parent process, off the training thread
+    memoized_runs = 0
+    span_mark = profiling.mark()
+    for params, (metrics, avg_conf_matrix, fitted_model), budget, final in runs:
+        span_metrics = profiling.summarize(profiling.records(since=span_mark, this_thread=True)) # this thread's spans since the last run, empty unless profiling is enabled
+        span_mark = profiling.mark()
+        if store is not None and store.memoized(params, budget.get("n_folds", 5), **budget_tag(budget)):
+            memoized_runs += 1 # logged when its folds were trained
+        else:
+            logger.log_run(dict(params, **budget), dict(metrics, **span_metrics), conf_matrix=avg_conf_matrix)
+
+        if final and metrics["roc_auc"] > best_score: # only full budget runs compete for best
+            best_score = metrics["roc_auc"]
+            best_model = fitted_model
+            best_params = params
+            best_metrics = metrics
+
+        if verbose:
+            print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+    logger.flush()
+    logger.close()
+    if verbose and memoized_runs:
+        print(f"{memoized_runs} run(s) read entirely from the result store were not logged again")
+
+    if best_model is None and best_params is not None: # the best params' last fold was memoized, refit just that fold
+        final_budget = HALVING_BUDGETS[-1] if search == "halving" else {}
+        refit_engine = engine if search == "grid" else make_engine(X, y, k=5)
+        best_model = refit_engine.fit_final(fit_fold, best_params, n_folds=final_budget.get("n_folds"), **budget_fit_kwargs(final_budget))
 
     if verbose:
         print("\n✅ Best Model:")
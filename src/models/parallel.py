@@ -0,0 +1,88 @@
+# src/models/parallel.py
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from src.models.base_model import CVEngine, summarize_folds
+
+_SHARED = {} # per worker process: a CVEngine over memory mapped X and y, set up once by _init_worker
+
+def _npy_path(arr):
+    """Path of the .npy file backing arr when it's a whole-file memory map, so it can be shared as is."""
+    filename = getattr(arr, 'filename', None)
+    if isinstance(arr, np.memmap) and filename and filename.endswith('.npy'):
+        if np.load(filename, mmap_mode='r').shape == arr.shape:
+            return filename
+    return None
+
+def _share(arr, directory, name):
+    if isinstance(arr, (pd.DataFrame, pd.Series)):
+        arr = arr.to_numpy()
+    path = _npy_path(arr)
+    if path is None:
+        path = os.path.join(directory, f'{name}.npy')
+        np.save(path, np.ascontiguousarray(arr))
+    return path
+
+def _init_worker(X_path, y_path, folds_path, k, build_fold, cache_folds, threads):
+    X = np.load(X_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    _SHARED['engine'] = CVEngine(X, y, k=k, build_fold=build_fold, cache_folds=cache_folds, folds=np.load(folds_path))
+    _SHARED['threads'] = threads
+    _SHARED['limits'] = threadpool_limits(limits=threads) # keep BLAS/OpenMP pools from oversubscribing the cpus
+
+def _run_task(fit_fold, evaluate_fold, params, fold, return_model, fit_kwargs):
+    data = _SHARED['engine'].fold(fold) # built once per worker and fold, reused by later grid points
+    model = fit_fold(params, data, n_threads=_SHARED['threads'], **fit_kwargs)
+    metrics = evaluate_fold(model, data)
+    return metrics, model if return_model else None
+
+def run_grid_parallel(fit_fold, evaluate_fold, param_list, engine, n_jobs=None, threads_per_worker=1, return_final_model=False, n_folds=None, **fit_kwargs):
+    """
+    Cross validates every params dict in param_list with each (params, fold) pair as its own task on a process pool.
+
+    The engine's X, y and fold assignment are shared with the workers as memory mapped .npy files (memory mapped
+    inputs are used in place) instead of being pickled per task, each worker rebuilds the engine with the same
+    build_fold so fold data is built once per worker and fold, and caps its BLAS/OpenMP threads at
+    threads_per_worker. fit_fold(params, fold, n_threads, **fit_kwargs), evaluate_fold(model, fold) and
+    engine.build_fold must be module level functions. Returns a list with the same (avg_metrics, avg_conf_matrix[,
+    last_fold_model]) tuples as engine.cross_validate, in param_list order. n_folds runs only the first n_folds folds.
+    Cells the engine's result store holds aren't submitted, their final model is None like engine.cross_validate's.
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    n_folds = n_folds or engine.k
+    cached = {(p, fold) : engine.cached(params, fold, fit_kwargs) for p, params in enumerate(param_list) for fold in range(n_folds)}
+    missing = [cell for cell, metrics in cached.items() if metrics is None]
+    tmp_dir = tempfile.mkdtemp(prefix='tdsp-grid-')
+    try:
+        X_path = _share(engine.X, tmp_dir, 'X')
+        y_path = _share(engine.y, tmp_dir, 'y')
+        folds_path = os.path.join(tmp_dir, 'folds.npy')
+        np.save(folds_path, engine.folds)
+
+        with ProcessPoolExecutor(max_workers=min(n_jobs, max(len(missing), 1)), initializer=_init_worker, initargs=(X_path, y_path, folds_path, engine.k, engine.build_fold, engine.cache_folds, threads_per_worker)) as pool:
+            futures = {
+                (p, fold): pool.submit(_run_task, fit_fold, evaluate_fold, param_list[p], fold, return_final_model and fold == n_folds - 1, fit_kwargs)
+                for p, fold in missing
+            }
+            results = []
+            for p in range(len(param_list)):
+                all_metrics, all_conf_matrices = [], []
+                for fold in range(n_folds):
+                    if (p, fold) in futures:
+                        fold_metrics, model = futures[(p, fold)].result()
+                        engine.remember(param_list[p], fold, fit_kwargs, fold_metrics)
+                    else:
+                        fold_metrics, model = cached[(p, fold)], None
+                    all_conf_matrices.append(fold_metrics.pop("conf_matrix"))
+                    all_metrics.append(fold_metrics)
+                avg_metrics, avg_conf_matrix = summarize_folds(all_metrics, all_conf_matrices)
+                results.append((avg_metrics, avg_conf_matrix, model) if return_final_model else (avg_metrics, avg_conf_matrix))
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,184 @@
+import copy
+import os
+import numpy as np
+
+from sklearn.ensemble import RandomForestClassifier
+
+from itertools import product
+
+from src._lazy import lazy_module
+from src.evaluation.evaluate import fold_metrics
+from src.features.preprocessing import Preprocessing
+from src.models.base_model import CVEngine, slice_fold, summarize_folds
+from src.models.tracking import RunLogger
+from src.pipeline import profiling
+from src.pipeline.profiling import span
+
+# heavy libraries, imported on first attribute access
+mlflow = lazy_module("mlflow")
+
+PARAM_GRID = {
+    "n_estimators": [50, 100, 200], # swept with warm_start, one forest per fold grows through every size
+    "max_depth": [8, 16],
+    "min_samples_leaf": [5],
+    "max_features": ["sqrt"],
+}
+
+MAX_JOBS = 4 # default cap on trees fit in parallel, n_jobs=-1 would oversubscribe next to BLAS and the tracking thread
+
+
+def bounded_jobs(n_jobs=None):
+    """n_jobs for sklearn, never more than the cores there are and MAX_JOBS unless asked for."""
+    cores = os.cpu_count() or 1
+    return max(1, min(n_jobs or MAX_JOBS, cores))
+
+
+def make_forest(params, n_jobs=None, **kwargs):
+    return RandomForestClassifier(**params, n_jobs=bounded_jobs(n_jobs), random_state=42, **kwargs)
+
+
+def evaluate_fold(model, fold):
+    y_proba = model.predict_proba(fold["X_val"])[:, 1]
+    return fold_metrics(fold["y_val"], y_proba, threshold=0.5)
+
+
+def fit_fold(params, fold, n_threads=None):
+    return make_forest(params, n_jobs=n_threads).fit(fold["X_train"], fold["y_train"])
+
+
+def make_engine(X, y, k=5):
+    # trees work in float32, converting once here saves a copy per fit
+    return CVEngine(np.asarray(X, dtype=np.float32), y, k=k, build_fold=slice_fold, cache_folds=False)
+
+
+def cross_validate(params, X, y, k=5, return_final_model=False, n_folds=None, engine=None, n_jobs=None):
+    """
+    Pass the same engine (make_engine(X, y)) for every grid point to reuse the fold assignment.
+    n_folds stops after the first n_folds of the k folds.
+    """
+    engine = engine or make_engine(X, y, k=k)
+    return engine.cross_validate(fit_fold, evaluate_fold, params, return_final_model=return_final_model, n_folds=n_folds, n_threads=n_jobs)
+
+
+def truncate_forest(model, n_estimators):
+    """Shallow copy of a fitted forest keeping its first n_estimators trees, the forest a fresh fit of that size grows."""
+    smaller = copy.copy(model)
+    smaller.estimators_ = model.estimators_[:n_estimators]
+    smaller.n_estimators = n_estimators
+    smaller.warm_start = False
+    return smaller
+
+
+def cross_validate_sweep(params, n_estimators, X, y, k=5, return_final_model=False, n_folds=None, engine=None, n_jobs=None):
+    """
+    cross_validate for every size in n_estimators at the cost of the largest one. Each fold's forest is grown
+    with warm_start through the sorted sizes, and the validation probabilities are accumulated tree by tree so
+    every tree is also predicted once. With a fixed random_state a warm started forest holds exactly the trees
+    of a fresh fit of the same size, so results match independent fits.
+    Returns [(n_estimators, cross_validate result)] in increasing size order.
+    """
+    engine = engine or make_engine(X, y, k=k)
+    sweep = sorted(set(n_estimators))
+    fold_results = [[] for _ in sweep]
+    models = [None] * len(sweep)
+    for fold in range(n_folds or engine.k):
+        data = engine.fold(fold)
+        X_val = np.ascontiguousarray(data["X_val"], dtype=np.float32)
+        model = make_forest(params, n_jobs=n_jobs, warm_start=True)
+        positive = None
+        proba_sum = np.zeros(len(X_val))
+        built = 0
+        for i, size in enumerate(sweep):
+            with span('rf.grow', fold=fold, n_estimators=size):
+                model.set_params(n_estimators=size)
+                model.fit(data["X_train"], data["y_train"])
+            positive = positive if positive is not None else int(np.flatnonzero(model.classes_ == 1)[0])
+            for tree in model.estimators_[built:size]: # same per tree sum predict_proba makes
+                proba_sum += tree.predict_proba(X_val, check_input=False)[:, positive]
+            built = size
+            fold_results[i].append(fold_metrics(data["y_val"], proba_sum / size, threshold=0.5))
+            if return_final_model:
+                models[i] = truncate_forest(model, size) # last fold model
+    results = []
+    for i, size in enumerate(sweep):
+        conf_matrices = [metrics.pop("conf_matrix") for metrics in fold_results[i]]
+        avg_metrics, avg_conf_matrix = summarize_folds(fold_results[i], conf_matrices)
+        results.append((size, (avg_metrics, avg_conf_matrix, models[i]) if return_final_model else (avg_metrics, avg_conf_matrix)))
+    return results
+
+
+def oob_sweep(params, n_estimators, X, y, n_jobs=None):
+    """
+    Out of bag estimate of every size in n_estimators from one warm started forest on all rows, no folds.
+    Rows no tree has left out yet (only with very few trees) are skipped. Returns [(n_estimators, (metrics, conf_matrix, forest))].
+    """
+    X = np.asarray(X, dtype=np.float32)
+    model = make_forest(params, n_jobs=n_jobs, warm_start=True, oob_score=True)
+    results = []
+    for size in sorted(set(n_estimators)):
+        with span('rf.grow_oob', n_estimators=size):
+            model.set_params(n_estimators=size)
+            model.fit(X, y)
+        oob = model.oob_decision_function_
+        covered = oob.sum(axis=1) > 0
+        metrics = fold_metrics(np.asarray(y)[covered], oob[covered, int(np.flatnonzero(model.classes_ == 1)[0])], threshold=0.5)
+        metrics["oob_coverage"] = float(covered.mean())
+        results.append((size, (metrics, metrics.pop("conf_matrix"), truncate_forest(model, size))))
+    return results
+
+
+def train_random_forest(dataset, verbose=True, n_jobs=None, search="grid", plots="render"):
+    """
+    Every combination of the other PARAM_GRID keys grows one forest per fold through all n_estimators, see cross_validate_sweep.
+    search="oob" scores the sweeps with out of bag predictions of a single forest on all rows instead of 5-fold CV (oob_sweep).
+    n_jobs bounds the trees fit in parallel, by default min(MAX_JOBS, cores).
+    """
+    assert search in ("grid", "oob"), f"search must be 'grid' or 'oob' but is {search}"
+    if verbose:
+        print("Beginning preprocessing")
+    X, y = Preprocessing(dataset, 'full_pipe')(as_df=False)
+
+    param_grid = PARAM_GRID
+    if verbose:
+        print(f"Preprocessing complete! Training on param grid with {'out of bag scoring' if search == 'oob' else '5-fold CV'}:\n{param_grid}")
+
+    best_score = -float("inf")
+    best_model = None
+    best_params = None
+    best_metrics = None
+
+    sweep = param_grid["n_estimators"]
+    keys, values = zip(*[(key, value) for key, value in param_grid.items() if key != "n_estimators"])
+    families = [dict(zip(keys, v)) for v in product(*values)]
+    if search == "oob":
+        runs = ((dict(params, n_estimators=size), result, {"scoring": "oob"}, True)
+                for params in families for size, result in oob_sweep(params, sweep, X, y, n_jobs=n_jobs))
+    else:
+        engine = make_engine(X, y, k=5) # fold assignment computed once for the whole grid
+        runs = ((dict(params, n_estimators=size), result, {}, True)
+                for params in families for size, result in cross_validate_sweep(params, sweep, X, y, return_final_model=True, engine=engine, n_jobs=n_jobs))
+
+    logger = RunLogger(plots=plots) # runs are logged from the parent process, off the training thread
+    span_mark = profiling.mark()
+    for params, (metrics, avg_conf_matrix, fitted_model), budget, final in runs:
+        span_metrics = profiling.summarize(profiling.records(since=span_mark, this_thread=True)) # this thread's spans since the last run, empty unless profiling is enabled
+        span_mark = profiling.mark()
+        logger.log_run(dict(params, **budget), dict(metrics, **span_metrics), conf_matrix=avg_conf_matrix)
+
+        if final and metrics["roc_auc"] > best_score:
+            best_score = metrics["roc_auc"]
+            best_model = fitted_model
+            best_params = params
+            best_metrics = metrics
+
+        if verbose:
+            print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+    logger.flush()
+    logger.close()
+
+    if verbose:
+        print("\n✅ Best Model:")
+        print(f"Params: {best_params}")
+        print(f"Metrics: {best_metrics}")
+
+    return best_model
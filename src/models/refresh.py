@@ -0,0 +1,193 @@
+# src/models/refresh.py
+"""
+Incremental refresh of a saved model artifact (src/models/artifact.py) on newly arrived crashes, instead of
+rerunning the full grid search over all of history.
+
+    report = refresh('nyc-crashes', 'models/xgb')  # rows synced past the artifact's watermark
+    if report['needs_retrain']:
+        train_xgboost('nyc-crashes')
+
+The new rows go through the artifact's stored feature builder state, nothing is refit. The most recent
+holdout fraction of them scores the current and the updated model: boosters continue training on the rest
+for a few rounds (xgb.train(xgb_model=...)), logistic models take SGD log-loss steps from their stored
+coefficients (partial_fit). needs_retrain is raised once the holdout AUC, updated or not, falls max_auc_drop
+below the reference (the AUC the model was trained or first refreshed at). Otherwise the update replaces
+the artifact when it doesn't lose holdout AUC. Cost scales with the new rows, never with history.
+"""
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from src._lazy import lazy_module
+from src.data.cleaners import consolidate_response
+from src.data.joins import JOIN_FEATURES, CollisionAggregates
+from src.evaluation.evaluate import fold_metrics
+from src.features.build_features import design_matrix
+from src.models.artifact import LogisticArtifact, XGBoostArtifact, load_artifact, save_artifact
+from src.pipeline.profiling import span
+
+xgb = lazy_module("xgboost")
+
+REFRESH_DEFAULTS = {
+    "holdout": 0.2, # most recent fraction of the new rows, scored but never trained on
+    "max_auc_drop": 0.02, # holdout AUC this far below the reference asks for a full retrain
+    "tolerance": 0.001, # an update losing more holdout AUC than this is discarded
+    "num_boost_round": 10, # trees added per refresh
+    "epochs": 1, # SGD passes over the new rows
+    "batch_size": 10000,
+}
+
+SGD_PARAMS = { # constant small steps, the stored coefficients are already near an optimum
+    "loss": "log_loss",
+    "penalty": "l2",
+    "alpha": 1e-5,
+    "learning_rate": "constant",
+    "eta0": 1e-4,
+}
+
+
+def prepare_rows(data, feature_builder, columns, time_col="crash_date"):
+    """Model matrix and labels of raw crash rows through the stored feature transform, in time order when time_col is there."""
+    data = consolidate_response(data)
+    if time_col in data:
+        data = data.sort_values(time_col, kind="stable")
+    X = design_matrix(feature_builder.transform(data)[columns])
+    return X, data["Y"].to_numpy(), data[time_col] if time_col in data else None
+
+
+def split_holdout(n, holdout):
+    """Train and holdout positions of n time ordered rows, the last holdout fraction is held out."""
+    n_holdout = max(int(round(n * holdout)), 1)
+    assert n_holdout < n, f"{n} new rows are too few for a {holdout} holdout"
+    return np.arange(n - n_holdout), np.arange(n - n_holdout, n)
+
+
+def take(X, idx):
+    return X[idx] if hasattr(X, "tocsr") else np.asarray(X)[idx]
+
+
+def booster_params(manifest, booster):
+    """Training params of the artifact, the objective falls back to the one saved in the booster."""
+    params = {key : value for key, value in manifest["params"].items() if key not in ("n_estimators", "num_boost_round")}
+    if "objective" not in params:
+        params["objective"] = json.loads(booster.save_config())["learner"]["objective"]["name"]
+    return dict(params, verbosity=0)
+
+
+def update_booster(model, manifest, X, y, num_boost_round):
+    """Continues boosting from the artifact's booster, cut at best_iteration so later unused trees aren't kept."""
+    booster = model.booster
+    if model.best_iteration is not None:
+        booster = booster[:model.best_iteration + 1]
+    return xgb.train(booster_params(manifest, booster), xgb.QuantileDMatrix(X, label=y), num_boost_round=num_boost_round, xgb_model=booster)
+
+
+def sgd_from_artifact(model, seed=0):
+    """An SGDClassifier holding the artifact's coefficients, partial_fit continues from them instead of zeros."""
+    from sklearn.linear_model import SGDClassifier
+    sgd = SGDClassifier(**SGD_PARAMS, random_state=seed) # partial_fit shuffles each batch, seeded so kept/discarded is repeatable
+    sgd.classes_ = np.array([0, 1])
+    sgd.coef_ = model.coef.reshape(1, -1).copy()
+    sgd.intercept_ = np.array([model.intercept])
+    sgd.n_features_in_ = len(model.coef)
+    return sgd
+
+
+def update_linear(model, X, y, epochs, batch_size, seed=0):
+    sgd = sgd_from_artifact(model, seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        order = rng.permutation(len(y))
+        for start in range(0, len(y), batch_size):
+            idx = order[start:start + batch_size]
+            sgd.partial_fit(take(X, idx), y[idx])
+    return sgd
+
+
+def refresh_artifact(directory, data, holdout=None, dry_run=False, **options):
+    """
+    Updates the artifact in directory on raw crash rows data, holdout defaults to the most recent
+    REFRESH_DEFAULTS['holdout'] fraction of them. options override REFRESH_DEFAULTS.
+    Returns the report, also appended to the artifact's refresh history when the update is kept.
+    """
+    options = dict(REFRESH_DEFAULTS, **options)
+    start = time.perf_counter()
+    bundle = load_artifact(directory)
+    manifest, builder, columns, model = bundle["manifest"], bundle["feature_builder"], bundle["columns"], bundle["model"]
+    state = dict(manifest.get("refresh") or {})
+
+    with span("refresh.transform", rows=len(data)):
+        X, y, times = prepare_rows(data, builder, columns)
+        if holdout is None:
+            train_idx, holdout_idx = split_holdout(len(y), options["holdout"])
+            X_hold, y_hold = take(X, holdout_idx), y[holdout_idx]
+            X, y = take(X, train_idx), y[train_idx]
+        else:
+            X_hold, y_hold, _ = prepare_rows(holdout, builder, columns)
+    assert len(np.unique(y)) == 2 and len(np.unique(y_hold)) == 2, "new rows and holdout both need positive and negative labels"
+
+    with span("refresh.update", model=manifest["model_type"], rows=len(y)):
+        if manifest["model_type"] == "xgboost":
+            updated = update_booster(model, manifest, X, y, options["num_boost_round"])
+            scorer = XGBoostArtifact(updated)
+        else:
+            updated = update_linear(model, X, y, options["epochs"], options["batch_size"])
+            scorer = LogisticArtifact(updated.coef_[0], updated.intercept_[0])
+
+    with span("refresh.evaluate", rows=len(y_hold)):
+        before = fold_metrics(y_hold, model.predict_proba(X_hold)[:, 1])
+        after = fold_metrics(y_hold, scorer.predict_proba(X_hold)[:, 1])
+    reference = state.get("reference_auc", manifest["metrics"].get("roc_auc", before["roc_auc"]))
+    needs_retrain = max(before["roc_auc"], after["roc_auc"]) < reference - options["max_auc_drop"]
+    kept = after["roc_auc"] >= before["roc_auc"] - options["tolerance"] and not needs_retrain # degraded data waits for the retrain
+
+    report = {
+        "rows" : int(len(y)),
+        "holdout_rows" : int(len(y_hold)),
+        "positive_rate" : float(y.mean()),
+        "before_auc" : before["roc_auc"],
+        "after_auc" : after["roc_auc"],
+        "reference_auc" : float(reference),
+        "kept" : bool(kept and not dry_run),
+        "needs_retrain" : bool(needs_retrain),
+        "watermark" : times.max().isoformat() if times is not None and len(times) else state.get("watermark"),
+        "seconds" : round(time.perf_counter() - start, 3),
+    }
+    if kept and not dry_run:
+        state.update(
+            reference_auc=float(reference),
+            watermark=report["watermark"],
+            refreshes=state.get("refreshes", 0) + 1,
+            history=state.get("history", [])[-49:] + [dict(report)],
+        )
+        metrics = {key : value for key, value in after.items() if key != "conf_matrix"}
+        with span("refresh.save"):
+            save_artifact(directory, builder, columns, updated, params=manifest["params"], metrics=metrics, refresh=state)
+    print(f"Refreshed on {report['rows']} rows: holdout AUC {report['before_auc']:.4f} -> {report['after_auc']:.4f} "
+          f"(reference {report['reference_auc']:.4f}), {'kept' if report['kept'] else 'discarded'}"
+          f"{', full retrain needed' if report['needs_retrain'] else ''}")
+    return report
+
+
+def load_new_rows(name, feature_builder, since, time_col="crash_date"):
+    """Synced rows (src/data/sync.py) with time_col past since, with the people/vehicle aggregates the builder reads."""
+    from src.data.sync import load_synced
+    data = load_synced(name, filters=[(time_col, ">", pd.Timestamp(since))] if since is not None else None)
+    joined = [col for col in feature_builder.required_columns if col in JOIN_FEATURES]
+    if joined and len(data):
+        data = CollisionAggregates.build(data["collision_id"]).attach(data, joined)
+    return data
+
+
+def refresh(name, directory, since=None, **options):
+    """Refreshes the artifact on the rows synced since its watermark (or since, for its first refresh)."""
+    bundle = load_artifact(directory)
+    since = since or bundle["manifest"].get("refresh", {}).get("watermark")
+    assert since is not None, f"Artifact {directory} has never been refreshed, pass since= (eg. the end of its training data)"
+    data = load_new_rows(name, bundle["feature_builder"], since)
+    if data.empty:
+        print(f"No {name} rows past {since}")
+        return None
+    return refresh_artifact(directory, data, **options)
@@ -0,0 +1,123 @@
+# src/models/results.py
+"""
+Memoized cross validation results, one cell per (params, fold). Extending a grid only trains the new cells.
+
+A store is one experiment context: the dataset, the features (Preprocessing.CRASH_cache_key, which covers
+the raw data fingerprint, the feature builder config and the preset's columns), the model type and the fold
+scheme. Changed data or features give a new context, so stale cells are never read. Contexts of other
+feature builders or presets stay usable and are kept; train_* only drops the contexts built on raw files
+that have since changed, with invalidate(dataset, raw=...). Call invalidate() yourself when fit_fold or
+evaluate_fold change in ways their params don't show.
+
+    store = CVResultStore.for_pipeline(processor, 'xgboost')
+    engine = make_engine(X, y).use_results(store)  # engine.cross_validate skips the cells store already has
+"""
+import json
+import os
+
+import numpy as np
+
+from src.config.config import RESULTS_CONFIG
+from src.features.cache import make_key
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+def get_results_dir():
+    return os.path.join(ROOT_DIR, RESULTS_CONFIG['dir'])
+
+class CVResultStore:
+    """
+    Fold metrics of one context in <results dir>/<key>.jsonl, one json line per cell, with the context in
+    <key>.meta.json. Lines are appended as cells finish, so an interrupted grid keeps what it got through.
+    """
+    def __init__(self, context, results_dir=None):
+        self.context = context
+        self.key = make_key(**context)
+        self.results_dir = results_dir or get_results_dir()
+        self.path = os.path.join(self.results_dir, f'{self.key}.jsonl')
+        self.cells = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        cell = json.loads(line)
+                    except json.JSONDecodeError: # a line cut short by an interrupted write
+                        continue
+                    self.cells[cell['cell']] = cell['metrics']
+        self.hits = self.misses = 0
+        self.read = set() # cells served by get since the store was opened
+
+    @classmethod
+    def for_pipeline(cls, processor, model, k=5, random_state=42, select_feat=None, results_dir=None):
+        """Store of model's grid on the (X, y) processor's full_pipe gives for select_feat."""
+        raw = processor.CRASH_fingerprint()
+        return cls({
+            'dataset' : processor.dataset,
+            'raw' : raw if isinstance(raw, dict) else {processor.dataset : raw}, # per table, see invalidate
+            'features' : processor.CRASH_cache_key('full_pipe', select_feat),
+            'model' : model,
+            'k' : k,
+            'random_state' : random_state
+        }, results_dir=results_dir)
+
+    @staticmethod
+    def cell_key(params, fold, **tag):
+        """tag holds whatever else shapes the cell's result, eg. the budget's fit kwargs and row fraction."""
+        return make_key(params=params, fold=int(fold), **tag)
+
+    def get(self, params, fold, **tag):
+        """Fold metrics as evaluate_fold returned them (conf_matrix an array) or None."""
+        cell = self.cell_key(params, fold, **tag)
+        metrics = self.cells.get(cell)
+        if metrics is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.read.add(cell)
+        return dict(metrics, conf_matrix=np.asarray(metrics['conf_matrix']))
+
+    def put(self, params, fold, metrics, **tag):
+        cell = self.cell_key(params, fold, **tag)
+        metrics = {name : np.asarray(value).tolist() if name == 'conf_matrix' else float(value) for name, value in metrics.items()}
+        self.cells[cell] = metrics
+        if not os.path.exists(self.path):
+            os.makedirs(self.results_dir, exist_ok=True)
+            with open(os.path.join(self.results_dir, f'{self.key}.meta.json'), 'w') as f:
+                json.dump(self.context, f, indent=2, default=str)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'cell' : cell, 'params' : params, 'fold' : int(fold), 'tag' : tag, 'metrics' : metrics}, default=str) + '\n')
+
+    def memoized(self, params, n_folds, **tag):
+        """Whether all n_folds cells of params were read from the store rather than trained, ie. the run was logged before."""
+        return all(self.cell_key(params, fold, **tag) in self.read for fold in range(n_folds))
+
+    def clear(self):
+        self.cells.clear()
+        for path in (self.path, os.path.join(self.results_dir, f'{self.key}.meta.json')):
+            if os.path.exists(path):
+                os.remove(path)
+
+def invalidate(dataset=None, model=None, keep=None, results_dir=None, raw=None):
+    """
+    Removes the stored results of every context matching dataset and model (None matches all) except keep,
+    returns how many contexts went. invalidate() wipes the store. raw, a {table : fingerprint} dict like
+    for_pipeline stores, only removes the contexts built on a different version of one of those tables.
+    """
+    results_dir = results_dir or get_results_dir()
+    if not os.path.isdir(results_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(results_dir):
+        if not name.endswith('.meta.json') or name[:-len('.meta.json')] == keep:
+            continue
+        with open(os.path.join(results_dir, name)) as f:
+            context = json.load(f)
+        if dataset not in (None, context.get('dataset')) or model not in (None, context.get('model')):
+            continue
+        if raw is not None and all(raw.get(table, value) == value for table, value in context.get('raw', {}).items()):
+            continue
+        for path in (os.path.join(results_dir, name), os.path.join(results_dir, name[:-len('.meta.json')] + '.jsonl')):
+            if os.path.exists(path):
+                os.remove(path)
+        removed += 1
+    return removed
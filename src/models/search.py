@@ -0,0 +1,62 @@
+# src/models/search.py
+import math
+
+from src.models.base_model import take_rows, subsample_rows
+from src.models.parallel import run_grid_parallel
+
+FIT_BUDGET_KEYS = ('rows', 'n_folds') # every other budget key is passed on to fit_fold (eg. num_boost_round)
+
+def budget_fit_kwargs(budget):
+    return {key : value for key, value in budget.items() if key not in FIT_BUDGET_KEYS}
+
+def budget_tag(budget):
+    """Tag the result store keeps budget's cells under besides params and fold, see make_rung_evaluator."""
+    budget = {key : value for key, value in budget.items() if key != 'rung'} # added by successive_halving
+    return {'fit_kwargs' : budget_fit_kwargs(budget), 'rows' : budget.get('rows', 1.0)}
+
+def make_rung_evaluator(make_engine, fit_fold, evaluate_fold, X, y, k=5, n_jobs=1, threads_per_worker=1, results=None):
+    """
+    Returns evaluate_rung(param_list, budget) that cross validates every params dict under one budget:
+    'rows' is the stratified fraction of rows used, 'n_folds' how many of the k folds are run and
+    anything else is a keyword argument of fit_fold. Each rung gets one engine from make_engine(X, y, k)
+    shared by all its candidates, memoizing into results (a CVResultStore) when given.
+    Results are (avg_metrics, avg_conf_matrix, last_fold_model).
+    """
+    def evaluate_rung(param_list, budget):
+        fit_kwargs = budget_fit_kwargs(budget)
+        n_folds = budget.get('n_folds', k)
+        X_rung, y_rung = X, y
+        if budget.get('rows', 1.0) < 1.0:
+            idx = subsample_rows(y, budget['rows'])
+            X_rung, y_rung = take_rows(X, idx), take_rows(y, idx)
+        engine = make_engine(X_rung, y_rung, k=k)
+        if results is not None:
+            engine.use_results(results, rows=budget.get('rows', 1.0))
+        if n_jobs == 1:
+            return [engine.cross_validate(fit_fold, evaluate_fold, params, return_final_model=True, n_folds=n_folds, **fit_kwargs) for params in param_list]
+        return run_grid_parallel(fit_fold, evaluate_fold, param_list, engine, n_jobs=n_jobs, threads_per_worker=threads_per_worker,
+                                 return_final_model=True, n_folds=n_folds, **fit_kwargs)
+    return evaluate_rung
+
+def successive_halving(param_list, evaluate_rung, budgets, eta=3, metric='roc_auc', verbose=True):
+    """
+    Successive halving over param_list. Every candidate is evaluated on budgets[0], the best 1/eta by
+    metric are promoted to budgets[1] and so on, the last budget should be the full one.
+
+    Returns every evaluation in order as (params, result, budget, final) where budget has the rung number
+    added and final marks the last rung, only those results are comparable with an exhaustive search.
+    """
+    assert len(budgets) > 0, "successive_halving needs at least one budget"
+    assert eta > 1, f"eta must be greater than 1 but is {eta}"
+    candidates = list(param_list)
+    history = []
+    for rung, budget in enumerate(budgets):
+        final = rung == len(budgets) - 1
+        results = evaluate_rung(candidates, budget)
+        history.extend((params, result, dict(budget, rung=rung), final) for params, result in zip(candidates, results))
+        if verbose:
+            print(f"Rung {rung} ({budget}): evaluated {len(candidates)} candidates")
+        if not final:
+            ranked = sorted(zip(candidates, results), key=lambda pair: pair[1][0][metric], reverse=True)
+            candidates = [params for params, _ in ranked[:max(1, math.ceil(len(candidates) / eta))]]
+    return history
@@ -0,0 +1,163 @@
+# src/models/tracking.py
+import atexit
+import io
+import json
+import os
+import queue
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from src._lazy import lazy_module
+from src.pipeline.profiling import span
+
+mlflow = lazy_module("mlflow")
+
+PLOT_MODES = ('render', 'deferred', 'skip')
+CONF_MATRIX_JSON = 'confusion_matrices/conf_matrix.json'
+
+def render_confusion_matrix(conf_matrix, title="Avg Confusion Matrix (5-fold)"):
+    """Heatmap PNG bytes. Uses a standalone Figure rather than pyplot, so it's safe off the main thread."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import seaborn as sns
+
+    fig = Figure(figsize=(5, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    sns.heatmap(np.asarray(conf_matrix), annot=True, fmt="d", cmap="Blues", cbar=False, ax=ax)
+    ax.set_title(title)
+    ax.set_xlabel("Predicted")
+    ax.set_ylabel("Actual")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def log_png(client, run_id, png, artifact_path="confusion_matrices"):
+    os.makedirs("plots", exist_ok=True)
+    path = f"plots/conf_matrix_{run_id}.png"
+    with open(path, 'wb') as f:
+        f.write(png)
+    client.log_artifact(run_id, path, artifact_path=artifact_path)
+
+def resolve_experiment_id(experiment_id=None):
+    """
+    Explicit id, else the experiment mlflow.start_run would use on the calling thread: the active run's, the one
+    set with mlflow.set_experiment, MLFLOW_EXPERIMENT_ID / MLFLOW_EXPERIMENT_NAME, else the default experiment.
+    """
+    if experiment_id is not None:
+        return str(experiment_id)
+    run = mlflow.active_run()
+    if run is not None:
+        return run.info.experiment_id
+    from mlflow.tracking import fluent
+    active = getattr(fluent, '_active_experiment_id', None) # what set_experiment set, not public so looked up defensively
+    if active:
+        return active
+    if os.environ.get('MLFLOW_EXPERIMENT_ID'):
+        return os.environ['MLFLOW_EXPERIMENT_ID']
+    if os.environ.get('MLFLOW_EXPERIMENT_NAME'):
+        experiment = mlflow.get_experiment_by_name(os.environ['MLFLOW_EXPERIMENT_NAME'])
+        if experiment is not None:
+            return experiment.experiment_id
+        return mlflow.create_experiment(os.environ['MLFLOW_EXPERIMENT_NAME'])
+    return '0'
+
+class RunLogger:
+    """
+    Logs one MLflow run per log_run call from a background thread, so the training loop only pays for a queue put.
+    Each run is created, gets all its params, metrics and tags in a single log_batch and is terminated.
+
+    plots decides what happens to a run's confusion matrix: 'render' draws and uploads the heatmap (in the
+    background), 'deferred' only logs the raw matrix as json for render_deferred to draw later, 'skip'
+    logs nothing. flush() blocks until everything queued is written and warns about the runs that failed to log,
+    close() also runs at interpreter exit. The experiment is resolved when the logger is built, on the caller's
+    thread, so an mlflow.set_experiment or active run of the training code is honored.
+    """
+    def __init__(self, experiment_id=None, plots='render', verbose=False):
+        assert plots in PLOT_MODES, f"plots must be one of {PLOT_MODES} but is {plots}"
+        self.plots = plots
+        self.verbose = verbose
+        self.run_ids = []
+        self.errors = []
+        self._reported = 0
+        try:
+            self.experiment_id = resolve_experiment_id(experiment_id)
+        except Exception as e: # tracking server unreachable, _run tries again and reports through flush
+            self.experiment_id = experiment_id
+            self.errors.append(e)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='mlflow-logger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_run(self, params, metrics, conf_matrix=None, tags=None):
+        self._queue.put((dict(params), dict(metrics), None if conf_matrix is None else np.asarray(conf_matrix), dict(tags or {})))
+
+    def flush(self):
+        self._queue.join()
+        new = self.errors[self._reported:]
+        self._reported = len(self.errors)
+        if new:
+            kinds = sorted({repr(e) for e in new})
+            warnings.warn(f"MLflow logging failed {len(new)} time(s), {len(kinds)} distinct error(s): " + "; ".join(kinds[:5]), RuntimeWarning, stacklevel=2)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        client = None
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if client is None:
+                    client = mlflow.MlflowClient()
+                    self.experiment_id = resolve_experiment_id(self.experiment_id)
+                with span('mlflow.log_run'):
+                    self._write(client, *item)
+            except Exception as e: # keep logging the rest, training must not die on a tracking hiccup
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, client, params, metrics, conf_matrix, tags):
+        from mlflow.entities import Metric, Param, RunTag
+
+        run_id = client.create_run(self.experiment_id).info.run_id
+        now = int(time.time() * 1000)
+        client.log_batch(
+            run_id,
+            metrics=[Metric(key, float(value), now, 0) for key, value in metrics.items()],
+            params=[Param(key, str(value)) for key, value in params.items()],
+            tags=[RunTag(key, str(value)) for key, value in tags.items()]
+        )
+        if conf_matrix is not None and self.plots == 'render':
+            log_png(client, run_id, render_confusion_matrix(conf_matrix))
+        elif conf_matrix is not None and self.plots == 'deferred':
+            client.log_dict(run_id, {'conf_matrix' : conf_matrix.tolist()}, CONF_MATRIX_JSON)
+        client.set_terminated(run_id)
+        self.run_ids.append(run_id)
+        if self.verbose:
+            print(f"Logged run {run_id}")
+
+def render_deferred(run_ids):
+    """Draws and uploads the heatmaps of runs logged with plots='deferred', returns how many were rendered."""
+    client = mlflow.MlflowClient()
+    rendered = 0
+    for run_id in run_ids:
+        try:
+            path = client.download_artifacts(run_id, CONF_MATRIX_JSON)
+        except Exception:
+            continue # logged without a confusion matrix
+        with open(path) as f:
+            conf_matrix = np.asarray(json.load(f)['conf_matrix'], dtype=int)
+        log_png(client, run_id, render_confusion_matrix(conf_matrix))
+        rendered += 1
+    return rendered
@@ -1,86 +1,121 @@
-import mlflow
-import xgboost as xgb
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import (
-    roc_auc_score, accuracy_score, f1_score,
-    precision_score, recall_score, confusion_matrix
-)
+from sklearn.model_selection import train_test_split
 from itertools import product
-import os
 
+from src._lazy import lazy_module
+from src.evaluation.evaluate import fold_metrics
 from src.features.preprocessing import Preprocessing
-
-
-def evaluate_fold(model, X_val, y_val):
-    y_pred = model.predict(xgb.DMatrix(X_val))
-    y_pred_labels = (y_pred >= 0.5).astype(int)
-
-    return {
-        "roc_auc": roc_auc_score(y_val, y_pred),
-        "accuracy": accuracy_score(y_val, y_pred_labels),
-        "f1": f1_score(y_val, y_pred_labels),
-        "precision": precision_score(y_val, y_pred_labels),
-        "recall": recall_score(y_val, y_pred_labels),
-        "conf_matrix": confusion_matrix(y_val, y_pred_labels)
-    }
-
-
-def cross_validate(params, X, y, k=5, return_final_model=False):
-    skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=42)
-    all_metrics = []
-    all_conf_matrices = []
-    last_model = None
-
-    for train_idx, val_idx in skf.split(X, y):
-        X_train, X_val = X[train_idx], X[val_idx]
-        y_train, y_val = y[train_idx], y[val_idx]
-
-        dtrain = xgb.DMatrix(X_train, label=y_train)
-        model = xgb.train(params, dtrain, num_boost_round=100)
-
-        fold_metrics = evaluate_fold(model, X_val, y_val)
-        all_conf_matrices.append(fold_metrics.pop("conf_matrix"))
-        all_metrics.append(fold_metrics)
-
-        last_model = model
-
-    avg_metrics = {
-        metric: np.mean([fold[metric] for fold in all_metrics])
-        for metric in all_metrics[0].keys()
-    }
-    avg_conf_matrix = np.mean(all_conf_matrices, axis=0).round().astype(int)
-
-    if return_final_model:
-        return avg_metrics, avg_conf_matrix, last_model
-    else:
-        return avg_metrics, avg_conf_matrix
+from src.models.base_model import CVEngine, take_rows
+from src.models.parallel import run_grid_parallel
+from src.models.results import CVResultStore, invalidate
+from src.models.search import budget_fit_kwargs, budget_tag, make_rung_evaluator, successive_halving
+from src.models.tracking import RunLogger, log_png, render_confusion_matrix
+from src.pipeline import profiling
+
+# heavy libraries, imported on first attribute access
+mlflow = lazy_module("mlflow")
+xgb = lazy_module("xgboost")
+
+PARAM_GRID = {
+    "max_depth": [3, 5],
+    "eta": [0.1, 0.3],
+    "subsample": [0.8, 1.0],
+    "objective": ["binary:logistic"],
+    "eval_metric": ["logloss"],
+    "verbosity": [0],
+}
+
+HALVING_BUDGETS = [ # successive halving rungs, cheap to full, early stopping on a split of each training fold
+    {"rows": 0.25, "n_folds": 2, "num_boost_round": 25, "early_stopping_rounds": 10},
+    {"rows": 0.5, "n_folds": 3, "num_boost_round": 50, "early_stopping_rounds": 10},
+    {"rows": 1.0, "n_folds": 5, "num_boost_round": 100, "early_stopping_rounds": 10},
+]
+
+
+STOP_SIZE = 0.1 # fraction of each training fold held out for early stopping
+
+
+def build_fold(X, y, train_idx, val_idx):
+    """Fold data for CVEngine, the DMatrix objects are built on first use by fold_matrix and kept with the fold."""
+    return {"X": X, "y": np.asarray(y), "train_idx": train_idx, "val_idx": val_idx, "y_val": take_rows(y, val_idx)}
+
+
+def fold_matrix(fold, part):
+    """
+    The train, val, inner (train minus stop) or stop matrix of a fold, built once and reused by every grid point.
+    All of them are QuantileDMatrix objects sharing the training fold's quantile cuts (stop through inner), so
+    sketching also happens once per fold and predictions on val match a model trained on a plain DMatrix.
+    Grids can't vary max_bin.
+    """
+    if part in fold:
+        return fold[part]
+    X, y = fold["X"], fold["y"]
+    if part == "train":
+        idx = fold["train_idx"]
+        fold[part] = xgb.QuantileDMatrix(take_rows(X, idx), label=y[idx])
+        return fold[part]
+    if part in ("inner", "stop"):
+        inner_pos, stop_pos = train_test_split(np.arange(len(fold["train_idx"])), test_size=STOP_SIZE, stratify=y[fold["train_idx"]], random_state=42)
+        fold["inner_idx"], fold["stop_idx"] = fold["train_idx"][inner_pos], fold["train_idx"][stop_pos]
+    idx = fold[f"{part}_idx"]
+    ref = fold_matrix(fold, "inner" if part == "stop" else "train") # xgb.train wants eval sets to reference its training matrix
+    fold[part] = xgb.QuantileDMatrix(take_rows(X, idx), label=y[idx], ref=ref)
+    return fold[part]
+
+
+def evaluate_fold(model, fold):
+    best_iteration = model.attr("best_iteration") # set when trained with early stopping
+    iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+    y_pred = model.predict(fold_matrix(fold, "val"), iteration_range=iteration_range)
+    return fold_metrics(fold["y_val"], y_pred, threshold=0.5)
+
+
+def fit_fold(params, fold, n_threads=None, num_boost_round=100, early_stopping_rounds=None):
+    """early_stopping_rounds stops on STOP_SIZE of the training fold, the validation fold stays unseen."""
+    if n_threads is not None:
+        params = dict(params, nthread=n_threads)
+    if not early_stopping_rounds:
+        return xgb.train(params, fold_matrix(fold, "train"), num_boost_round=num_boost_round)
+    return xgb.train(params, fold_matrix(fold, "inner"), num_boost_round=num_boost_round, evals=[(fold_matrix(fold, "stop"), "stop")],
+                     early_stopping_rounds=early_stopping_rounds, verbose_eval=False)
+
+
+def make_engine(X, y, k=5):
+    return CVEngine(X, y, k=k, build_fold=build_fold)
+
+
+def cross_validate(params, X, y, k=5, return_final_model=False, n_folds=None, engine=None, **fit_kwargs):
+    """
+    Pass the same engine (make_engine(X, y)) for every grid point to reuse folds and their DMatrix objects.
+    n_folds stops after the first n_folds of the k folds, fit_kwargs go to fit_fold (num_boost_round, early_stopping_rounds).
+    """
+    engine = engine or make_engine(X, y, k=k)
+    return engine.cross_validate(fit_fold, evaluate_fold, params, return_final_model=return_final_model, n_folds=n_folds, **fit_kwargs)
 
 
 def log_confusion_matrix(conf_matrix, run_id):
-    plt.figure(figsize=(5, 4))
-    sns.heatmap(conf_matrix, annot=True, fmt="d", cmap="Blues", cbar=False)
-    plt.title("Avg Confusion Matrix (5-fold)")
-    plt.xlabel("Predicted")
-    plt.ylabel("Actual")
-
-    os.makedirs("plots", exist_ok=True)
-    path = f"plots/conf_matrix_{run_id}.png"
-    plt.savefig(path)
-    mlflow.log_artifact(path, artifact_path="confusion_matrices")
-    plt.close()
-
-
-def train_xgboost(dataset, verbose=True):
+    log_png(mlflow.MlflowClient(), run_id, render_confusion_matrix(conf_matrix))
+
+
+def train_xgboost(dataset, verbose=True, n_jobs=1, threads_per_worker=1, search="grid", reduction_factor=3, plots="render", feature_builder=None, memoize=True):
+    """
+    n_jobs > 1 runs every (params, fold) pair as its own task on a process pool, see run_grid_parallel.
+    search="halving" runs successive halving over HALVING_BUDGETS, keeping the best 1/reduction_factor of each rung.
+    plots="deferred" logs confusion matrices as json for tracking.render_deferred, "skip" drops them, see RunLogger.
+    feature_builder replaces the default CrashFeatureBuilder, a sparse one (CrashFeatureBuilder.wide()) trains on CSR directly.
+    memoize reads and writes per (params, fold) results in a CVResultStore, so only cells not run on the same data,
+    features and budget before are trained, and runs read entirely from it aren't logged to MLflow again. Result
+    sets of raw data that has since changed are dropped, other feature builders' and presets' are kept.
+    """
+    assert search in ("grid", "halving"), f"search must be 'grid' or 'halving' but is {search}"
+    assert n_jobs == 1 or feature_builder is None or not feature_builder.sparse, "the process pool shares dense memory maps, train sparse features with n_jobs=1"
     # Load dataset and preprocess
     if verbose:
         print("Beginning preprocessing")
     if isinstance(dataset, str):
         try:
-            processor = Preprocessing(dataset, 'full_pipe')
+            processor = Preprocessing(dataset, 'full_pipe', feature_builder=feature_builder)
             X, y = processor()
         except ValueError as e:
             print(f"Errored on processing with dataset {dataset}, passing error:\n{e}")
@@ -88,14 +123,14 @@ def train_xgboost(dataset, verbose=True):
     else:
         raise TypeError("Currently, only string dataset identifiers are supported.")
     
-    param_grid = {
-        "max_depth": [3, 5],
-        "eta": [0.1, 0.3],
-        "subsample": [0.8, 1.0],
-        "objective": ["binary:logistic"],
-        "eval_metric": ["logloss"],
-        "verbosity": [0],
-    }
+    store = None
+    if memoize:
+        store = CVResultStore.for_pipeline(processor, "xgboost")
+        dropped = invalidate(dataset, raw=store.context["raw"]) # results of replaced raw data can't be read again
+        if verbose:
+            print(f"{len(store.cells)} memoized (params, fold) results" + (f", dropped {dropped} stale result sets" if dropped else ""))
+
+    param_grid = PARAM_GRID
     if verbose:
         print(f"Preprocessing complete! Training on param grad with 5-fold CV:\n{param_grid}")
 
@@ -105,25 +140,48 @@ def train_xgboost(dataset, verbose=True):
     best_metrics = None
 
     keys, values = zip(*param_grid.items())
-    for v in product(*values):
-        params = dict(zip(keys, v))
-
-        with mlflow.start_run() as run:
-            mlflow.log_params(params)
-
-            metrics, avg_conf_matrix, fitted_model = cross_validate(params, X, y, k=5, return_final_model=True)
-
-            mlflow.log_metrics(metrics)
-            log_confusion_matrix(avg_conf_matrix, run.info.run_id)
-
-            if metrics["roc_auc"] > best_score:
-                best_score = metrics["roc_auc"]
-                best_model = fitted_model
-                best_params = params
-                best_metrics = metrics
-
-            if verbose:
-                print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+    param_list = [dict(zip(keys, v)) for v in product(*values)]
+    if search == "halving":
+        evaluate_rung = make_rung_evaluator(make_engine, fit_fold, evaluate_fold, X, y, k=5, n_jobs=n_jobs, threads_per_worker=threads_per_worker,
+                                            results=store)
+        runs = successive_halving(param_list, evaluate_rung, HALVING_BUDGETS, eta=reduction_factor, verbose=verbose)
+    else:
+        engine = make_engine(X, y, k=5).use_results(store, rows=1.0) # folds and their DMatrix objects are built once for the whole grid, cells shared with the full halving rung
+        if n_jobs == 1:
+            results = (cross_validate(params, X, y, return_final_model=True, engine=engine) for params in param_list)
+        else:
+            results = run_grid_parallel(fit_fold, evaluate_fold, param_list, engine, n_jobs=n_jobs,
+                                        threads_per_worker=threads_per_worker, return_final_model=True)
+        runs = ((params, result, {}, True) for params, result in zip(param_list, results))
+
+    logger = RunLogger(plots=plots) # runs are logged from the parent process, off the training thread
+    memoized_runs = 0
+    span_mark = profiling.mark()
+    for params, (metrics, avg_conf_matrix, fitted_model), budget, final in runs:
+        span_metrics = profiling.summarize(profiling.records(since=span_mark, this_thread=True)) # this thread's spans since the last run, empty unless profiling is enabled
+        span_mark = profiling.mark()
+        if store is not None and store.memoized(params, budget.get("n_folds", 5), **budget_tag(budget)):
+            memoized_runs += 1 # logged when its folds were trained
+        else:
+            logger.log_run(dict(params, **budget), dict(metrics, **span_metrics), conf_matrix=avg_conf_matrix)
+
+        if final and metrics["roc_auc"] > best_score: # only full budget runs compete for best
+            best_score = metrics["roc_auc"]
+            best_model = fitted_model
+            best_params = params
+            best_metrics = metrics
+
+        if verbose:
+            print(f"Completed Run\nParams: {params} => Metrics: {metrics}")
+    logger.flush()
+    logger.close()
+    if verbose and memoized_runs:
+        print(f"{memoized_runs} run(s) read entirely from the result store were not logged again")
+
+    if best_model is None and best_params is not None: # the best params' last fold was memoized, refit just that fold
+        final_budget = HALVING_BUDGETS[-1] if search == "halving" else {}
+        refit_engine = engine if search == "grid" else make_engine(X, y, k=5)
+        best_model = refit_engine.fit_final(fit_fold, best_params, n_folds=final_budget.get("n_folds"), **budget_fit_kwargs(final_budget))
 
     if verbose:
         print("\n✅ Best Model:")
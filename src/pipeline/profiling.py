@@ -0,0 +1,191 @@
+# src/pipeline/profiling.py
+"""
+Nestable timing and memory spans for the pipeline stages.
+
+    from src.pipeline import profiling
+    profiling.enable()                       # or PIPELINE_PROFILE=1 / PIPELINE_PROFILE=trace.json in the environment
+    with profiling.span('build_features', rows=len(data)):
+        ...
+    profiling.export_chrome_trace('trace.json') # open in chrome://tracing or ui.perfetto.dev
+
+Each span records wall time, CPU time, the change in RSS and in the RSS high water mark, and with
+memory tracing on, the tracemalloc peak above its starting allocation. Spans nest per thread.
+While profiling is disabled span() hands back one shared no-op context manager, a single global check.
+Spans opened in pool worker processes aren't collected, only the process that enabled profiling.
+"""
+import atexit
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+_enabled = False
+_trace_memory = False
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_epoch = time.perf_counter()
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def _rss_mb():
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    return _hwm_mb()
+
+def _hwm_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB on Linux
+
+class Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+
+        self.main_thread = threading.current_thread() is threading.main_thread()
+        self.memory = _trace_memory and self.main_thread and tracemalloc.is_tracing() # the traced peak is process wide, worker threads would reset it under the main thread's spans
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak_so_far = max(self.parent.peak_so_far, peak)
+            tracemalloc.reset_peak()
+            self.traced_start = self.peak_so_far = current
+        self.rss_start = _rss_mb()
+        self.hwm_start = _hwm_mb()
+        self.cpu_start = time.process_time() if self.main_thread else time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        cpu = (time.process_time() if self.main_thread else time.thread_time()) - self.cpu_start
+        record = {
+            'name' : self.name,
+            'start' : self.start - _epoch,
+            'wall_s' : end - self.start,
+            'cpu_s' : cpu,
+            'rss_delta_mb' : _rss_mb() - self.rss_start,
+            'hwm_growth_mb' : _hwm_mb() - self.hwm_start,
+            'depth' : self.depth,
+            'parent' : self.parent.name if self.parent is not None else None,
+            'pid' : os.getpid(),
+            'tid' : threading.get_ident(),
+            'args' : self.args
+        }
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_so_far = max(self.peak_so_far, peak)
+            record['traced_peak_mb'] = (self.peak_so_far - self.traced_start) / 2**20
+            record['traced_delta_mb'] = (current - self.traced_start) / 2**20
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak_so_far = max(self.parent.peak_so_far, self.peak_so_far)
+        _local.stack.pop()
+        with _lock:
+            _records.append(record)
+        return False
+
+def span(name, **args):
+    """Context manager timing the block as `name`, args are kept on the record and in the trace."""
+    if not _enabled:
+        return _NO_SPAN
+    return Span(name, args)
+
+def enable(trace_memory=False, trace_path=None):
+    """
+    Starts recording spans. trace_memory also starts tracemalloc (slows allocation heavy python code
+    noticeably, RSS is always recorded). trace_path writes a Chrome trace of everything recorded at exit.
+    """
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if trace_path:
+        atexit.register(export_chrome_trace, trace_path)
+
+def disable():
+    global _enabled
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def is_enabled():
+    return _enabled
+
+def records(since=0, this_thread=False):
+    """
+    Spans recorded so far in completion order, from position since (a mark()) on. this_thread keeps only the
+    calling thread's, leaving out what background threads (eg. RunLogger writing the previous run) did meanwhile.
+    """
+    with _lock:
+        span_records = _records[since:]
+    if this_thread:
+        tid, pid = threading.get_ident(), os.getpid()
+        span_records = [record for record in span_records if record['tid'] == tid and record['pid'] == pid]
+    return span_records
+
+def mark():
+    """Position to pass to records(since=...) later to get only the spans completed after this point, eg. one grid point's."""
+    with _lock:
+        return len(_records)
+
+def summarize(span_records):
+    """
+    Flat metrics dict per span name, summed over repeats (folds, pages): span.<name>.wall_s, .cpu_s, .count
+    and the largest .hwm_growth_mb / .traced_peak_mb. Ready for mlflow log_metrics.
+    """
+    metrics = {}
+    for record in span_records:
+        prefix = f"span.{record['name']}"
+        metrics[f'{prefix}.wall_s'] = metrics.get(f'{prefix}.wall_s', 0.0) + record['wall_s']
+        metrics[f'{prefix}.cpu_s'] = metrics.get(f'{prefix}.cpu_s', 0.0) + record['cpu_s']
+        metrics[f'{prefix}.count'] = metrics.get(f'{prefix}.count', 0) + 1
+        for key in ('hwm_growth_mb', 'traced_peak_mb'):
+            if key in record:
+                metrics[f'{prefix}.{key}'] = max(metrics.get(f'{prefix}.{key}', 0.0), record[key])
+    return metrics
+
+def chrome_trace(span_records=None):
+    """Chrome trace event format, one complete ('X') event per span with its measurements as args."""
+    events = []
+    for record in records() if span_records is None else span_records:
+        args = {key : value for key, value in record.items() if key not in ('name', 'start', 'wall_s', 'pid', 'tid', 'args', 'depth', 'parent')}
+        args.update(record['args'])
+        events.append({'name' : record['name'], 'ph' : 'X', 'ts' : record['start'] * 1e6, 'dur' : record['wall_s'] * 1e6,
+                       'pid' : record['pid'], 'tid' : record['tid'], 'args' : args})
+    return {'traceEvents' : events, 'displayTimeUnit' : 'ms'}
+
+def export_chrome_trace(path, span_records=None):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(span_records), f, default=str)
+    return path
+
+def print_summary(span_records=None):
+    """Indented table of spans in start order."""
+    print(f"{'span':<48}{'wall s':>9}{'cpu s':>9}{'rss +MB':>9}{'traced MB':>11}")
+    for record in sorted(records() if span_records is None else span_records, key=lambda r: r['start']):
+        traced = f"{record['traced_peak_mb']:>11.1f}" if 'traced_peak_mb' in record else f"{'-':>11}"
+        print(f"{'  ' * record['depth'] + record['name']:<48}{record['wall_s']:>9.3f}{record['cpu_s']:>9.3f}{record['rss_delta_mb']:>9.1f}{traced}")
+
+_env = os.environ.get('PIPELINE_PROFILE')
+if _env: # '1' just records, anything else is also the path the trace is written to at exit
+    enable(trace_memory=os.environ.get('PIPELINE_PROFILE_MEMORY') == '1', trace_path=None if _env == '1' else _env)
@@ -0,0 +1,280 @@
+# src/pipeline/serving.py
+import http.client
+import json
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.features.build_features import CrashFeatureBuilder, design_matrix
+from src.models.artifact import load_artifact
+
+def save_bundle(path, feature_builder, columns, model):
+    """Pickles what the server needs to score raw records: the fitted builder's state, the selected feature columns and the model."""
+    bundle = {'builder_state' : feature_builder.get_state(), 'columns' : list(columns), 'model' : model}
+    with open(path, 'wb') as f:
+        pickle.dump(bundle, f)
+    return path
+
+def load_bundle(path):
+    """Loads a save_bundle pickle, or a model artifact directory written by src.models.artifact.save_artifact."""
+    if os.path.isdir(path):
+        return load_artifact(path)
+    with open(path, 'rb') as f:
+        bundle = pickle.load(f)
+    bundle['feature_builder'] = CrashFeatureBuilder.from_state(bundle['builder_state'])
+    return bundle
+
+def predict_scores(model, X):
+    """Positive class probability from an xgboost Booster or any sklearn classifier."""
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)[:, 1]
+    import xgboost as xgb
+    best_iteration = model.attr('best_iteration') # set when trained with early stopping
+    iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+    return model.predict(xgb.DMatrix(X), iteration_range=iteration_range)
+
+def validate_record(record, feature_builder):
+    """
+    The fields of record feature_builder reads, checked and coerced, or a ValueError saying what is wrong.
+    Numeric columns take numbers or numeric strings, the others strings (integers like zip codes become
+    strings), any of them may be null or absent.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"a record must be a json object, not {type(record).__name__}")
+    clean = {}
+    for col in feature_builder.required_columns:
+        value = record.get(col)
+        if value is None:
+            clean[col] = None
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"{col} must be a {'number' if col in feature_builder.numeric_cols else 'string'}, not {value!r}")
+        elif col in feature_builder.numeric_cols:
+            try:
+                clean[col] = float(value)
+            except ValueError:
+                raise ValueError(f"{col} must be a number, not {value!r}") from None
+        elif isinstance(value, float):
+            raise ValueError(f"{col} must be a string, not {value!r}")
+        else:
+            clean[col] = str(value)
+    return clean
+
+def make_scorer(bundle):
+    """Returns score(records) -> scores for a list of raw crash dicts, one vectorized transform and predict per call."""
+    feature_builder, columns, model = bundle['feature_builder'], bundle['columns'], bundle['model']
+    def score(records):
+        data = pd.DataFrame.from_records(records, columns=feature_builder.required_columns)
+        X = design_matrix(feature_builder.transform(data)[columns])
+        return predict_scores(model, X)
+    return score
+
+class MicroBatcher:
+    """
+    Collects single records submitted from many threads into batches for one score(records) call each.
+    A batch is closed once it holds max_batch records or max_wait_ms has passed since its first record,
+    max_wait_ms=0 scores whatever is already queued without waiting for more. When scoring a batch fails its
+    records are scored one by one, so only the futures of the records that fail themselves get the error.
+    """
+    def __init__(self, score, max_batch=256, max_wait_ms=5.0):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.perf_counter()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # finish this batch, stop on the next collect
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self.batch_sizes.append(len(batch))
+            try:
+                scores = self.score([record for record, _ in batch])
+            except Exception:
+                for record, future in batch:
+                    self._score_one(record, future)
+                continue
+            for (_, future), score in zip(batch, scores):
+                if not future.done():
+                    future.set_result(float(score))
+
+    def _score_one(self, record, future):
+        try:
+            score = float(self.score([record])[0])
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(score)
+
+class _PredictHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, the load generator reuses connections
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate sends, with Nagle on the body waits for the client's delayed ACK (~40 ms)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status' : 'ok'})
+        else:
+            self._reply(404, {'error' : f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._reply(404, {'error' : f'unknown path {self.path}'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except json.JSONDecodeError as e:
+            self._reply(400, {'error' : f'invalid json: {e}'})
+            return
+        try:
+            records = [validate_record(record, self.server.feature_builder) for record in (body if isinstance(body, list) else [body])]
+        except ValueError as e: # rejected before batching, a bad record never reaches other clients' batches
+            self._reply(400, {'error' : str(e)})
+            return
+        futures = [self.server.batcher.submit(record) for record in records]
+        try:
+            scores = [future.result() for future in futures]
+        except Exception as e:
+            self._reply(500, {'error' : str(e)})
+            return
+        self._reply(200, {'scores' : scores} if isinstance(body, list) else {'score' : scores[0]})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class _PredictServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # the default listen backlog of 5 resets connections under concurrent load
+
+def make_server(bundle, host='127.0.0.1', port=8000, max_batch=256, max_wait_ms=5.0, verbose=False):
+    """
+    Threading HTTP server scoring POST /predict bodies (one raw crash record, or a list of them) through a
+    MicroBatcher. Responds {"score": p} or {"scores": [...]}, 400 for records validate_record rejects,
+    GET /health answers once the bundle is loaded.
+    port=0 picks a free port, see server.server_address.
+    """
+    server = _PredictServer((host, port), _PredictHandler)
+    server.feature_builder = bundle['feature_builder']
+    server.batcher = MicroBatcher(make_scorer(bundle), max_batch=max_batch, max_wait_ms=max_wait_ms)
+    server.verbose = verbose
+    return server
+
+def serve(bundle_path, host='127.0.0.1', port=8000, max_batch=256, max_wait_ms=5.0, verbose=True):
+    server = make_server(load_bundle(bundle_path), host, port, max_batch, max_wait_ms, verbose)
+    print(f"Serving {bundle_path} on http://{host}:{server.server_address[1]}/predict (max_batch={max_batch}, max_wait_ms={max_wait_ms})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+def run_load(url, records, n_requests=2000, concurrency=32):
+    """
+    Load generator: concurrency client threads, each on its own keep-alive connection, POST single records
+    from records round robin until n_requests have been sent. Returns throughput and latency percentiles in ms.
+    """
+    target = urlparse(url)
+    bodies = [json.dumps(record).encode() for record in records]
+    counter = iter(range(n_requests))
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        latencies = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            conn.request('POST', target.path or '/predict', body=bodies[i % len(bodies)], headers={'Content-Type' : 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200, f"request {i} failed with status {response.status}"
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.concatenate([np.asarray(result, dtype=float) for result in pool.map(lambda _: client(), range(concurrency))])
+    seconds = time.perf_counter() - start
+    return {
+        'requests' : len(latencies),
+        'seconds' : seconds,
+        'throughput' : len(latencies) / seconds,
+        'p50_ms' : float(np.percentile(latencies, 50) * 1000),
+        'p99_ms' : float(np.percentile(latencies, 99) * 1000)
+    }
+
+def sweep_batch_windows(bundle, records, windows=(0, 1, 5, 20), n_requests=2000, concurrency=32, max_batch=256):
+    """Runs run_load against an in-process server per max_wait_ms window, returns one result dict per window."""
+    results = []
+    for max_wait_ms in windows:
+        server = make_server(bundle, port=0, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/predict'
+            result = run_load(url, records, n_requests=n_requests, concurrency=concurrency)
+        finally:
+            server.shutdown()
+            server.server_close()
+            server.batcher.close()
+        sizes = server.batcher.batch_sizes
+        results.append(dict(result, max_wait_ms=max_wait_ms, mean_batch=float(np.mean(sizes)) if sizes else 0.0))
+    return results
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.stub_socrata import make_stub_socrata
+from benchmarks.synthetic import make_crashes, make_people, make_vehicles
+from src.data import sync
+from src.data.joins import JOIN_FEATURES, MAX_AGE, PEOPLE_FLAGS, VEHICLE_GROUPS, CollisionAggregates
+from src.data.fetchers import FetchError, fetch_pages
+from src.data.soql import ResponseCache, combine_where, plan_query, query_key
+
+FAST = {'rate_limit' : None, 'backoff' : 0.001, 'verbose' : False} # retries without real waits
+
+
+@pytest.fixture
+def stub():
+    """Starts stub Socrata servers for a test, stub(df, failures) returns (server, url)."""
+    servers = []
+
+    def start(df, failures=()):
+        server = make_stub_socrata(df, failures=failures)
+        servers.append(server)
+        return server, f'http://127.0.0.1:{server.server_port}/resource.json'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def fetched_ids(url, **kwargs):
+    return [int(row['collision_id']) for page in fetch_pages(url, **dict(FAST, **kwargs)) for row in page]
+
+
+def test_fetch_pages_complete_and_in_order_after_429_and_503(stub):
+    df = make_crashes(1050)
+    server, url = stub(df, failures=[(429, 0), 503, (503, 0), 500])
+    assert fetched_ids(url, page_size=100, max_workers=4) == df['collision_id'].tolist()
+    assert server.stats['failed'] == 4
+
+
+def test_fetch_pages_total_a_multiple_of_page_size(stub):
+    df = make_crashes(1000)
+    server, url = stub(df)
+    assert fetched_ids(url, page_size=100, max_workers=3) == df['collision_id'].tolist()
+
+
+def test_fetch_pages_gives_up_after_max_retries(stub):
+    server, url = stub(make_crashes(100), failures=[503] * 10)
+    with pytest.raises(FetchError, match='503'):
+        fetched_ids(url, page_size=50, max_workers=1, max_retries=2)
+    assert server.stats['failed'] == 3 # the first try and two retries
+
+
+def test_sync_dataset_moves_watermark_refetches_lookback_and_dedupes(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, 'get_store_dir', lambda name: str(tmp_path / name))
+    df = make_crashes(600).astype({'on_street_name' : object})
+    _, url = stub(df)
+    first = sync.sync_dataset('nyc-crashes', url=url, page_size=200, **FAST)
+    watermark = df['crash_date'].max()
+    assert pd.Timestamp(first['watermark']) == watermark
+
+    recent = df.index[df['crash_date'] == watermark][0] # inside the 7 day lookback window
+    old = df.index[df['crash_date'] < watermark - pd.Timedelta(days=30)][0] # outside of it
+    new = make_crashes(50, seed=1).astype({'on_street_name' : object})
+    new['collision_id'] += 10**6
+    new['crash_date'] = watermark + pd.to_timedelta(1 + new.index % 5, unit='D')
+    changed = df.copy()
+    changed.loc[[recent, old], 'on_street_name'] = ['EDITED RECENT', 'EDITED OLD']
+    served = pd.concat([changed, new, new.iloc[:10]], ignore_index=True) # a few new rows served twice
+    _, url = stub(served)
+    second = sync.sync_dataset('nyc-crashes', url=url, page_size=200, **FAST)
+
+    assert pd.Timestamp(second['watermark']) == new['crash_date'].max()
+    assert second['rows_fetched'] == int((served['crash_date'] >= watermark - pd.Timedelta(days=7)).sum())
+    store = sync.load_synced('nyc-crashes', columns=['collision_id', 'on_street_name']).set_index('collision_id')['on_street_name']
+    assert store.index.is_unique and len(store) == len(df) + len(new)
+    assert store[df.loc[recent, 'collision_id']] == 'EDITED RECENT'
+    assert store[df.loc[old, 'collision_id']] != 'EDITED OLD'
+
+
+def test_equivalent_queries_plan_to_the_same_params_and_key():
+    assert combine_where(["borough = 'BRONX'", '1=1', "borough  =  'BRONX' ", '']) == "borough = 'BRONX'"
+    assert combine_where("on_street_name = 'A  ST'") == "on_street_name = 'A  ST'" # literals keep their spaces
+    a = plan_query('nyc-crashes', select=['borough', 'count(*)  AS crashes'], where=["crash_date >= '2024-06-01'", 'borough IS NOT NULL'], group='borough')
+    b = plan_query('nyc-crashes', select=['borough', 'count( * ) AS crashes'], where=['borough  IS NOT NULL', "crash_date >= '2024-06-01'", '1 = 1'], group=['borough'])
+    assert a == b and query_key('u', a) == query_key('u', b)
+    assert a['$where'] == "(borough IS NOT NULL) AND (crash_date >= '2024-06-01')"
+    with pytest.raises(AssertionError, match='not in the nyc-crashes schema'):
+        plan_query('nyc-crashes', select=['borough', 'no_such_column'])
+
+
+def test_planned_query_is_answered_by_the_server(stub, tmp_path):
+    df = make_crashes(3000)
+    server, url = stub(df)
+    params = plan_query('nyc-crashes', select=['borough', 'count(*) AS crashes'], where=['borough IS NOT NULL', "crash_date >= '2024-06-01'"], group='borough')
+    rows = ResponseCache(cache_dir=str(tmp_path), ttl=0).get(url, params)
+    expected = df.loc[df['crash_date'] >= '2024-06-01', 'borough'].value_counts()
+    assert {row['borough'] : int(row['crashes']) for row in rows} == expected[expected > 0].to_dict()
+    assert server.stats['bytes'] < 500 # counts per borough, not the rows behind them
+
+
+def test_response_cache_hits_revalidates_and_refetches_new_versions(stub, tmp_path):
+    df = make_crashes(500).astype({'on_street_name' : object, 'borough' : object})
+    server, url = stub(df)
+    params = plan_query('nyc-crashes', select=['collision_id', 'on_street_name'], where="borough = 'BRONX'")
+    fresh, revalidating = ResponseCache(cache_dir=str(tmp_path), ttl=3600), ResponseCache(cache_dir=str(tmp_path), ttl=0)
+    first = fresh.get(url, params)
+    assert fresh.get(url, params) == first and fresh.stats == {'hit' : 1, 'revalidated' : 0, 'miss' : 1}
+    assert server.stats['requests'] == 1 # a fresh entry is served without asking
+
+    assert revalidating.get(url, params) == first and revalidating.stats['revalidated'] == 1
+    assert server.stats['not_modified'] == 1
+
+    df.loc[df['borough'] == 'BRONX', 'on_street_name'] = 'EDITED'
+    server.version += 1
+    rows = revalidating.get(url, params)
+    assert revalidating.stats['miss'] == 1 and {row['on_street_name'] for row in rows} == {'EDITED'}
+    assert fresh.get(url, params) == rows # the refetched body replaced the cached one
+
+
+def test_sync_dataset_moves_rows_whose_month_changed(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, 'get_store_dir', lambda name: str(tmp_path / name))
+    df = make_crashes(600)
+    _, url = stub(df)
+    sync.sync_dataset('nyc-crashes', url=url, page_size=200, **FAST)
+    watermark = df['crash_date'].max()
+
+    recent = df.index[df['crash_date'] == watermark][0]
+    old = df.index[df['crash_date'] < watermark - pd.Timedelta(days=400)][0] # an old crash re-dated into the lookback window
+    changed = df.copy()
+    changed.loc[recent, 'crash_date'] = watermark + pd.Timedelta(days=40)
+    changed.loc[old, 'crash_date'] = watermark
+    _, url = stub(changed)
+    sync.sync_dataset('nyc-crashes', url=url, page_size=200, **FAST)
+
+    store = sync.load_synced('nyc-crashes', columns=['collision_id', 'crash_date', 'year', 'month'])
+    assert store['collision_id'].is_unique and len(store) == len(df)
+    store = store.set_index('collision_id')
+    for row in (recent, old):
+        moved = store.loc[df.loc[row, 'collision_id']]
+        assert moved['crash_date'] == changed.loc[row, 'crash_date']
+        assert (int(moved['year']), int(moved['month'])) == (moved['crash_date'].year, moved['crash_date'].month)
+
+
+def test_collision_aggregates_match_pandas_merge():
+    crashes = make_crashes(3000)
+    with_rows = crashes.iloc[::2] # every other crash has no people or vehicle rows
+    people, vehicles = make_people(with_rows), make_vehicles(with_rows)
+    people['collision_id'] = people['collision_id'].astype('Int64')
+    people.loc[people.index[:5], 'collision_id'] = pd.NA # skipped, like rows without a collision id
+    people.loc[people.index[5:10], 'collision_id'] = 1 # collisions that aren't among the crashes
+
+    chunks = lambda df: (df.iloc[start:start + 1000] for start in range(0, len(df), 1000))
+    joined = CollisionAggregates(crashes['collision_id']).add_people(chunks(people)).add_vehicles(chunks(vehicles)).attach(crashes)
+
+    lower = lambda values: values.astype(str).str.lower()
+    people = people.assign(**{name : lower(people[col]).isin(labels) for name, (col, labels) in PEOPLE_FLAGS.items()})
+    people['person_age'] = people['person_age'].where(people['person_age'].between(0, MAX_AGE))
+    people_agg = people.groupby('collision_id').agg(people_count=('unique_id', 'size'), **{name : (name, 'sum') for name in PEOPLE_FLAGS},
+                                                    people_age_mean=('person_age', 'mean'), people_age_min=('person_age', 'min'), people_age_max=('person_age', 'max'))
+    vehicles = vehicles.assign(**{name : lower(vehicles['vehicle_type']).isin(labels) for name, labels in VEHICLE_GROUPS.items()})
+    vehicle_agg = vehicles.groupby('collision_id').agg(vehicles_count=('unique_id', 'size'), **{name : (name, 'sum') for name in VEHICLE_GROUPS})
+    expected = crashes[['collision_id']].merge(people_agg.reset_index().astype({'collision_id' : 'int64'}), on='collision_id', how='left') \
+                                        .merge(vehicle_agg.reset_index(), on='collision_id', how='left')
+
+    for col in JOIN_FEATURES:
+        want = expected[col].to_numpy(dtype=np.float64)
+        if not col.startswith('people_age'):
+            want = np.nan_to_num(want) # crashes without rows count zero
+        np.testing.assert_allclose(joined[col].to_numpy(dtype=np.float64), want, rtol=1e-6, err_msg=col) # ages are float32
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_features import legacy_build_features
+from benchmarks.synthetic import make_crashes
+from src.features.build_features import CrashFeatureBuilder, SparseFrame
+from src.features.feature_selector import select_features
+from src.features.feature_store import FeatureTable, write_feature_table
+
+
+@pytest.fixture(scope='module')
+def crashes():
+    return make_crashes(5000)[CrashFeatureBuilder.REQUIRED_COLUMNS]
+
+
+def assert_same(X, expected):
+    assert list(X.columns) == list(expected.columns)
+    np.testing.assert_array_equal(X.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize('as_strings', [True, False])
+def test_fit_transform_matches_legacy_build_features(crashes, as_strings):
+    data = crashes.astype(object) if as_strings else crashes # untyped csv strings and load_crash_data's categoricals
+    assert_same(CrashFeatureBuilder().fit_transform(data), legacy_build_features(crashes.astype(object)))
+
+
+def test_chunked_fit_and_saved_state_match_fit(crashes):
+    builder = CrashFeatureBuilder().fit(crashes)
+    chunked = CrashFeatureBuilder()
+    counts = None
+    for start in range(0, len(crashes), 1500):
+        counts = chunked.merge_counts(counts, chunked.count(crashes.iloc[start:start + 1500]))
+    chunked.fit_counts(counts)
+    restored = CrashFeatureBuilder.from_state(builder.get_state())
+    for other in (chunked, restored):
+        assert_same(other.transform(crashes), builder.transform(crashes))
+
+
+@pytest.mark.parametrize('make_builder', [CrashFeatureBuilder, CrashFeatureBuilder.wide])
+def test_sparse_transform_matches_dense(make_builder):
+    data = make_crashes(5000) # the wide builder reads more columns than the default one
+    dense, sparse = make_builder(sparse=False).fit(data), make_builder(sparse=True).fit(data)
+    X, expected = sparse.transform(data), dense.transform(data)
+    assert isinstance(X, SparseFrame)
+    assert_same(X, expected)
+    columns = list(X.columns[::3])
+    assert_same(X[columns], expected[columns])
+
+
+def test_unseen_values_take_the_catch_all_category(crashes):
+    builder = CrashFeatureBuilder().fit(crashes)
+    new = crashes.head(2).astype(object)
+    new['borough'] = ['ATLANTIS', None]
+    new['vehicle_type_code1'] = ['Hovercraft', None]
+    rare = next(value for value in crashes['vehicle_type_code1'].dropna().unique() if value not in builder.vocab_['vehicle_type_code1'])
+    X, X_rare = builder.transform(new), builder.transform(new.assign(vehicle_type_code1=rare)) # rare types were 'Other' in fit
+    assert X['borough_Unspecified'].tolist() == [1.0, 1.0]
+    assert_same(X.filter(like='vehicle_type_code1_'), X_rare.filter(like='vehicle_type_code1_'))
+
+
+def test_unseen_values_without_a_catch_all_warn_or_raise():
+    data = pd.DataFrame({'crash_time' : ['1:00', '2:00'], 'borough' : ['BRONX', 'QUEENS'],
+                         'vehicle_type_code1' : ['Sedan', 'Taxi'], 'contributing_factor_vehicle_1' : ['A', 'B']})
+    unseen = data.assign(borough=['MARS', 'BRONX'])
+    with pytest.warns(UserWarning, match="'borough': 1"):
+        CrashFeatureBuilder().fit(data).transform(unseen)
+    with pytest.raises(ValueError, match="'borough': 1"):
+        CrashFeatureBuilder(handle_unknown='error').fit(data).transform(unseen)
+
+
+def test_feature_store_round_trip_matches_in_memory_features(crashes, tmp_path):
+    builder = CrashFeatureBuilder().fit(crashes)
+    X = builder.transform(crashes)
+    table = FeatureTable.open(write_feature_table(str(tmp_path / 'features.arrow'), X, builder_state=builder.get_state()))
+    assert_same(table.to_frame(), X)
+    assert_same(table, X)
+    assert select_features(table, 'nyc-crashes', 'all') is table
+    assert_same(select_features(table, 'nyc-crashes', 'preset-1'), select_features(X, 'nyc-crashes', 'preset-1'))
+    assert_same(CrashFeatureBuilder.from_state(table.metadata['builder_state']).transform(crashes), X)
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_refresh import LR_PARAMS, XGB_PARAMS, fit, later_day
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.evaluation.evaluate import binary_metrics, fold_metrics
+from src.features.build_features import CrashFeatureBuilder, design_matrix
+from src.models import linear_model
+from src.models.artifact import LogisticArtifact, XGBoostArtifact, load_artifact, save_artifact
+from src.models.refresh import refresh_artifact
+from src.models.results import CVResultStore, invalidate
+
+PARAMS = [{'C' : C, 'max_iter' : 200} for C in (0.1, 1.0)]
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 5))
+    y = (X[:, 0] + rng.normal(size=600) > 0).astype(int)
+    return X, y
+
+
+def counting_fit_fold(fits):
+    def fit_fold(params, fold, n_threads=None):
+        fits.append(params['C'])
+        return linear_model.fit_fold(params, fold)
+    return fit_fold
+
+
+def grid(X, y, store, param_list, fits):
+    engine = linear_model.make_engine(X, y, k=5).use_results(store, rows=1.0)
+    return engine, [engine.cross_validate(counting_fit_fold(fits), linear_model.evaluate_fold, params, return_final_model=True) for params in param_list]
+
+
+def test_memoized_cells_are_read_instead_of_trained(data, tmp_path):
+    X, y = data
+    context = {'dataset' : 'test', 'raw' : {'test' : 'v1'}, 'model' : 'logistic'}
+    fits = []
+    _, cold = grid(X, y, CVResultStore(context, results_dir=tmp_path), PARAMS, fits)
+    assert len(fits) == 10
+
+    store = CVResultStore(context, results_dir=tmp_path) # reopened from disk
+    fits.clear()
+    engine, warm = grid(X, y, store, PARAMS, fits)
+    assert fits == [] and store.hits == 10
+    for (metrics, _, _), (cached, _, model) in zip(cold, warm):
+        assert cached == pytest.approx(metrics) and model is None
+    assert all(store.memoized(params, 5, fit_kwargs={}, rows=1.0) for params in PARAMS)
+    assert engine.fit_final(linear_model.fit_fold, PARAMS[0]) is not None
+
+    fits.clear()
+    grid(X, y, store, PARAMS + [{'C' : 10.0, 'max_iter' : 200}], fits) # extending the grid trains only the new point
+    assert fits == [10.0] * 5
+
+
+def test_invalidate_drops_only_contexts_of_changed_raw_data(tmp_path):
+    contexts = {
+        'old data' : {'dataset' : 'crashes', 'raw' : {'crashes' : 'v1'}, 'features' : 'dense', 'model' : 'logistic'},
+        'other builder' : {'dataset' : 'crashes', 'raw' : {'crashes' : 'v2'}, 'features' : 'sparse', 'model' : 'xgboost'},
+        'current' : {'dataset' : 'crashes', 'raw' : {'crashes' : 'v2'}, 'features' : 'dense', 'model' : 'logistic'},
+        'other dataset' : {'dataset' : 'people', 'raw' : {'people' : 'v1'}, 'features' : 'dense', 'model' : 'logistic'},
+    }
+    stores = {name : CVResultStore(context, results_dir=tmp_path) for name, context in contexts.items()}
+    for store in stores.values():
+        store.put(PARAMS[0], 0, {'roc_auc' : 0.7, 'conf_matrix' : np.eye(2)})
+
+    assert invalidate('crashes', raw={'crashes' : 'v2'}, results_dir=tmp_path) == 1
+    kept = {name for name, store in stores.items() if CVResultStore(store.context, results_dir=tmp_path).cells}
+    assert kept == {'other builder', 'current', 'other dataset'}
+
+
+@pytest.mark.parametrize('kind', ['xgboost', 'logistic'])
+def test_refresh_keeps_same_distribution_updates_and_flags_drift(kind, tmp_path):
+    history = make_crashes(20000)
+    data = consolidate_response(history)
+    builder = CrashFeatureBuilder().fit(data)
+    X_all = builder.transform(data)
+    X, y = design_matrix(X_all), data['Y'].to_numpy()
+    model, _ = fit(kind, X[:16000], y[:16000])
+    scores = XGBoostArtifact(model) if kind == 'xgboost' else LogisticArtifact(model.coef_[0], model.intercept_[0])
+    metrics = {'roc_auc' : fold_metrics(y[16000:], scores.predict_proba(X[16000:])[:, 1])['roc_auc']} # the reference AUC
+    directory = save_artifact(str(tmp_path / kind), builder, list(X_all.columns), model, params=XGB_PARAMS if kind == 'xgboost' else LR_PARAMS, metrics=metrics)
+
+    day = later_day(history, 5000, seed=1)
+    runs = [refresh_artifact(directory, day, dry_run=True) for _ in range(2)]
+    assert runs[0]['after_auc'] == runs[1]['after_auc'] # the same rows always update to the same model
+    report = refresh_artifact(directory, day)
+    assert report['kept'] and not report['needs_retrain']
+    bundle = load_artifact(directory)
+    assert bundle['manifest']['refresh']['refreshes'] == 1
+    if kind == 'xgboost':
+        assert bundle['model'].booster.num_boosted_rounds() == 100 + 10 # boosting continued from the stored trees
+
+    drifted = refresh_artifact(directory, later_day(history, 5000, seed=2, shuffle_labels=True))
+    assert drifted['needs_retrain'] and not drifted['kept']
+    assert load_artifact(directory)['manifest']['refresh']['refreshes'] == 1
+
+
+def test_metrics_match_sklearn():
+    from sklearn import metrics
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 2000)
+    for scores in (rng.random(2000) * 0.5 + 0.3 * y, np.round(rng.random(2000), 1)): # distinct and heavily tied scores
+        ours = binary_metrics(y, scores, thresholds=[0.5])
+        assert ours['roc_auc'] == pytest.approx(metrics.roc_auc_score(y, scores))
+        assert ours['pr_auc'] == pytest.approx(metrics.average_precision_score(y, scores))
+        predicted = (scores >= 0.5).astype(int)
+        assert ours['f1'][0] == pytest.approx(metrics.f1_score(y, predicted, zero_division=0))
+        np.testing.assert_array_equal(fold_metrics(y, scores)['conf_matrix'], metrics.confusion_matrix(y, predicted))
@@ -0,0 +1,65 @@
+import http.client
+import json
+import threading
+
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from benchmarks.synthetic import make_crashes
+from src.data.cleaners import consolidate_response
+from src.features.build_features import CrashFeatureBuilder
+from src.pipeline.serving import MicroBatcher, make_server
+
+
+@pytest.fixture(scope='module')
+def server():
+    data = consolidate_response(make_crashes(2000))
+    builder = CrashFeatureBuilder().fit(data)
+    X = builder.transform(data)
+    bundle = {'feature_builder' : builder, 'columns' : list(X.columns), 'model' : LogisticRegression(max_iter=300).fit(X.to_numpy(), data['Y'])}
+    server = make_server(bundle, port=0, max_wait_ms=50.0) # a wide window so concurrent requests share batches
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.records = data[CrashFeatureBuilder.REQUIRED_COLUMNS].head(8).astype(object).where(data.notna(), None).to_dict('records')
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+def post(server, body):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+    conn.request('POST', '/predict', body=json.dumps(body), headers={'Content-Type' : 'application/json'})
+    response = conn.getresponse()
+    result = response.status, json.loads(response.read())
+    conn.close()
+    return result
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'record', {'borough' : {'name' : 'BRONX'}}, {'crash_time' : 1.5}])
+def test_malformed_records_fail_alone(server, body):
+    results = {}
+    def send(name, payload):
+        results[name] = post(server, payload)
+    threads = [threading.Thread(target=send, args=(i, record)) for i, record in enumerate(server.records)]
+    threads.append(threading.Thread(target=send, args=('bad', body)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.pop('bad')[0] == 400
+    assert all(status == 200 and 0 <= body['score'] <= 1 for status, body in results.values())
+
+
+def test_failed_batch_is_rescored_per_record():
+    def score(records):
+        if any(record == 'bad' for record in records):
+            raise ValueError('bad record')
+        return [len(record) for record in records]
+
+    batcher = MicroBatcher(score, max_wait_ms=200.0)
+    futures = [batcher.submit(record) for record in ['a', 'bad', 'ccc']]
+    assert futures[0].result(timeout=5) == 1.0 and futures[2].result(timeout=5) == 3.0
+    with pytest.raises(ValueError, match='bad record'):
+        futures[1].result(timeout=5)
+    assert batcher.submit('dd').result(timeout=5) == 2.0 # the batcher thread survived
+    batcher.close()